@@ -45,8 +45,49 @@ def read_bacardi_raw(filename: str, path: str) -> xr.Dataset:
     return ds
 
 
+def attitude_correction_factor(roll, pitch, yaw, sza, saa, r_off: float = 0, p_off: float = 0):
+    """Geometric attitude correction factor for the direct fraction of the downward irradiance.
+    See :py:func:`fdw_attitude_correction` for the definition of the angles.
+    Works with scalars, NumPy, dask and xarray input.
+
+    Args:
+        roll: roll angle [deg]
+        pitch: pitch angle [deg]
+        yaw: yaw angle [deg]
+        sza: solar zenith angle [deg]
+        saa: solar azimuth angle [deg]
+        r_off: roll offset angle between INS and sensor [deg]
+        p_off: pitch offset angle between INS and sensor [deg]
+
+    Returns: correction factor with the shape of the attitude angles
+
+    """
+    r = np.deg2rad(roll + r_off)
+    p = np.deg2rad(pitch + p_off)
+    h0 = np.deg2rad(90 - sza)
+    rel_azimuth = np.deg2rad(saa - yaw)
+    sin_h0, cos_h0, cos_r = np.sin(h0), np.cos(h0), np.cos(r)
+
+    factor = sin_h0 / (
+        cos_h0 * np.sin(r) * np.sin(rel_azimuth)
+        + cos_h0 * np.sin(p) * cos_r * np.cos(rel_azimuth)
+        + sin_h0 * np.cos(p) * cos_r
+    )
+
+    return factor
+
+
+def _expand_to(values, target, axis: int):
+    """Reshape a 1D array along the given axis of target so that it broadcasts over all other axes of target"""
+    if np.ndim(values) != 1 or np.ndim(target) <= 1:
+        return values
+    shape = [1] * np.ndim(target)
+    shape[axis] = -1
+    return values.reshape(shape)
+
+
 def fdw_attitude_correction(
-    fdw, roll, pitch, yaw, sza, saa, fdir, r_off: float = 0, p_off: float = 0
+    fdw, roll, pitch, yaw, sza, saa, fdir, r_off: float = 0, p_off: float = 0, **kwargs
 ):
     """Attitude Correction for downward irradiance.
     Corrects downward irradiance for misalignment of the sensor (deviation from horizontal alignment).
@@ -55,6 +96,12 @@ def fdw_attitude_correction(
     - please check correct definition of the attitude angle
     - for differences between the sensor attitude and the attitude given by an INS the offset angles (p_off and r_off) can be defined.
 
+    The correction factor is calculated once per time step and broadcast over all other dimensions of fdw
+    (e.g. wavelength, band or sensor).
+    For xarray input this happens by dimension name, so any dimension order works.
+    For NumPy or dask arrays the time axis of fdw (and of a multidimensional fdir) is given by ``time_axis``.
+    Dask backed input stays lazy.
+
     Args:
         fdw: downward irradiance [W m-2] or [W m-2 nm-1]
         roll: roll angle [deg] - defined positive for left wing up
@@ -65,23 +112,27 @@ def fdw_attitude_correction(
         r_off: roll offset angle between INS and sensor [deg] - defined positive for left wing up
         p_off: pitch offset angle between INS and sensor [deg] - defined positive for nose down
         fdir: fraction of direct radiation [0..1] (0=pure diffuse, 1=pure direct)
+        **kwargs:
+            time_axis (int): axis of fdw along the attitude angles for NumPy or dask input (default: 0)
+            time_dim (str): dimension name for 1D NumPy attitude angles combined with a DataArray fdw (default: time)
 
     Returns: corrected downward irradiance [W m-2] or [W m-2 nm-1] and correction factor
 
     """
-    r = np.deg2rad(roll + r_off)
-    p = np.deg2rad(pitch + p_off)
-    h0 = np.deg2rad(90 - sza)
-
-    factor = np.sin(h0) / (
-        np.cos(h0) * np.sin(r) * np.sin(np.deg2rad(saa - yaw))
-        + np.cos(h0) * np.sin(p) * np.cos(r) * np.cos(np.deg2rad(saa - yaw))
-        + np.sin(h0) * np.cos(p) * np.cos(r)
-    )
-    try:
-        fdw_cor = fdir * fdw * factor + (1 - fdir) * fdw
-    except ValueError:
-        # fdw and fdir are 2 dimensional, add an empty axis to the factor two make it 2D as well
-        fdw_cor = fdir * fdw * factor[:, None] + (1 - fdir) * fdw
+    time_axis = kwargs["time_axis"] if "time_axis" in kwargs else 0
+    time_dim = kwargs["time_dim"] if "time_dim" in kwargs else "time"
+
+    factor = attitude_correction_factor(roll, pitch, yaw, sza, saa, r_off, p_off)
+    if isinstance(fdw, xr.DataArray):
+        # xarray broadcasts by dimension name, name 1D arrays along time
+        factor_b, fdir_b = [
+            xr.DataArray(v, dims=time_dim) if not isinstance(v, xr.DataArray) and np.ndim(v) == 1 else v
+            for v in (factor, fdir)
+        ]
+    else:
+        factor_b = _expand_to(np.asarray(factor) if isinstance(factor, xr.DataArray) else factor, fdw, time_axis)
+        fdir_b = _expand_to(np.asarray(fdir) if isinstance(fdir, xr.DataArray) else fdir, fdw, time_axis)
+
+    fdw_cor = fdw * (fdir_b * factor_b + (1 - fdir_b))
 
     return fdw_cor, factor
@@ -5,6 +5,9 @@
 """
 
 import logging
+import math
+import os
+import threading
 import warnings
 
 import importlib_resources as pkg_resources
@@ -12,9 +15,7 @@ import numpy as np
 import xarray as xr
 import pandas as pd
 import re
-from tqdm import tqdm
 
-import pylim.helpers as h
 import pylim.meteorological_formulas as met
 
 log = logging.getLogger(__name__)
@@ -92,6 +93,28 @@ three_d_on = ["v5", "v6", "v22", "v23", "v24", "v25", "v26", "v27", "v44"]
 # which versions have aerosol optics turned on
 aerosol_on = [f"v{x}" for x in [30, 31, 32, 33, 34, 35, 44]]
 
+# coefficient files in pylim.data for each ice optic parameterization
+ice_optics_files = dict(
+    fu="fu_ice_scattering_rrtm_new.nc",
+    yi="yi_ice_scattering_rrtm_new.nc",
+    baran2016="baran2016_ice_scattering_rrtm.nc",
+    baran2017="baran2017_ice_scattering_rrtm.nc",
+)
+
+# process wide cache for the ice optics coefficients, see get_ice_optics_coefficients()
+_ice_optics_coefficients = dict()
+_ice_optics_lock = threading.Lock()
+
+
+def _reset_ice_optics_lock():
+    """Create a new lock in a forked child process in case the parent forked while holding it"""
+    global _ice_optics_lock
+    _ice_optics_lock = threading.Lock()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_ice_optics_lock)
+
 
 def get_version_name(version: str) -> str:
     """Return version name to given version string.
@@ -186,6 +209,20 @@ def make_ecrad_version_overview_csv(version_list: list = None,
     return None
 
 
+# NumPy evaluates ** on float arrays with SIMD routines which can differ by one ulp from the C library pow used for
+# scalars, the effective radius functions use the C library pow to stay bit-identical to the scalar versions
+_libm_pow = np.frompyfunc(math.pow, 2, 1)
+
+
+def _scalar_pow(base, exponent: float) -> np.ndarray:
+    """Elementwise base ** exponent with the C library pow, NaN for negative or NaN bases"""
+    base = np.asarray(base, dtype=float)
+    out = np.full(base.shape, np.nan)
+    valid = base >= 0
+    out[valid] = _libm_pow(base[valid], exponent).astype(float)
+    return out
+
+
 def ice_effective_radius(PPRESSURE, PTEMPERATURE, PCLOUD_FRAC, PQ_ICE, PQ_SNOW, PLAT):
     """
     From ice_effective_radius.F90 from the ecRad source code (https://github.com/ecmwf-ifs/ecrad).
@@ -211,6 +248,10 @@ def ice_effective_radius(PPRESSURE, PTEMPERATURE, PCLOUD_FRAC, PQ_ICE, PQ_SNOW,
 
     Ice effective radius = f(T,IWC) from Sun and Rikus (1999), revised by Sun (2001)
 
+    All inputs can be scalars or broadcastable arrays.
+    The cloudy and clear branches of the original code are evaluated as masks over the whole array, so no loop over
+    grid points is needed.
+
     Args:
         PPRESSURE: (Pa)
         PTEMPERATURE: (K)
@@ -233,22 +274,31 @@ def ice_effective_radius(PPRESSURE, PTEMPERATURE, PCLOUD_FRAC, PQ_ICE, PQ_SNOW,
         (PLAT * np.pi / 180)
     )  # Ice effective radius varies with latitude, smaller at poles
 
-    if (PCLOUD_FRAC > 0.001) and (PQ_ICE + PQ_SNOW > 0):  # Consider only cloudy regions
+    PPRESSURE, PTEMPERATURE, PCLOUD_FRAC, PQ_ICE, PQ_SNOW = (
+        np.asarray(x) for x in (PPRESSURE, PTEMPERATURE, PCLOUD_FRAC, PQ_ICE, PQ_SNOW)
+    )
+    PQ_ICE_SNOW = PQ_ICE + PQ_SNOW
+    cloudy = (PCLOUD_FRAC > 0.001) & (PQ_ICE_SNOW > 0)  # Consider only cloudy regions
+
+    # evaluate the cloudy branch everywhere and select it with the mask afterward,
+    # clear sky points can produce invalid values (e.g. division by zero cloud fraction) which are discarded
+    with np.errstate(divide="ignore", invalid="ignore", over="ignore"):
         ZAIR_DENSITY_GM3 = 1000 * PPRESSURE / (RD * PTEMPERATURE)
-        ZIWC_INCLOUD_GM3 = ZAIR_DENSITY_GM3 * (PQ_ICE + PQ_SNOW) / PCLOUD_FRAC
+        ZIWC_INCLOUD_GM3 = ZAIR_DENSITY_GM3 * PQ_ICE_SNOW / PCLOUD_FRAC
         PTEMPERATURE_C = PTEMPERATURE - RTT
         #  Sun, 2001(corrected from Sun & Rikus, 1999)
-        ZAIWC = 45.8966 * ZIWC_INCLOUD_GM3 ** (0.2214)
-        ZBIWC = 0.7957 * ZIWC_INCLOUD_GM3 ** (0.2535)
+        ZAIWC = 45.8966 * _scalar_pow(ZIWC_INCLOUD_GM3, 0.2214)
+        ZBIWC = 0.7957 * _scalar_pow(ZIWC_INCLOUD_GM3, 0.2535)
         ZDIAMETER_UM = (1.2351 + 0.0105 * PTEMPERATURE_C) * (
             ZAIWC + ZBIWC * (PTEMPERATURE - 83.15)
         )
-        ZDIAMETER_UM = np.min([np.max([ZDIAMETER_UM, ZMIN_DIAMETER_UM]), 155])
+        ZDIAMETER_UM = np.minimum(np.maximum(ZDIAMETER_UM, ZMIN_DIAMETER_UM), 155)
         PRE_UM = ZDIAMETER_UM * RRE2DE
-    else:
-        PRE_UM = ZDEFAULT_RE_UM
 
-    return PRE_UM * 1e-6
+    # apply the unit conversion to each branch separately to keep the results identical to the scalar version
+    re_ice = np.where(cloudy, PRE_UM * 1e-6, ZDEFAULT_RE_UM * 1e-6)
+
+    return re_ice[()]  # returns a scalar for scalar input
 
 
 def liquid_effective_radius(PPRESSURE, PTEMPERATURE, PCLOUD_FRAC, PQ_LIQ, PQ_RAIN):
@@ -282,6 +332,8 @@ def liquid_effective_radius(PPRESSURE, PTEMPERATURE, PCLOUD_FRAC, PQ_LIQ, PQ_RAI
         PQ_LIQ: (kg/kg)
         PQ_RAIN: (kg/kg)
 
+    All inputs can be scalars or broadcastable arrays.
+
     Returns: liquid effective radius in meter after Martin et al. (JAS 1994)
 
     """
@@ -301,36 +353,94 @@ def liquid_effective_radius(PPRESSURE, PTEMPERATURE, PCLOUD_FRAC, PQ_LIQ, PQ_RAI
     )  # JR: this is the ocean case
     ZRATIO = (0.222 / ZSPECTRAL_DISPERSION) ** (0.333)
 
-    if (PCLOUD_FRAC > 0.001) and (PQ_LIQ + PQ_RAIN > 0):  # Consider only cloudy regions
+    PPRESSURE, PTEMPERATURE, PCLOUD_FRAC, PQ_LIQ, PQ_RAIN = (
+        np.asarray(x) for x in (PPRESSURE, PTEMPERATURE, PCLOUD_FRAC, PQ_LIQ, PQ_RAIN)
+    )
+    cloudy = (PCLOUD_FRAC > 0.001) & (PQ_LIQ + PQ_RAIN > 0)  # Consider only cloudy regions
+
+    # evaluate all branches everywhere and select the valid ones with masks afterward,
+    # invalid values from clear sky points (e.g. division by zero cloud fraction) are discarded
+    with np.errstate(divide="ignore", invalid="ignore", over="ignore"):
         ZAIR_DENSITY_GM3 = 1000 * PPRESSURE / (R_DRY * PTEMPERATURE)
         # In - cloud mean water contents found by dividing by cloud fraction
         ZLWC_GM3 = ZAIR_DENSITY_GM3 * PQ_LIQ / PCLOUD_FRAC
         ZRWC_GM3 = ZAIR_DENSITY_GM3 * PQ_RAIN / PCLOUD_FRAC
-        if ZLWC_GM3 > REPSCW:
-            ZRAIN_RATIO = ZRWC_GM3 / ZLWC_GM3
-            ZWOOD_FACTOR = ((1 + ZRAIN_RATIO) ** 0.666) / (
-                1 + 0.2 * ZRATIO * ZRAIN_RATIO
-            )
-        else:
-            ZWOOD_FACTOR = 1
+        ZRAIN_RATIO = ZRWC_GM3 / ZLWC_GM3
+        ZWOOD_FACTOR = np.where(
+            ZLWC_GM3 > REPSCW,
+            _scalar_pow(1 + ZRAIN_RATIO, 0.666) / (1 + 0.2 * ZRATIO * ZRAIN_RATIO),
+            1,
+        )
 
         ZRE_CUBED = (3 * (ZLWC_GM3 + ZRWC_GM3)) / (
             4 * np.pi * ZNTOT_CM3 * ZSPECTRAL_DISPERSION
         )
-        if ZRE_CUBED > REPLOG:
-            PRE_UM = ZWOOD_FACTOR * 100 * np.exp(0.333 * np.log(ZRE_CUBED))
-            # make sure calculated radius is within boarders
-            if PRE_UM < PP_MIN_RE_UM:
-                PRE_UM = PP_MIN_RE_UM
-            if PRE_UM > PP_MAX_RE_UM:
-                PRE_UM = PP_MAX_RE_UM
-        else:
-            PRE_UM = PP_MIN_RE_UM
-    else:
-        # when cloud fraction or liquid + rain water content too low to consider this as a cloud
-        PRE_UM = PP_MIN_RE_UM
+        PRE_UM = ZWOOD_FACTOR * 100 * np.exp(0.333 * np.log(ZRE_CUBED))
+        # make sure calculated radius is within boarders
+        PRE_UM = np.minimum(np.maximum(PRE_UM, PP_MIN_RE_UM), PP_MAX_RE_UM)
+
+    # when cloud fraction or liquid + rain water content too low to consider this as a cloud use the minimum radius
+    re_liquid = np.where(cloudy & (ZRE_CUBED > REPLOG), PRE_UM * 1e-6, PP_MIN_RE_UM * 1e-6)
+
+    return re_liquid[()]  # returns a scalar for scalar input
+
+
+def get_ice_optics_coefficients(parameterization: str) -> xr.Dataset:
+    """
+    Return the coefficients of an ice optic parameterization from the process wide cache.
+
+    The netCDF file from ``pylim.data`` is only read on the first call for each parameterization.
+    Each variable is stored as a contiguous read-only numpy array, which can be shared safely between threads and
+    forked worker processes.
+
+    Args:
+        parameterization: one of the keys of ``ice_optics_files`` ('fu', 'yi', 'baran2016' or 'baran2017')
+
+    Returns: In memory data set with the coefficients of the parameterization. It is a shallow copy of the cached
+        data set, so adding or replacing variables does not change the cache, and the shared arrays are read-only.
+
+    """
+    if parameterization not in ice_optics_files:
+        raise ValueError(f"'parameterization' has to be one of {list(ice_optics_files)} but is '{parameterization}'")
+
+    with _ice_optics_lock:
+        if parameterization not in _ice_optics_coefficients:
+            filename = pkg_resources.files("pylim.data").joinpath(ice_optics_files[parameterization])
+            with xr.open_dataset(filename) as ds:
+                coefficients = xr.Dataset(attrs=ds.attrs)
+                for var in ds.variables:
+                    values = np.ascontiguousarray(ds[var].to_numpy())
+                    values.flags.writeable = False  # the arrays are shared, make sure they are not changed
+                    if var in ds.coords:
+                        coefficients.coords[var] = (ds[var].dims, values)
+                    else:
+                        coefficients[var] = (ds[var].dims, values)
+            _ice_optics_coefficients[parameterization] = coefficients
+            log.debug(f"Loaded ice optics coefficients for {parameterization}")
+
+    return _ice_optics_coefficients[parameterization].copy(deep=False)
+
+
+def preload_ice_optics_coefficients(parameterizations: list = None) -> None:
+    """
+    Load the coefficients of the given ice optic parameterizations into the cache.
+    Call this before starting worker processes or threads to share the cached coefficients with them.
+
+    Args:
+        parameterizations: list of parameterizations to load (default: all keys of ``ice_optics_files``)
+
+    Returns: None
+
+    """
+    parameterizations = list(ice_optics_files) if parameterizations is None else parameterizations
+    for parameterization in parameterizations:
+        get_ice_optics_coefficients(parameterization)
+
 
-    return PRE_UM * 1e-6
+def clear_ice_optics_coefficients() -> None:
+    """Remove all ice optics coefficients from the cache. They are read from file again on the next request."""
+    with _ice_optics_lock:
+        _ice_optics_coefficients.clear()
 
 
 def calc_ice_optics_baran2016(bands: str, ice_wp, qi, temperature):
@@ -368,11 +478,7 @@ def calc_ice_optics_baran2016(bands: str, ice_wp, qi, temperature):
 
     """
     max_qi = 1.0e-3  # maximum mixing ratio (kg kg-1)
-    # read in coefficients from netcdf file
-    filename = pkg_resources.files("pylim.data").joinpath(
-        "baran2016_ice_scattering_rrtm.nc"
-    )
-    ds = xr.open_dataset(filename)
+    ds = get_ice_optics_coefficients("baran2016")  # read in coefficients from cache
     nb = len(ds[f"band_{bands}"])  # number of bands
     coeff = ds[f"coeff_{bands}"]  # Band-specific coefficients
     T2 = temperature * temperature
@@ -423,11 +529,7 @@ def calc_ice_optics_baran2017(bands: str, ice_wp, qi, temperature):
         g: Asymmetry factor
 
     """
-    # read in coefficients from netcdf file
-    filename = pkg_resources.files("pylim.data").joinpath(
-        "baran2017_ice_scattering_rrtm.nc"
-    )
-    ds = xr.open_dataset(filename)
+    ds = get_ice_optics_coefficients("baran2017")  # read in coefficients from cache
     nb = len(ds[f"band_{bands}"])  # number of bands
     coeff_gen = ds["coeff_gen"].values  # General coefficients
     coeff = ds[f"coeff_{bands}"]  # Band-specific coefficients
@@ -446,7 +548,98 @@ def calc_ice_optics_baran2017(bands: str, ice_wp, qi, temperature):
     return od, scat_od, g
 
 
-def calc_ice_optics_fu_sw(ice_wp, r_eff):
+def _fu_effective_diameter(r_eff):
+    """
+    Cap the effective radius at 100 um and convert it to Fu's effective diameter using the relationship in the IFS.
+
+    Args:
+        r_eff: Effective radius (m)
+
+    Returns: effective diameter (um) and its inverse
+
+    """
+    MaxEffectiveRadius = 100.0e-6  # metres
+    r_eff = np.minimum(r_eff, MaxEffectiveRadius)  # cap effective radius and keep nan values
+    de_um = r_eff * (1.0e6 / 0.64952)  # Fu's effective diameter (microns)
+    inv_de_um = 1.0 / de_um  # and its inverse
+
+    return de_um, inv_de_um
+
+
+def _ice_optics_fu(bands: str, iwp_gm_2, r_eff, dtype=None):
+    """
+    Compute shortwave or longwave ice-particle scattering properties using the Fu parameterization for all bands at
+    once. See :py:func:`calc_ice_optics_fu_sw` and :py:func:`calc_ice_optics_fu_lw`.
+
+    Args:
+        bands: 'sw' or 'lw', shortwave or longwave bands
+        iwp_gm_2: Ice water path (g m-2)
+        r_eff: Effective radius (m)
+        dtype: data type of the calculation, used for the coefficients and the asymmetry factor cap
+
+    Returns:
+        od: Total optical depth
+        scat_od: Scattering optical depth
+        g: Asymmetry factor
+
+    """
+    ds = get_ice_optics_coefficients("fu")  # read in coefficients from cache
+    de_um, inv_de_um = _fu_effective_diameter(r_eff)
+    c = _band_coefficients(ds[f"coeff_{bands}1"], dtype)  # one coefficient array along the bands per coefficient
+
+    if bands == "sw":
+        MaxAsymmetryFactor = 1.0 - 10.0 * np.finfo(dtype="float32").eps
+        od = iwp_gm_2 * (c[0] + c[1] * inv_de_um)
+        scat_od = od * (
+            1.0
+            - (
+                c[2]
+                + de_um * (c[3] + de_um * (c[4] + de_um * c[5]))
+            )
+        )
+        g = c[6] + de_um * (
+            c[7] + de_um * (c[8] + de_um * c[9])
+        )
+    elif bands == "lw":
+        # use the machine epsilon of the requested data type, otherwise the cap would round to 1 for float32
+        MaxAsymmetryFactor = 1.0 - 10.0 * np.finfo(1.0 if dtype is None else dtype).eps
+        od = iwp_gm_2 * (
+            c[0] + inv_de_um * (c[1] + inv_de_um * c[2])
+        )
+        scat_od = od - iwp_gm_2 * inv_de_um * (
+            c[3]
+            + de_um * (c[4] + de_um * (c[5] + de_um * c[6]))
+        )
+        g = c[7] + de_um * (
+            c[8] + de_um * (c[9] + de_um * c[10])
+        )
+    else:
+        raise ValueError(f"'bands' has to be either 'sw' or 'lw' but is '{bands}'")
+
+    g = np.minimum(g, MaxAsymmetryFactor)  # cap asymmetry factor and keep nan values
+    # move band dimension to the front
+    od, scat_od, g = (x.transpose(f"band_{bands}", ...) for x in (od, scat_od, g))
+
+    return od, scat_od, g
+
+
+def _band_coefficients(coeff: xr.DataArray, dtype=None) -> list:
+    """
+    Split a (band, coefficient) table into a list with one DataArray along the band dimension per coefficient.
+    Arithmetic with these arrays broadcasts over all bands at once.
+
+    Args:
+        coeff: Band-specific coefficients with dimensions (band, coefficient)
+        dtype: data type to cast the coefficients to, default: keep data type
+
+    Returns: list of coefficients along the band dimension
+
+    """
+    coeff = coeff if dtype is None else coeff.astype(dtype)
+    return [coeff[:, i] for i in range(coeff.shape[1])]
+
+
+def calc_ice_optics_fu_sw(ice_wp, r_eff, dtype=None):
     """
     Compute shortwave ice-particle scattering properties using Fu (1996) parameterization.
     The asymmetry factor in band 14 goes larger than one for r_eff > 100.8 um, so we cap r_eff at 100 um.
@@ -471,9 +664,12 @@ def calc_ice_optics_fu_sw(ice_wp, r_eff):
     |   2020-08-10  R. Hogan  Bounded r_eff to be <= 100um and g to be < 1.0
     |   2023-03-06  J. Röttenbacher  Translated to python3
 
+    All bands are computed in one expression broadcast over the band dimension.
+
     Args:
         ice_wp: Ice water path (kg m-2)
         r_eff: Effective radius (m)
+        dtype: data type to use for the calculation (e.g. 'float32' to save memory), default: keep input data type
 
     Returns:
         od: Total optical depth
@@ -481,53 +677,14 @@ def calc_ice_optics_fu_sw(ice_wp, r_eff):
         g: Asymmetry factor
 
     """
-    MaxAsymmetryFactor = 1.0 - 10.0 * np.finfo(dtype="float32").eps
-    MaxEffectiveRadius = 100.0e-6  # metres
-    # read in coefficients from netCDF file
-    filename = pkg_resources.files("pylim.data").joinpath(
-        "fu_ice_scattering_rrtm_new.nc"
-    )
-    ds = xr.open_dataset(filename)
-    coeff = ds.coeff_sw1
-    nb = 14  # number of shortwave bands
-    od = [0.0] * nb  # Total optical depth
-    scat_od = [0.0] * nb  # scattering optical depth
-    g = [0.0] * nb  # asymmetry factor
-
-    # cap effective radius at MaxEffectiveRadius and keep nan values
-    replace_values = np.isnan(r_eff) | (~np.isnan(r_eff) & (r_eff < MaxEffectiveRadius))
-    r_eff = r_eff.where(replace_values, MaxEffectiveRadius)  # cap effective radius
-    # Convert to effective diameter using the relationship in the IFS
-    de_um = r_eff * (1.0e6 / 0.64952)  # Fu's effective diameter (microns)
-    inv_de_um = 1.0 / de_um  # and its inverse
+    if dtype is not None:
+        ice_wp, r_eff = ice_wp.astype(dtype), r_eff.astype(dtype)
     iwp_gm_2 = ice_wp * 1000.0  # Ice water path in g m-2
 
-    for jb in range(nb):
-        od[jb] = iwp_gm_2 * (coeff[jb, 0] + coeff[jb, 1] * inv_de_um)
-        scat_od[jb] = od[jb] * (
-            1.0
-            - (
-                coeff[jb, 2]
-                + de_um * (coeff[jb, 3] + de_um * (coeff[jb, 4] + de_um * coeff[jb, 5]))
-            )
-        )
-        g_tmp = coeff[jb, 6] + de_um * (
-            coeff[jb, 7] + de_um * (coeff[jb, 8] + de_um * coeff[jb, 9])
-        )
-        replace_values = np.isnan(g_tmp) | (
-            ~np.isnan(g_tmp) & (g_tmp < MaxAsymmetryFactor)
-        )
-        g[jb] = g_tmp.where(replace_values, MaxAsymmetryFactor)
-
-    # convert to dataset with new dimension band_sw
-    od = xr.concat(od, "band_sw")
-    scat_od = xr.concat(scat_od, "band_sw")
-    g = xr.concat(g, "band_sw")
-
-    return od, scat_od, g
+    return _ice_optics_fu("sw", iwp_gm_2, r_eff, dtype)
 
 
-def calc_ice_optics_fu_lw(ice_wp, r_eff):
+def calc_ice_optics_fu_lw(ice_wp, r_eff, dtype=None):
     """
     Compute longwave ice-particle scattering properties using Fu et al. (1998) parameterization.
 
@@ -549,9 +706,12 @@ def calc_ice_optics_fu_lw(ice_wp, r_eff):
     |   2020-08-10  R. Hogan  Bounded r_eff to be <= 100um and g to be < 1.0
     |   2023-03-06  J. Röttenbacher  Translated to python3
 
+    All bands are computed in one expression broadcast over the band dimension.
+
     Args:
         ice_wp: Ice water path (kg m-2)
         r_eff: Effective radius (m)
+        dtype: data type to use for the calculation (e.g. 'float32' to save memory), default: keep input data type
 
     Returns:
         od: Total optical depth
@@ -559,47 +719,94 @@ def calc_ice_optics_fu_lw(ice_wp, r_eff):
         g: Asymmetry factor
 
     """
-    MaxAsymmetryFactor = 1.0 - 10.0 * np.finfo(1.0).eps
-    MaxEffectiveRadius = 100.0e-6  # metres
-    # read in coefficients from netCDF file
-    filename = pkg_resources.files("pylim.data").joinpath(
-        "fu_ice_scattering_rrtm_new.nc"
-    )
-    ds = xr.open_dataset(filename)
-    coeff = ds.coeff_lw1
-    nb = 16  # number of longwave bands
-    od = [0.0] * nb  # Total optical depth
-    scat_od = [0.0] * nb  # scattering optical depth
-    g = [0.0] * nb  # asymmetry factor
-
-    # cap effective radius at MaxEffectiveRadius and keep nan values
-    replace_values = np.isnan(r_eff) | (~np.isnan(r_eff) & (r_eff < MaxEffectiveRadius))
-    r_eff = r_eff.where(replace_values, MaxEffectiveRadius)  # cap effective radius
-    # Convert to effective diameter using the relationship in the IFS
-    de_um = r_eff * (1.0e6 / 0.64952)  # Fu's effective diameter (microns)
-    inv_de_um = 1.0 / de_um  # and its inverse
+    if dtype is not None:
+        ice_wp, r_eff = ice_wp.astype(dtype), r_eff.astype(dtype)
     iwp_gm_2 = ice_wp * 1000.0  # Ice water path in g m-2
 
-    for jb in range(nb):
-        od[jb] = iwp_gm_2 * (
-            coeff[jb, 0] + inv_de_um * (coeff[jb, 1] + inv_de_um * coeff[jb, 2])
-        )
-        scat_od[jb] = od[jb] - iwp_gm_2 * inv_de_um * (
-            coeff[jb, 3]
-            + de_um * (coeff[jb, 4] + de_um * (coeff[jb, 5] + de_um * coeff[jb, 6]))
-        )
-        g_tmp = coeff[jb, 7] + de_um * (
-            coeff[jb, 8] + de_um * (coeff[jb, 9] + de_um * coeff[jb, 10])
-        )
-        replace_values = np.isnan(g_tmp) | (
-            ~np.isnan(g_tmp) & (g_tmp < MaxAsymmetryFactor)
-        )
-        g[jb] = g_tmp.where(replace_values, MaxAsymmetryFactor)
+    return _ice_optics_fu("lw", iwp_gm_2, r_eff, dtype)
+
+
+def _interpolate_yi_coefficients(de_um: np.ndarray, coeff: np.ndarray):
+    """
+    Linearly interpolate the Yi et al. (2013) look up table to the given effective diameters for all bands at once.
+
+    Each coefficient family (optical depth, single scattering albedo, asymmetry factor) is retrieved with one integer
+    index gather for both neighbouring look up table entries.
+
+    Args:
+        de_um: effective diameter (um) limited to the validity of the look up table (10 - 119.99 um)
+        coeff: band specific coefficients with shape (bands, 3 * 23)
+
+    Returns: interpolated coefficients for the optical depth, the scattering optical depth and the asymmetry factor,
+        each with shape (..., bands)
+
+    """
+    NSingleCoeffs = 23
+    lu_scale = 0.2
+    lu_offset = 1.0
+    lu_idx = np.floor(de_um * lu_scale - lu_offset)  # generate look up indices
+    wts_2 = (de_um * lu_scale - lu_offset) - lu_idx
+    wts_1 = 1.0 - wts_2
+    # look up indices start at 1, nan values get a valid dummy index, the result is nan anyway because of the weights
+    idx = np.where(np.isnan(lu_idx), 1, lu_idx).astype(np.intp) - 1
+    neighbours = np.stack([idx, idx + 1])
+    wts_1, wts_2 = wts_1[..., np.newaxis], wts_2[..., np.newaxis]
+
+    result = list()
+    for offset in (0, NSingleCoeffs, 2 * NSingleCoeffs):
+        # gather the lower and upper coefficients for all bands, shape (2, ..., bands)
+        c = np.moveaxis(coeff.take(neighbours + offset, axis=1), 0, -1)
+        result.append(wts_1 * c[0] + wts_2 * c[1])
+
+    return tuple(result)
+
+
+def _ice_optics_yi(bands: str, iwp_gm_2, r_eff):
+    """
+    Compute ice-particle scattering properties using the Yi et al. (2013) parameterization for all bands at once.
+    See :py:func:`calc_ice_optics_yi`.
+
+    Args:
+        bands: 'sw' or 'lw', shortwave or longwave bands
+        iwp_gm_2: Ice water path (g m-2)
+        r_eff: effective radius (m)
 
-    # convert to dataset with new dimension band_lw
-    od = xr.concat(od, "band_lw")
-    scat_od = xr.concat(scat_od, "band_lw")
-    g = xr.concat(g, "band_lw")
+    Returns:
+        od: Total optical depth
+        scat_od: Scattering optical depth
+        g: Asymmetry factor
+
+    """
+    ds = get_ice_optics_coefficients("yi")  # read in coefficients from cache
+    band_dim = f"band_{bands}"
+    nb = len(ds[band_dim])  # number of bands
+    coeff = ds[f"coeff_{bands}1"].to_numpy()  # Band-specific coefficients
+    # Convert to effective diameter using the relationship in the IFS
+    # de_um = r_eff * (1.0e6 / 0.64952)
+    de_um = r_eff * 2.0e6
+
+    # limit de_um to validity of LUT
+    replace_values = np.isnan(de_um) | (~np.isnan(de_um) & (de_um < 119.99))
+    de_um = de_um.where(replace_values, 119.99)  # avoid greater than or equal to 120 um
+    replace_values = np.isnan(de_um) | (~np.isnan(de_um) & (de_um > 10))
+    de_um = de_um.where(replace_values, 10.0)  # avoid smaller 20 um
+
+    # interpolate the look up table for all bands at once, this adds the band dimension as the last dimension
+    dtype = np.result_type(de_um.dtype, coeff.dtype)
+    od_coeff, scat_coeff, g = xr.apply_ufunc(
+        _interpolate_yi_coefficients,
+        de_um,
+        kwargs=dict(coeff=coeff),
+        output_core_dims=[[band_dim], [band_dim], [band_dim]],
+        dask="parallelized",
+        output_dtypes=[dtype, dtype, dtype],
+        dask_gufunc_kwargs=dict(output_sizes={band_dim: nb}),
+    )
+
+    od = 0.001 * iwp_gm_2 * od_coeff
+    scat_od = od * scat_coeff
+    # move band dimension to the front
+    od, scat_od, g = (x.transpose(band_dim, ...) for x in (od, scat_od, g))
 
     return od, scat_od, g
 
@@ -641,66 +848,65 @@ def calc_ice_optics_yi(bands: str, ice_wp, r_eff):
         g: Asymmetry factor
 
     """
-    NSingleCoeffs = 23
-    # read in coefficients from netcdf file
-    filename = pkg_resources.files("pylim.data").joinpath(
-        "yi_ice_scattering_rrtm_new.nc"
-    )
-    ds = xr.open_dataset(filename)
-    nb = len(ds[f"band_{bands}"])  # number of bands
-    lu_scale = 0.2
-    lu_offset = 1.0
-    coeff = ds[f"coeff_{bands}1"]  # Band-specific coefficients
-    # Convert to effective diameter using the relationship in the IFS
-    # de_um = r_eff * (1.0e6 / 0.64952)
-    de_um = r_eff * 2.0e6
+    iwp_gm_2 = ice_wp * 1000.0  # convert to g/m2
 
-    # limit de_um to validity of LUT
-    replace_values = np.isnan(de_um) | (~np.isnan(de_um) & (de_um < 119.99))
-    de_um = de_um.where(replace_values, 119.99)  # avoid greater than or equal to 120 um
-    replace_values = np.isnan(de_um) | (~np.isnan(de_um) & (de_um > 10))
-    de_um = de_um.where(replace_values, 10.0)  # avoid smaller 20 um
+    return _ice_optics_yi(bands, iwp_gm_2, r_eff)
 
-    iwp_gm_2 = ice_wp * 1000.0  # convert to g/m2
-    lu_idx = np.floor(de_um * lu_scale - lu_offset)  # generate look up indices
-    wts_2 = (de_um * lu_scale - lu_offset) - lu_idx
-    wts_1 = 1.0 - wts_2
 
-    od_list, scat_od, g = list(), list(), list()  # define lists to append each band to
-    for i in range(nb):
-        c = coeff[i, :].values  # retrieve coefficients
-        c1, c2, c3, c4, c5, c6 = (
-            np.copy(lu_idx),
-            np.copy(lu_idx),
-            np.copy(lu_idx),
-            np.copy(lu_idx),
-            np.copy(lu_idx),
-            np.copy(lu_idx),
-        )
-        # loop through coefficients
-        for key, value in enumerate(c):
-            k = key + 1  # look up indices start at 1
-            c1[lu_idx == k] = value
-            # use try and except to catch IndexError
-            try:
-                c2[lu_idx == k] = c[k]
-                c3[lu_idx == k] = c[key + NSingleCoeffs]
-                c4[lu_idx == k] = c[key + NSingleCoeffs + 1]
-                c5[lu_idx == k] = c[key + 2 * NSingleCoeffs]
-                c6[lu_idx == k] = c[key + 2 * NSingleCoeffs + 1]
-            except IndexError:
-                pass
-
-        od = 0.001 * iwp_gm_2 * (wts_1 * c1 + wts_2 * c2)
-        od_list.append(od)
-        scat_od.append(od * (wts_1 * c3 + wts_2 * c4))
-        g.append(wts_1 * c5 + wts_2 * c6)
-
-    od = xr.concat(od_list, dim=f"band_{bands}")
-    scat_od = xr.concat(scat_od, dim=f"band_{bands}")
-    g = xr.concat(g, dim=f"band_{bands}")
+def calc_ice_optics(bands: str, ice_wp, qi, temperature, r_eff, parameterizations: list = None,
+                    dtype=None) -> xr.Dataset:
+    """
+    Compute ice-particle scattering properties for several ice optic parameterizations in one call.
 
-    return od, scat_od, g
+    The input is cast to ``dtype`` only once and the ice water path in g m-2 is shared by Fu and Yi.
+    The other intermediates (effective diameter, capped mixing ratio) differ between the parameterizations and are
+    computed by each of them.
+    All calculations are done with xarray, thus dask backed input stays lazy and is computed chunk wise.
+
+    Args:
+        bands: 'sw' or 'lw', shortwave or longwave bands
+        ice_wp: Ice water path (kg m-2)
+        qi: Mixing ratio (kg kg-1)
+        temperature: Temperature (K)
+        r_eff: Effective radius (m)
+        parameterizations: list of parameterizations to compute, see ``ice_optics_files``
+            (default: ['fu', 'yi', 'baran2016', 'baran2017'])
+        dtype: data type to use for the calculation (e.g. 'float32' to save memory), default: keep input data type
+
+    Returns: Data set with the variables od, scat_od and g and the new dimension ``parameterization``
+
+    """
+    if bands not in ["sw", "lw"]:
+        raise ValueError(f"'bands' has to be either 'sw' or 'lw' but is '{bands}'")
+    parameterizations = list(ice_optics_files) if parameterizations is None else parameterizations
+    if dtype is not None:
+        ice_wp, qi, temperature, r_eff = (x.astype(dtype) for x in (ice_wp, qi, temperature, r_eff))
+    band_dim = f"band_{bands}"
+    iwp_gm_2 = ice_wp * 1000.0  # Ice water path in g m-2, used by Fu and Yi
+
+    results = list()
+    for parameterization in parameterizations:
+        if parameterization == "fu":
+            optics = _ice_optics_fu(bands, iwp_gm_2, r_eff, dtype)
+        elif parameterization == "yi":
+            optics = _ice_optics_yi(bands, iwp_gm_2, r_eff)
+        elif parameterization == "baran2016":
+            optics = calc_ice_optics_baran2016(bands, ice_wp, qi, temperature)
+        elif parameterization == "baran2017":
+            optics = calc_ice_optics_baran2017(bands, ice_wp, qi, temperature)
+        else:
+            raise ValueError(f"'parameterization' has to be one of {list(ice_optics_files)} "
+                             f"but is '{parameterization}'")
+        results.append([x.transpose(band_dim, ...) for x in optics])
+
+    index = pd.Index(parameterizations, name="parameterization")
+    long_names = ["Total optical depth", "Scattering optical depth", "Asymmetry factor"]
+    ds = xr.Dataset()
+    for i, (var, long_name) in enumerate(zip(["od", "scat_od", "g"], long_names)):
+        ds[var] = xr.concat([optics[i] for optics in results], dim=index)
+        ds[var].attrs = dict(long_name=long_name, units="1")
+
+    return ds
 
 
 def calc_pressure(ds: xr.Dataset) -> xr.Dataset:
@@ -720,10 +926,11 @@ def calc_pressure(ds: xr.Dataset) -> xr.Dataset:
     # pf = ds["hyam"] + np.e ** ds["lnsp"] * ds["hybm"]
     # use code as suggested by confluence article
     # difference in the lowest levels < 0.05 Pa (new - old)
-    pf = list()
-    for hybrid in range(len(ph) - 1):
-        pf.append((ph.isel(nhyi=hybrid + 1) + ph.isel(nhyi=hybrid)) / 2.0)
-    pf = xr.concat(pf, "lev")
+    # average each pair of neighbouring half levels by shifting the half level axis by one,
+    # drop a possible coordinate of nhyi to avoid an alignment of the two shifted arrays
+    ph_shift = ph.drop_vars("nhyi", errors="ignore")
+    pf = (ph_shift.isel(nhyi=slice(1, None)) + ph_shift.isel(nhyi=slice(None, -1))) / 2.0
+    pf = pf.swap_dims(nhyi="lev")
     ds["pressure_hl"] = ph  # assign as a new variable
     ds["pressure_full"] = pf
 
@@ -754,10 +961,10 @@ def calculate_pressure_height(ds: xr.Dataset) -> xr.Dataset:
                 ],  # list with one entry per arg
                 output_core_dims=[["half_level"]],
                 # list with one entry per arg
-                vectorize=True,  # loop over non-core dims
+                kwargs=dict(axis=-1),  # core dims are moved to the end, all profiles are computed at once
                 dask="parallelized",
                 output_dtypes=[ds.temperature_hl.dtype],
-            )
+            ).astype(ds.temperature_hl.dtype)
 
         ds["press_height_hl"] = press_height_hl.assign_coords(
             half_level=np.flip(press_height_hl.half_level.to_numpy())
@@ -778,10 +985,10 @@ def calculate_pressure_height(ds: xr.Dataset) -> xr.Dataset:
             input_core_dims=[["level"], ["level"]],  # list with one entry per arg
             output_core_dims=[["level"]],
             # list with one entry per arg
-            vectorize=True,  # loop over non-core dims
+            kwargs=dict(axis=-1),  # core dims are moved to the end, all profiles are computed at once
             dask="parallelized",
             output_dtypes=[ds.t.dtype],
-        )
+        ).astype(ds.t.dtype)
 
         ds["press_height_full"] = press_height_full.assign_coords(
             level=np.flip(press_height_full.level.to_numpy())
@@ -801,6 +1008,21 @@ def calculate_pressure_height(ds: xr.Dataset) -> xr.Dataset:
     return ds
 
 
+def _get_chunk_dict(ds: xr.Dataset) -> dict:
+    """Get a chunk dictionary for all dimensions of an IFS data set
+
+    Each time step gets its own chunk, all other dimensions (e.g. level, rgrid, lat, lon, column) are chunked
+    automatically by dask.
+
+    Args:
+        ds: IFS DataSet with the dimensions to chunk
+
+    Returns: Dictionary with one entry per dimension to be used with ``.chunk()``
+
+    """
+    return {dim: 1 if dim == "time" else "auto" for dim in ds.dims}
+
+
 def apply_ice_effective_radius(ds: xr.Dataset) -> xr.Dataset:
     """Apply ice effective radius function over a whole dataset
 
@@ -810,48 +1032,24 @@ def apply_ice_effective_radius(ds: xr.Dataset) -> xr.Dataset:
     Returns: DataSet with new variable re_ice containing the ice effective radius for each point
 
     """
-    chunk_dict = dict()
-    # check which dimensions are in the data set and adjust chunking accordingly
-    if "rgrid" in ds.dims:
-        # we deal with an IFS data set on a reduced gaussian grid
-        chunk_dict["rgrid"] = 10
-        if "time" in ds.dims:
-            # it has more than one time step
-            chunk_dict["time"] = 1
-        if "level" in ds.dims:
-            # it has more than one vertical level
-            chunk_dict["level"] = 10
-    elif "lat" in ds.dims:
-        # we deal with an IFS data set on a regular lat lon grid
-        chunk_dict["lat"] = 10
-        chunk_dict["lon"] = 10
-        if "level" in ds.dims:
-            chunk_dict["level"] = 10
-        if "time" in ds.dims:
-            chunk_dict["time"] = 1
-    elif "lat" not in ds.dims and "rgrid" not in ds.dims:
-        # only one column is given
-        chunk_dict["level"] = 10
-    else:
-        raise ValueError(
-            f"Input dimensions {ds.dims} do not match any combination of expected dimensions"
-        )
+    # chunk only the needed variables according to the dimensions present in the data set
+    variables = ["pressure_full", "t", "cloud_fraction", "ciwc", "cswc"]
+    ds_chunked = ds[variables].chunk(_get_chunk_dict(ds[variables]))
 
     ieffr = xr.apply_ufunc(
         ice_effective_radius,  # first the function
         # now arguments in the order expected by 'ice_effective_radius'
-        ds.pressure_full.chunk(chunk_dict),
-        ds.t.chunk(chunk_dict),  # as above
-        ds.cloud_fraction.chunk(chunk_dict),
-        ds.ciwc.chunk(chunk_dict),
-        ds.cswc.chunk(chunk_dict),
+        ds_chunked.pressure_full,
+        ds_chunked.t,  # as above
+        ds_chunked.cloud_fraction,
+        ds_chunked.ciwc,
+        ds_chunked.cswc,
         ds.lat,  # as above
         input_core_dims=[[], [], [], [], [], []],  # list with one entry per arg
-        vectorize=True,  # loop over non-core dims
-        dask="parallelized",
+        dask="parallelized",  # the function works on whole chunks, no need to vectorize
         output_dtypes=[ds.t.dtype],
     )
-    ds["re_ice"] = ieffr.compute()
+    ds["re_ice"] = ieffr.compute().astype(ds.t.dtype)
     ds["re_ice"].attrs = dict(units="m")
 
     return ds
@@ -863,35 +1061,26 @@ def apply_liquid_effective_radius(ds: xr.Dataset) -> xr.Dataset:
     Args:
         ds: IFS DataSet
 
-    Returns: DataSet with new variable re_ice containing the ice effective radius for each point
+    Returns: DataSet with new variable re_liquid containing the liquid effective radius for each point
 
     """
-    # check if time, lat and lon are dimensions in data set and adjust chunking accordingly
-    if "time" in ds.dims and "lat" in ds.dims and "lon" in ds.dims:
-        chunk_dict = {"time": 1, "level": 10, "lat": 10, "lon": 10}
-    elif "lat" in ds.dims and "lon" in ds.dims:
-        chunk_dict = {"level": 10, "lat": 10, "lon": 10}
-    elif "time" not in ds.dims and "lat" not in ds.dims and "lon" not in ds.dims:
-        chunk_dict = {"level": 10}
-    else:
-        raise ValueError(
-            f"Input dimensions {ds.dims} do not match any combination of expected dimensions"
-        )
+    # chunk only the needed variables according to the dimensions present in the data set
+    variables = ["pressure_full", "t", "cloud_fraction", "clwc", "crwc"]
+    ds_chunked = ds[variables].chunk(_get_chunk_dict(ds[variables]))
 
     leffr = xr.apply_ufunc(
         liquid_effective_radius,  # first the function
         # now arguments in the order expected by 'liquid_effective_radius'
-        ds.pressure_full.chunk(chunk_dict),
-        ds.t.chunk(chunk_dict),  # as above
-        ds.cloud_fraction.chunk(chunk_dict),
-        ds.clwc.chunk(chunk_dict),
-        ds.crwc.chunk(chunk_dict),
+        ds_chunked.pressure_full,
+        ds_chunked.t,  # as above
+        ds_chunked.cloud_fraction,
+        ds_chunked.clwc,
+        ds_chunked.crwc,
         input_core_dims=[[], [], [], [], []],  # list with one entry per arg
-        vectorize=True,  # loop over non-core dims
-        dask="parallelized",
+        dask="parallelized",  # the function works on whole chunks, no need to vectorize
         output_dtypes=[ds.t.dtype],
     )
-    ds["re_liquid"] = leffr.compute()
+    ds["re_liquid"] = leffr.compute().astype(ds.t.dtype)
     ds["re_liquid"].attrs = dict(units="m")
 
     return ds
@@ -936,17 +1125,17 @@ def get_model_level_of_altitude(
     """
     Retrieve the model levels corresponding to a time series of altitude values such as given by a flight path.
 
+    The nearest level is searched for all time steps at once.
+    Additional dimensions of the model data (e.g. column) are kept in the output.
+
     Args:
         altitude: time series of altitude values in m, has to have the dimension time
         model_ds: model data set with index time, level and/or half_level and variables press_height_hl and/or press_height_full
         coord: which vertical coordinate to use for selection, either "half_level" or "level"
 
-    Returns:
+    Returns: Index of the nearest model level along ``coord`` for each time step (and additional dimension)
 
     """
-    alt = altitude.sel(time=model_ds.time, method="nearest")
-    ts = len(model_ds.time)
-    height_level = np.zeros(ts)
     if coord == "half_level":
         var = "press_height_hl"
     elif coord == "level":
@@ -956,20 +1145,17 @@ def get_model_level_of_altitude(
             f"'coord' has to be either 'half_level' or 'level' but is '{coord}'"
         )
 
-    assert len(model_ds[var].dims) == 2, (
-        f"{var} should be two dimensional!"
-        f" Remove dimension(s) {[d for d in model_ds[var].dims if d not in ['time', coord]]} from input!"
-    )
-
-    for i in tqdm(range(ts)):
-        height_level[i] = h.arg_nearest(
-            model_ds[var][i, :].to_numpy(), alt[i].to_numpy()
-        )
-
-    height_level = height_level.astype(int)
-    height_level_da = xr.DataArray(
-        height_level, dims=["time"], coords={"time": model_ds.time}
-    )
+    # select the altitude closest to each model time step and use the model time steps to align both arrays
+    alt = altitude.sel(time=model_ds.time, method="nearest")
+    alt = alt.assign_coords(time=model_ds.time.to_numpy())
+    distance = np.abs(model_ds[var] - alt)
+    height_level_da = xr.apply_ufunc(
+        np.nanargmin,
+        distance,
+        input_core_dims=[[coord]],
+        kwargs=dict(axis=-1),
+        dask="parallelized",
+        output_dtypes=[int],
+    ).astype(int)
 
     return height_level_da
-
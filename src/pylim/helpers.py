@@ -3,9 +3,11 @@
 
 *author*: Johannes Röttenbacher
 """
+import hashlib
 import os
 import shutil
 import sys
+import uuid
 from itertools import groupby
 import toml
 import numpy as np
@@ -19,6 +21,7 @@ import cmasher as cmr
 from tqdm import tqdm
 import xarray as xr
 import pandas as pd
+from scipy.spatial import cKDTree
 
 log = logging.getLogger(__name__)
 
@@ -629,27 +632,503 @@ def longitude_values_for_gaussian_grid(latitudes: np.array,
 
     """
     assert len(latitudes) == len(n_points), "Number of latitudes does not match number of points given!"
-    lon_values = [np.linspace(0, 360, num=points, endpoint=False) for points in n_points]
-    lon_values_out = np.array([])
     lon_values_list = list()
-    for i, lons in enumerate(lon_values):
+    for i, points in enumerate(n_points):
+        lons = np.linspace(0, 360, num=points, endpoint=False)
         all_lons = np.where(lons > 180, (lons + 180) % 360 - 180, lons)
         assert len(all_lons) == len(np.unique(all_lons)), f"Non unique longitude values found for {i}! Check input!"
         if longitude_boundaries is not None:
             all_lons = all_lons[(all_lons >= longitude_boundaries[0]) & (all_lons <= longitude_boundaries[1])]
             all_lons.sort()
-        lon_values_out = np.concatenate([lon_values_out, all_lons])
         lon_values_list.append(all_lons)
 
-    # create list of latitude values as coordinate
-    lat_values_out = np.array([])
-    for i, lon_array in enumerate(lon_values_list):
-        lat = np.repeat(latitudes[i], lon_array.size)
-        lat_values_out = np.concatenate([lat_values_out, lat])
+    # concatenate all rings at once and create the latitude values as coordinate
+    lon_values_out = np.concatenate([np.array([])] + lon_values_list)
+    lat_values_out = np.repeat(np.asarray(latitudes, dtype=float), [lons.size for lons in lon_values_list])
 
     return lat_values_out, lon_values_out
 
 
+class GaussianGridIndex:
+    """
+    Spatial index over the cells of a (reduced) Gaussian grid for fast collocation of e.g. flight tracks with IFS data.
+
+    The cell centers as returned by :py:func:`longitude_values_for_gaussian_grid` are converted to unit vectors on the
+    sphere and stored in a KD-tree.
+    The position of a cell in the index corresponds to its position along the ``rgrid`` dimension of the IFS data.
+    Use :py:meth:`from_grid` to build each grid only once per process and optionally cache it on disk.
+    The cache file only holds the cell centers and the grid key, the KD-tree is rebuilt from them on load.
+
+    Examples:
+        >>> grid_index = GaussianGridIndex.from_grid(latitudes, n_points, (-60, 30), cache_file="grid_index.npz")
+        >>> distance, idx = grid_index.query(bahamas.IRS_LAT, bahamas.IRS_LON)
+        >>> ifs_track = ifs_ds.isel(rgrid=xr.DataArray(idx, dims="time"))
+
+    """
+
+    earth_radius = 6371.0  # km
+
+    # indices which were already built in this process
+    _cache = dict()
+
+    def __init__(self, latitudes: np.array, n_points: np.array, longitude_boundaries: np.array = None):
+        """
+        Build the spatial index for the given grid definition.
+
+        Args:
+            latitudes: The latitude values of the Gaussian grid starting in the North
+            n_points: The number of longitude points on each latitude circle (needs to be of same length as latitudes)
+            longitude_boundaries: The longitude boundaries (E, W). E =-90, W =90, N=0, S=-180/180
+
+        """
+        lat, lon = longitude_values_for_gaussian_grid(latitudes, n_points, longitude_boundaries)
+        self._set_cells(self.grid_key(latitudes, n_points, longitude_boundaries), lat, lon)
+
+    def _set_cells(self, key: str, lat: np.array, lon: np.array) -> None:
+        """Set the grid key and the cell centers and build the KD-tree"""
+        self.key = key
+        self.lat, self.lon = np.asarray(lat, dtype=float), np.asarray(lon, dtype=float)
+        self.tree = cKDTree(self._to_unit_vectors(self.lat, self.lon))
+
+    @staticmethod
+    def _to_unit_vectors(lat, lon) -> np.ndarray:
+        """Convert latitude and longitude in degrees to unit vectors with shape (..., 3)"""
+        lat, lon = np.deg2rad(np.asarray(lat, dtype=float)), np.deg2rad(np.asarray(lon, dtype=float))
+        cos_lat = np.cos(lat)
+        return np.stack([cos_lat * np.cos(lon), cos_lat * np.sin(lon), np.sin(lat)], axis=-1)
+
+    @staticmethod
+    def grid_key(latitudes: np.array, n_points: np.array, longitude_boundaries: np.array = None) -> str:
+        """Return a unique key for a grid definition"""
+        key = hashlib.sha1()
+        for values in (latitudes, n_points, [] if longitude_boundaries is None else longitude_boundaries):
+            key.update(np.ascontiguousarray(values, dtype=float).tobytes())
+            key.update(b"|")
+        return key.hexdigest()
+
+    @classmethod
+    def from_grid(cls, latitudes: np.array, n_points: np.array, longitude_boundaries: np.array = None,
+                  cache_file: str = None):
+        """
+        Return the spatial index for the given grid definition and only build it if it was not built before.
+        The index is kept in memory for the running process and optionally written to or read from ``cache_file``.
+
+        Args:
+            latitudes: The latitude values of the Gaussian grid starting in the North
+            n_points: The number of longitude points on each latitude circle (needs to be of same length as latitudes)
+            longitude_boundaries: The longitude boundaries (E, W). E =-90, W =90, N=0, S=-180/180
+            cache_file: path to a file to load the index from or save it to
+
+        Returns: Spatial index of the Gaussian grid
+
+        """
+        key = cls.grid_key(latitudes, n_points, longitude_boundaries)
+        if key in cls._cache:
+            return cls._cache[key]
+
+        grid_index = None
+        if cache_file is not None and os.path.isfile(cache_file):
+            try:
+                grid_index = cls.load(cache_file)
+            except (OSError, ValueError) as e:
+                log.warning(f"Could not read {cache_file}, rebuilding index: {e}")
+            if grid_index is not None and grid_index.key != key:
+                log.info(f"Grid definition in {cache_file} does not match, rebuilding index")
+                grid_index = None
+        if grid_index is None:
+            grid_index = cls(latitudes, n_points, longitude_boundaries)
+            if cache_file is not None:
+                grid_index.save(cache_file)
+
+        cls._cache[key] = grid_index
+        return grid_index
+
+    def save(self, filename: str) -> None:
+        """
+        Save the grid key and the cell centers of the spatial index to disk as a numpy ``.npz`` file.
+        The file is written to a temporary file first and then moved into place.
+
+        Args:
+            filename: complete path to the cache file
+
+        """
+        tmp_file = f"{filename}.{os.getpid()}.{uuid.uuid4().hex}.tmp"
+        try:
+            with open(tmp_file, "wb") as f:
+                np.savez(f, key=np.array(self.key), lat=self.lat, lon=self.lon)
+            os.replace(tmp_file, filename)
+        finally:
+            if os.path.exists(tmp_file):
+                os.remove(tmp_file)
+        log.info(f"Saved Gaussian grid index to {filename}")
+
+    @classmethod
+    def load(cls, filename: str):
+        """
+        Load a spatial index saved with :py:meth:`save` and rebuild its KD-tree.
+
+        Args:
+            filename: complete path to the cache file
+
+        Returns: Spatial index of the Gaussian grid
+
+        """
+        with np.load(filename, allow_pickle=False) as data:
+            if not {"key", "lat", "lon"}.issubset(data.files):
+                raise ValueError(f"{filename} does not contain a {cls.__name__}!")
+            key, lat, lon = str(data["key"]), data["lat"], data["lon"]
+        if (lat.ndim != 1 or lat.shape != lon.shape or lat.size == 0 or not np.isfinite(lat).all()
+                or not np.isfinite(lon).all() or np.abs(lat).max() > 90):
+            raise ValueError(f"{filename} does not contain valid grid cell centers!")
+        grid_index = cls.__new__(cls)
+        grid_index._set_cells(key, lat, lon)
+        return grid_index
+
+    def query(self, lat, lon, k: int = 1) -> (np.array, np.array):
+        """
+        Find the k nearest grid cells for a batch of positions, e.g. a whole flight track.
+
+        Args:
+            lat: latitude values in degrees (scalar or array)
+            lon: longitude values in degrees (scalar or array of the same shape as lat)
+            k: number of nearest cells to return for each position
+
+        Returns: Great circle distance in km and index of the grid cells along rgrid, both with shape
+            lat.shape (k=1) or lat.shape + (k,). Positions with NaN coordinates and missing neighbours (k larger than the
+            number of cells) get an infinite distance and index -1.
+
+        """
+        points = self._to_unit_vectors(lat, lon)
+        finite = np.isfinite(points).all(axis=-1)
+        shape = finite.shape if k == 1 else finite.shape + (k,)
+        chord, idx = np.full(shape, np.inf), np.full(shape, -1, dtype=int)
+        # cKDTree does not accept NaN, e.g. from gaps in the BAHAMAS data
+        chord[finite], idx[finite] = self.tree.query(points[finite], k=k)
+        # cKDTree marks missing neighbours with the number of cells as index
+        idx[idx == self.tree.n] = -1
+        distance = np.where(idx >= 0, 2 * self.earth_radius * np.arcsin(np.clip(chord / 2, 0, 1)), np.inf)
+        return distance[()], idx[()]
+
+    def cells_along_track(self, lat, lon, k: int = 1) -> np.array:
+        """
+        Return the sorted unique grid cells closest to a track to subset IFS data along rgrid.
+
+        Args:
+            lat: latitude values of the track in degrees
+            lon: longitude values of the track in degrees
+            k: number of nearest cells to include for each position
+
+        Returns: sorted unique indices along rgrid
+
+        """
+        _, idx = self.query(lat, lon, k=k)
+        return np.unique(idx[idx >= 0])
+
+
+class TimeAlignment:
+    """
+    Index mapping from the time axis of one data source onto a target time base, e.g. to put BAHAMAS, BACARDI, SMART
+    and INS data with different sampling rates onto a common time axis without reindexing every variable separately.
+
+    The mapping is calculated once and can then be applied to all variables of a source.
+    For every target time step it stores the range of source rows needed:
+
+    - ``nearest``: closest source time step, the later one if both are equally close (like ``reindex``)
+    - ``linear``: linear interpolation between the two neighbouring source time steps
+    - ``mean``: mean over all source time steps in [target time, next target time), NaNs are ignored
+
+    Target time steps which cannot be filled (outside the source time range, further away than ``tolerance`` or empty
+    averaging intervals) are set to NaN (NaT for times).
+    With ``nearest`` and a tolerance, target time steps just outside the source time range are still filled if the
+    first or last source time step is within the tolerance.
+    Use :py:meth:`from_times` or :py:func:`align_time` to calculate each mapping only once per process.
+    The last ``cache_size`` mappings are kept, :py:meth:`clear_cache` frees them.
+
+    Examples:
+        >>> mapping = TimeAlignment.from_times(bahamas.time, bacardi.time, method="mean")
+        >>> bahamas_1hz = mapping.apply(bahamas)
+        >>> ins_1hz = align_time(ins, bacardi.time, method="linear", tolerance="1s")
+
+    """
+
+    methods = ("nearest", "linear", "mean")
+
+    # mappings which were already calculated in this process, the least recently used are dropped first
+    _cache = dict()
+    cache_size = 32
+
+    def __init__(self, source_time, target_time, method: str = "nearest", tolerance=None):
+        """
+        Calculate the mapping from source to target time.
+
+        Args:
+            source_time: monotonically increasing time of the data source (datetime64 array or pd.DatetimeIndex)
+            target_time: monotonically increasing target time base (datetime64 array or pd.DatetimeIndex)
+            method: one of nearest, linear or mean
+            tolerance: maximum distance to the nearest source time step or maximum gap to interpolate over
+                (anything understood by pd.Timedelta), not used for mean
+
+        """
+        if method not in self.methods:
+            raise ValueError(f"method has to be one of {self.methods}, not {method}!")
+        source, target = self._to_ns(source_time), self._to_ns(target_time)
+        if len(source) == 0:
+            raise ValueError("Source time is empty!")
+        if np.any(np.diff(source) < 0):
+            raise ValueError("Source time has to be monotonically increasing!")
+        if np.any(np.diff(target) < 0):
+            # the mapping is applied in blocks of consecutive target time steps
+            raise ValueError("Target time has to be monotonically increasing!")
+        self.key = self.mapping_key(source_time, target_time, method, tolerance)
+        self.method, self.tolerance = method, tolerance
+        self.source_time, self.target_time = source.astype("datetime64[ns]"), target.astype("datetime64[ns]")
+        self.n_source, self.n_target = len(source), len(target)
+        self.weight = None
+        in_range = (target >= source[0]) & (target <= source[-1])
+        tolerance = np.inf if tolerance is None else pd.Timedelta(tolerance).value
+
+        if method == "nearest":
+            right = np.clip(np.searchsorted(source, target), 0, self.n_source - 1)
+            left = np.clip(right - 1, 0, None)
+            # ties go to the later source time step like in xarray and pandas
+            self.lower = np.where(np.abs(source[right] - target) <= np.abs(target - source[left]), right, left)
+            self.upper = self.lower + 1
+            if np.isinf(tolerance):
+                self.valid = in_range
+            else:
+                self.valid = np.abs(source[self.lower] - target) <= tolerance
+        elif method == "linear":
+            if self.n_source < 2:
+                raise ValueError("Linear interpolation needs at least two source time steps!")
+            self.lower = np.clip(np.searchsorted(source, target, side="right") - 1, 0, self.n_source - 2)
+            self.upper = self.lower + 2
+            gap = source[self.lower + 1] - source[self.lower]
+            with np.errstate(divide="ignore", invalid="ignore"):
+                self.weight = np.where(gap > 0, (target - source[self.lower]) / gap, 0.0)
+            self.valid = in_range & (gap <= tolerance)
+        else:
+            # the last interval is as long as the one before
+            step = target[-1] - target[-2] if self.n_target > 1 else 1
+            edges = np.searchsorted(source, np.append(target, target[-1:] + step))
+            self.lower, self.upper = edges[:-1], edges[1:]
+            self.valid = self.upper > self.lower
+
+    @staticmethod
+    def _to_ns(time) -> np.ndarray:
+        """Convert time values to integer nanoseconds"""
+        return np.asarray(time, dtype="datetime64[ns]").astype(np.int64)
+
+    @classmethod
+    def mapping_key(cls, source_time, target_time, method: str, tolerance=None) -> str:
+        """Return a unique key for a mapping"""
+        key = hashlib.sha1()
+        for time in (source_time, target_time):
+            key.update(np.ascontiguousarray(cls._to_ns(time)).tobytes())
+            key.update(b"|")
+        key.update(f"{method}|{None if tolerance is None else pd.Timedelta(tolerance).value}".encode())
+        return key.hexdigest()
+
+    @classmethod
+    def from_times(cls, source_time, target_time, method: str = "nearest", tolerance=None):
+        """
+        Return the mapping from source to target time and only calculate it if it was not calculated before.
+
+        Args:
+            source_time: monotonically increasing time of the data source (datetime64 array or pd.DatetimeIndex)
+            target_time: monotonically increasing target time base (datetime64 array or pd.DatetimeIndex)
+            method: one of nearest, linear or mean
+            tolerance: maximum distance to the nearest source time step or maximum gap to interpolate over
+
+        Returns: Mapping from source to target time
+
+        """
+        key = cls.mapping_key(source_time, target_time, method, tolerance)
+        mapping = cls._cache.pop(key, None)
+        if mapping is None:
+            mapping = cls(source_time, target_time, method, tolerance)
+        cls._cache[key] = mapping  # (re)insert as most recently used
+        while len(cls._cache) > cls.cache_size:
+            cls._cache.pop(next(iter(cls._cache)))
+        return mapping
+
+    @classmethod
+    def clear_cache(cls) -> None:
+        """Remove all cached mappings"""
+        cls._cache.clear()
+
+    def _result_dtype(self, dtype) -> np.dtype:
+        """Return the data type of aligned values, floats are needed for interpolation, averages and NaNs"""
+        dtype = np.dtype(dtype)
+        if dtype.kind in "mM" or (self.method == "nearest" and self.valid.all()):
+            return dtype
+        if dtype.kind in "OSU":
+            return np.dtype(object)
+        return np.promote_types(dtype, np.float32)
+
+    def _apply_block(self, values: np.ndarray, start: int, stop: int, offset: int) -> np.ndarray:
+        """
+        Map source values onto the target time steps start:stop.
+
+        Args:
+            values: source rows needed for the target time steps, time on the first axis
+            start: first target time step
+            stop: last target time step (exclusive)
+            offset: index of the first row of values in the source
+
+        Returns: values on the target time steps with time on the first axis
+
+        """
+        dtype = self._result_dtype(values.dtype)
+        lower, valid = self.lower[start:stop] - offset, self.valid[start:stop]
+        if self.method == "nearest":
+            out = values[lower].astype(dtype, copy=False)
+        elif self.method == "linear":
+            weight = self.weight[start:stop].reshape((-1,) + (1,) * (values.ndim - 1))
+            v0, v1 = values[lower], values[lower + 1]
+            # exact matches with a source time step must not become NaN because of a missing neighbour
+            out = np.where(weight == 0, v0, np.where(weight == 1, v1, v0 + weight * (v1 - v0)))
+            out = out.astype(dtype, copy=False)
+        else:
+            values = values.astype(dtype, copy=False)
+            finite = ~np.isnan(values)
+            out = np.empty((stop - start,) + values.shape[1:], dtype=dtype)
+            if valid.any():
+                # the averaging intervals are contiguous, so empty intervals can be left out of the sum
+                sums = np.add.reduceat(np.where(finite, values, 0), lower[valid], axis=0)
+                counts = np.add.reduceat(finite, lower[valid], axis=0)
+                with np.errstate(divide="ignore", invalid="ignore"):
+                    out[valid] = sums / counts
+        if not valid.all():
+            if dtype.kind in "mM":
+                out[~valid] = np.array("NaT", dtype=dtype)
+            else:
+                out[~valid] = None if dtype.kind == "O" else np.nan
+        return out
+
+    def _source_rows(self, start: int, stop: int) -> (int, int):
+        """Return the range of source rows needed for the target time steps start:stop"""
+        return int(self.lower[start]), int(max(self.upper[stop - 1], self.lower[start] + 1))
+
+    def _apply_array(self, values, axis: int = 0, chunk_size: int = None):
+        """Apply the mapping along one axis of a NumPy or dask array, see :py:meth:`apply`"""
+        if values.shape[axis] != self.n_source:
+            raise ValueError(f"Length of axis {axis} ({values.shape[axis]}) does not match the source time "
+                             f"({self.n_source})!")
+        is_dask = type(values).__module__.startswith("dask")
+        if chunk_size is None:
+            chunk_size = max(values.chunks[axis]) if is_dask else max(self.n_target, 1)
+        blocks = [(start, min(start + chunk_size, self.n_target)) for start in range(0, self.n_target, chunk_size)]
+        dtype = self._result_dtype(values.dtype)
+
+        if is_dask:
+            import dask.array as da
+
+            values = da.moveaxis(values, axis, 0)
+            out = list()
+            for start, stop in blocks:
+                lo, hi = self._source_rows(start, stop)
+                source_block = values[lo:hi].rechunk({0: -1})
+                out.append(source_block.map_blocks(self._apply_block, start, stop, lo, dtype=dtype,
+                                                   chunks=((stop - start,),) + source_block.chunks[1:]))
+            out = da.concatenate(out, axis=0) if out else da.empty((0,) + values.shape[1:], dtype=dtype)
+            return da.moveaxis(out, 0, axis)
+
+        values = np.moveaxis(values, axis, 0)
+        out = list()
+        for start, stop in blocks:
+            lo, hi = self._source_rows(start, stop)
+            # only the source rows needed for this block are read, e.g. from a np.memmap
+            out.append(self._apply_block(np.asarray(values[lo:hi]), start, stop, lo))
+        out = np.concatenate(out, axis=0) if out else np.empty((0,) + values.shape[1:], dtype=dtype)
+        return np.moveaxis(out, 0, axis)
+
+    def _mapping_for(self, dtype):
+        """Return the mapping to use for the data type, non numeric values can only be aligned with nearest"""
+        if self.method == "nearest" or np.dtype(dtype).kind in "biufc":
+            return self
+        return TimeAlignment.from_times(self.source_time, self.target_time, "nearest", self.tolerance)
+
+    def apply(self, data, **kwargs):
+        """
+        Apply the mapping to data on the source time axis.
+
+        xarray objects are aligned along ``dim``, all variables without it are kept unchanged.
+        Dask backed variables stay lazy and are aligned chunk wise.
+        NumPy arrays (also np.memmap) are read and aligned in blocks of ``chunk_size`` target time steps.
+        Non numeric variables are always aligned with the nearest method.
+
+        Args:
+            data: xr.Dataset, xr.DataArray, pd.DataFrame, pd.Series, NumPy or dask array
+            **kwargs:
+                dim (str): time dimension of xarray objects (default: time)
+                axis (int): time axis of NumPy and dask arrays (default: 0)
+                chunk_size (int): number of target time steps to align at once (default: all for NumPy,
+                    the chunk size of the time dimension for dask)
+
+        Returns: data on the target time base
+
+        """
+        dim = kwargs["dim"] if "dim" in kwargs else "time"
+        axis = kwargs["axis"] if "axis" in kwargs else 0
+        chunk_size = kwargs["chunk_size"] if "chunk_size" in kwargs else None
+
+        if isinstance(data, (pd.DataFrame, pd.Series)):
+            index = pd.DatetimeIndex(self.target_time, name=data.index.name)
+            if isinstance(data, pd.Series):
+                values = data.to_numpy()
+                values = self._mapping_for(values.dtype)._apply_array(values, 0, chunk_size)
+                return pd.Series(values, index=index, name=data.name)
+            columns = {c: self.apply(data[c], chunk_size=chunk_size) for c in data.columns}
+            return pd.DataFrame(columns, index=index)
+
+        if isinstance(data, xr.DataArray):
+            return self.apply(data.to_dataset(name="__values__"), dim=dim, chunk_size=chunk_size)[
+                "__values__"].rename(data.name)
+
+        if isinstance(data, xr.Dataset):
+            variables = dict()
+            for name, var in data.variables.items():
+                if name == dim:
+                    continue
+                if dim not in var.dims:
+                    variables[name] = var
+                    continue
+                values = self._mapping_for(var.dtype)._apply_array(var.data, var.get_axis_num(dim), chunk_size)
+                variables[name] = xr.Variable(var.dims, values, attrs=var.attrs)
+            coords = [name for name in data.coords if name != dim]
+            out = xr.Dataset({name: v for name, v in variables.items() if name not in coords},
+                             coords={name: variables[name] for name in coords}, attrs=data.attrs)
+            return out.assign_coords({dim: xr.Variable(dim, self.target_time, attrs=data[dim].attrs)})
+
+        return self._apply_array(data, axis, chunk_size)
+
+
+def align_time(data, target_time, method: str = "nearest", tolerance=None, **kwargs):
+    """
+    Align data from one source onto a target time base using a cached :py:class:`TimeAlignment`.
+
+    Args:
+        data: xr.Dataset, xr.DataArray (time in ``dim``), pd.DataFrame or pd.Series (time as index)
+        target_time: monotonically increasing target time base (datetime64 array, pd.DatetimeIndex or xr.DataArray)
+        method: one of nearest, linear or mean
+        tolerance: maximum distance to the nearest source time step or maximum gap to interpolate over
+        **kwargs:
+            dim (str): time dimension of xarray objects (default: time)
+            chunk_size (int): number of target time steps to align at once
+
+    Returns: data on the target time base
+
+    Examples:
+        >>> bahamas_1hz = align_time(bahamas, bacardi.time, method="mean")
+        >>> stabbi = align_time(reader.read_stabbi_data(stabbi_path), bahamas.time, method="linear", tolerance="1s")
+
+    """
+    dim = kwargs["dim"] if "dim" in kwargs else "time"
+    source_time = data.index if isinstance(data, (pd.DataFrame, pd.Series)) else data[dim]
+    mapping = TimeAlignment.from_times(source_time, target_time, method, tolerance)
+    return mapping.apply(data, **kwargs)
+
+
 def hellinger_distance(p, q):
     """
     Compute the Hellinger distance between two probability distributions.
@@ -84,7 +84,7 @@ def barometric_height_old(p_high, p_low, T_high):
 
 
 def barometric_height(
-    pressure_profile, temperature_profile
+    pressure_profile, temperature_profile, axis: int = -1
 ) -> np.ndarray:
     """
     Calculate the barometric height from a pressure and temperature profile.
@@ -96,45 +96,46 @@ def barometric_height(
     with :math:`h` the height in meter, :math:`R` the universal gas constant, :math:`T` the temperature in Kelvin,
     :math:`M` the molar mass of air and :math:`g` earth's acceleration.
 
+    The input can also be a batch of profiles (e.g. (time, column, level)) with the vertical coordinate along ``axis``.
+    Each profile is flipped independently if needed, so that the surface is at index 0, and the heights are integrated
+    with a cumulative sum along the vertical axis.
+
     Args:
         pressure_profile: pressure profile (Pa)
         temperature_profile: temperature profile (K)
+        axis: vertical axis of the input arrays (default: last axis)
 
-    Returns: barometric height (m)
+    Returns: barometric height (m) with the vertical coordinate along ``axis``
 
     @author: Hanno Müller, Johannes Röttenbacher
     """
-    assert len(pressure_profile) == len(
-        temperature_profile
-    ), "Pressure and Temperature profile have to be of same length!"
+    pressure_profile = np.moveaxis(np.asarray(pressure_profile), axis, -1)
+    temperature_profile = np.moveaxis(np.asarray(temperature_profile), axis, -1)
+    assert pressure_profile.shape[-1] == temperature_profile.shape[
+        -1
+    ], "Pressure and Temperature profile have to be of same length!"
     g_geo = 9.81  # earth acceleration in m/s^2
     R = 8.314  # universal gas constant
     molar_mass_air = 0.02896  # kg/mol
-    # check if pressure profile is ascending (surface at index 0)
-    if pressure_profile[0] > pressure_profile[-1]:
-        pass
-    else:
-        pressure_profile = np.flip(pressure_profile)
+    # check if pressure profiles are ascending (surface at index 0), flip the ones which are not
+    flip = ~(pressure_profile[..., :1] > pressure_profile[..., -1:])
+    pressure_profile = np.where(flip, np.flip(pressure_profile, axis=-1), pressure_profile)
 
-    # check if temperature profile is ascending (surface at index 0)
-    if temperature_profile[0] > temperature_profile[-1]:
-        pass
-    else:
-        temperature_profile = np.flip(temperature_profile)
-
-    levels = len(pressure_profile)
-    barometric_height = np.zeros(levels)
-    p_low = pressure_profile[0]  # set p_low to surface pressure for first iteration
-    for j in range(1, levels):
-        p_high = pressure_profile[j]
-        t_high = temperature_profile[j]
+    # check if temperature profiles are ascending (surface at index 0), flip the ones which are not
+    flip = ~(temperature_profile[..., :1] > temperature_profile[..., -1:])
+    temperature_profile = np.where(flip, np.flip(temperature_profile, axis=-1), temperature_profile)
+
+    p_high, p_low = pressure_profile[..., 1:], pressure_profile[..., :-1]
+    t_high = temperature_profile[..., 1:]
+    with np.errstate(divide="ignore", invalid="ignore"):
         delta_h = -np.log(p_high / p_low) * R * t_high / (molar_mass_air * g_geo)
-        barometric_height[j] = barometric_height[j - 1] + delta_h
-        p_low = pressure_profile[j]
+    # the surface has a height of 0, integrate the height differences upward
+    barometric_height = np.zeros(pressure_profile.shape)
+    np.cumsum(delta_h, axis=-1, dtype=barometric_height.dtype, out=barometric_height[..., 1:])
 
     # replace top of atmosphere value (inf) with nan
     barometric_height = np.where(barometric_height == np.inf, np.nan, barometric_height)
-    return barometric_height
+    return np.moveaxis(barometric_height, -1, axis)
 
 
 def barometric_height_simple(pressure):
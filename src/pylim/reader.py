@@ -5,10 +5,16 @@
 """
 
 import datetime
+import hashlib
+import json
 import logging
 import os
 import re
+import shutil
 import warnings
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from typing import Iterator, Tuple
 
 import matplotlib.pyplot as plt
 import numpy as np
@@ -106,20 +112,171 @@ def read_lamp_file(campaign: str = "cirrus-hl", filename: str = None, plot: bool
     return lamp
 
 
-def read_smart_raw(path: str, filename: str) -> pd.DataFrame:
+# characters separating the numbers in date and time strings
+_time_separators = str.maketrans({c: " " for c in ":/-_T"})
+
+
+def _split_numeric_fields(values, n_fields: int) -> np.ndarray:
     """
-    Read raw SMART data files
+    Split fixed-layout date or time strings like ``hh mm ss.ss``, ``hh:mm:ss.fff`` or ``yyyy/mm/dd`` into numbers.
+    All strings are joined and parsed by numpy in one go instead of converting each row separately.
 
     Args:
-        path: Path where to find file
-        filename: Name of file
+        values: sequence of strings with n_fields numbers each
+        n_fields: number of numbers in each string
 
-    Returns: pandas DataFrame with column names and datetime index
+    Returns: float array with shape (len(values), n_fields)
 
     """
-    file = os.path.join(path, filename)
-    date_str, channel, _ = smart.get_info_from_filename(filename)
+    values = np.asarray(values, dtype=object)
+    text = " ".join(values.tolist()).translate(_time_separators)
+    try:
+        fields = np.array(text.split(), dtype=float)
+    except ValueError:
+        raise ValueError(f"Could not split time strings into {n_fields} numbers each, check input!")
+    if fields.size != values.size * n_fields:
+        raise ValueError(f"Could not split time strings into {n_fields} numbers each, check input!")
+
+    return fields.reshape(values.size, n_fields)
+
+
+def _decode_time(date, hours=0, minutes=0, seconds=0) -> np.ndarray:
+    """
+    Build datetime64[ns] values from a date and numeric time of day without any string parsing.
+    Whole seconds and the fraction of a second are converted separately to avoid rounding errors.
+    Time steps with non-finite fields (e.g. NaN seconds from gaps in the data) become NaT.
+
+    Args:
+        date: date of the measurement (ISO string, pd.Timestamp or datetime64) or array of (year, month, day) with
+            shape (n, 3)
+        hours: hours of the day
+        minutes: minutes of the hour
+        seconds: seconds including fractions, can be larger than 60 (e.g. seconds of the day)
+
+    Returns: array with datetime64[ns]
+
+    """
+    hours, minutes, seconds = (np.asarray(x, dtype=float) for x in (hours, minutes, seconds))
+    valid = np.isfinite(hours) & np.isfinite(minutes) & np.isfinite(seconds)
+    date = np.asarray(date)
+    if date.dtype.kind in "iuf":
+        # numeric year, month, day columns
+        valid = valid & np.isfinite(date).all(axis=-1)
+        year, month, day = (np.where(valid, date[..., i], 1).astype(np.int64) for i in range(3))
+        date = ((year - 1970).astype("datetime64[Y]").astype("datetime64[M]") + (month - 1)).astype("datetime64[D]") \
+               + (day - 1)
+    else:
+        date = date.astype("datetime64[D]")
+
+    # replace non-finite fields before the integer conversion and mask the result afterwards
+    hours, minutes, seconds = (np.where(valid, x, 0) for x in (hours, minutes, seconds))
+    whole_seconds = np.floor(seconds)
+    nanoseconds = (hours.astype(np.int64) * 3600 + minutes.astype(np.int64) * 60
+                   + whole_seconds.astype(np.int64)) * 1_000_000_000 \
+                  + np.round((seconds - whole_seconds) * 1e9).astype(np.int64)
+
+    time = date.astype("datetime64[ns]") + nanoseconds.astype("timedelta64[ns]")
+    return np.where(valid, time, np.datetime64("NaT", "ns"))
+
+
+# version of the binary cache layout written by read_smart_raw, increase when the layout changes
+_smart_raw_cache_version = 2
+
+
+def get_smart_raw_cache_dir() -> str:
+    """
+    Return the default directory for the binary cache files of raw SMART files.
+    It lies outside the data tree (``$XDG_CACHE_HOME/pylim/smart_raw`` or ``~/.cache/pylim/smart_raw``), so the cache
+    files never show up in searches for measurement or dark current files.
+
+    Returns: path to the cache directory
 
+    """
+    cache_home = os.environ.get("XDG_CACHE_HOME", os.path.join(os.path.expanduser("~"), ".cache"))
+    return os.path.join(cache_home, "pylim", "smart_raw")
+
+
+def _get_smart_raw_cache_file(file: str, cache_dir: str = None) -> str:
+    """
+    Return the path of the binary cache file belonging to a raw SMART file.
+    Cache files are grouped in sub directories named after a hash of the raw file directory, so files with the same
+    name from different folders do not overwrite each other.
+
+    Args:
+        file: complete path to the raw SMART file
+        cache_dir: directory for the cache files, defaults to :py:func:`get_smart_raw_cache_dir`
+
+    Returns: complete path to the cache file
+
+    """
+    directory, filename = os.path.split(os.path.abspath(file))
+    cache_dir = get_smart_raw_cache_dir() if cache_dir is None else cache_dir
+    subdir = hashlib.sha1(directory.encode()).hexdigest()[:16]
+    return os.path.join(cache_dir, subdir, f"{filename}.npz")
+
+
+def _read_smart_raw_cache(cache_file: str, stat: os.stat_result) -> dict:
+    """
+    Read a binary cache file of a raw SMART file if it is still valid.
+
+    Args:
+        cache_file: complete path to the cache file
+        stat: result of os.stat of the raw SMART file
+
+    Returns: dictionary with the arrays from the cache file or None if the cache does not exist or is outdated
+
+    """
+    try:
+        with np.load(cache_file) as cache:
+            if (cache["version"] != _smart_raw_cache_version or cache["size"] != stat.st_size
+                    or cache["mtime"] != stat.st_mtime_ns):
+                log.debug(f"Outdated cache {cache_file}")
+                return None
+            return {key: cache[key] for key in ["time", "t_int", "shutter", "counts"]}
+    except FileNotFoundError:
+        return None
+    except (OSError, ValueError, KeyError) as e:
+        log.warning(f"Could not read cache {cache_file}: {e}")
+        return None
+
+
+def _write_smart_raw_cache(cache_file: str, stat: os.stat_result, df: pd.DataFrame) -> None:
+    """
+    Write the content of a raw SMART file to a binary cache file.
+    The file is first written to a temporary file and then moved, so readers never see a partial cache.
+
+    Args:
+        cache_file: complete path to the cache file
+        stat: result of os.stat of the raw SMART file
+        df: DataFrame as returned by read_smart_raw
+
+    """
+    # unique per process, thread and call, so concurrent writers never share a temporary file
+    tmp_file = f"{cache_file}.{os.getpid()}.{uuid.uuid4().hex}.tmp"
+    try:
+        os.makedirs(os.path.dirname(cache_file) or ".", exist_ok=True)
+        with open(tmp_file, "wb") as f:
+            np.savez(f, version=_smart_raw_cache_version, size=stat.st_size, mtime=stat.st_mtime_ns,
+                     time=df.index.to_numpy(dtype="datetime64[ns]").view(np.int64),
+                     t_int=df["t_int"].to_numpy(), shutter=df["shutter"].to_numpy(),
+                     counts=df.iloc[:, 2:].to_numpy())
+        os.replace(tmp_file, cache_file)
+    except OSError as e:
+        log.warning(f"Could not write cache {cache_file}: {e}")
+        if os.path.exists(tmp_file):
+            os.remove(tmp_file)
+
+
+def _get_smart_raw_header(channel: str) -> list:
+    """
+    Return the column names of a raw SMART file.
+
+    Args:
+        channel: VNIR or SWIR
+
+    Returns: list with time, t_int, shutter and the pixel numbers
+
+    """
     if channel == "SWIR":
         pixels = list(range(1, 257))  # 256 pixels
     elif channel == "VNIR":
@@ -131,13 +288,122 @@ def read_smart_raw(path: str, filename: str) -> pd.DataFrame:
     header = ["time", "t_int", "shutter"]
     header.extend(pixels)
 
+    return header
+
+
+def _set_smart_raw_time_index(df: pd.DataFrame, date_str: str) -> pd.DataFrame:
+    """
+    Replace the time column of raw SMART data with a datetime index.
+
+    Args:
+        df: raw SMART data with a time column (hh mm ss.ss)
+        date_str: date of the measurement as given in the filename (yyyy_mm_dd)
+
+    Returns: DataFrame with datetime index
+
+    """
+    hms = _split_numeric_fields(df["time"], 3)
+    time = _decode_time(date_str.replace("_", "-"), hms[:, 0], hms[:, 1], hms[:, 2])
+
+    return df.set_index(pd.DatetimeIndex(time, name="time")).drop("time", axis=1)
+
+
+def read_smart_raw(path: str, filename: str, cache: bool = False, cache_dir: str = None) -> pd.DataFrame:
+    """
+    Read raw SMART data files
+
+    With ``cache=True`` the parsed content is stored in a binary cache file in ``cache_dir`` outside the data tree
+    (see :py:func:`get_smart_raw_cache_dir`). The cache holds the timestamps, the integration time, the shutter flag
+    and the counts with their original data types and is used instead of the text file as long as size and
+    modification time of the raw file do not change.
+
+    Args:
+        path: Path where to find file
+        filename: Name of file
+        cache: Read from and write to the binary cache?
+        cache_dir: Directory for the cache files (default: :py:func:`get_smart_raw_cache_dir`)
+
+    Returns: pandas DataFrame with column names and datetime index
+
+    """
+    file = os.path.join(path, filename)
+    date_str, channel, _ = smart.get_info_from_filename(filename)
+    header = _get_smart_raw_header(channel)
+    pixels = header[3:]
+
+    if cache:
+        stat = os.stat(file)
+        cache_file = _get_smart_raw_cache_file(file, cache_dir)
+        arrays = _read_smart_raw_cache(cache_file, stat)
+        if arrays is not None:
+            index = pd.DatetimeIndex(arrays["time"].view("datetime64[ns]"), name="time")
+            df = pd.DataFrame(arrays["counts"], index=index, columns=pixels, copy=False)
+            df.insert(0, "shutter", arrays["shutter"])
+            df.insert(0, "t_int", arrays["t_int"])
+            return df
+
     df = pd.read_csv(file, sep="\t", header=None, names=header)
-    datetime_str = date_str + " " + df["time"]
-    df = df.set_index(pd.to_datetime(datetime_str, format="%Y_%m_%d %H %M %S.%f")).drop("time", axis=1)
+    df = _set_smart_raw_time_index(df, date_str)
+
+    if cache:
+        _write_smart_raw_cache(cache_file, stat, df)
 
     return df
 
 
+def iter_smart_raw(path: str, filename: str, chunksize: int = 100000) -> Iterator[pd.DataFrame]:
+    """
+    Read a raw SMART file in chunks of rows, e.g. for merged files which do not fit into memory.
+    Memory use is bounded by the chunk size.
+    The chunks look like the output of :py:func:`read_smart_raw` and can be reduced one after another.
+
+    Examples:
+        >>> for chunk in iter_smart_raw(path, filename):
+        ...     dark_chunk = chunk[chunk.shutter == 0]
+
+    Args:
+        path: Path where to find file
+        filename: Name of file
+        chunksize: number of rows per chunk
+
+    Yields: pandas DataFrame with column names and datetime index
+
+    """
+    file = os.path.join(path, filename)
+    date_str, channel, _ = smart.get_info_from_filename(filename)
+    header = _get_smart_raw_header(channel)
+    with pd.read_csv(file, sep="\t", header=None, names=header, chunksize=chunksize) as reader:
+        for df in reader:
+            yield _set_smart_raw_time_index(df, date_str)
+
+
+def mean_smart_raw(path: str, filename: str, shutter: int = None, chunksize: int = 100000) -> pd.Series:
+    """
+    Calculate the mean over time of each pixel of a raw SMART file while streaming it with :py:func:`iter_smart_raw`.
+
+    Args:
+        path: Path where to find file
+        filename: Name of file
+        shutter: only use rows with this shutter flag (1 = open, 0 = closed), None uses all rows
+        chunksize: number of rows per chunk
+
+    Returns: pandas Series with the mean counts of each pixel
+
+    """
+    _, channel, _ = smart.get_info_from_filename(filename)
+    pixels = _get_smart_raw_header(channel)[3:]
+    total, count = np.zeros(len(pixels)), np.zeros(len(pixels))
+    for chunk in iter_smart_raw(path, filename, chunksize=chunksize):
+        if shutter is not None:
+            chunk = chunk[chunk["shutter"] == shutter]
+        counts = chunk.iloc[:, 2:].to_numpy()
+        total += np.nansum(counts, axis=0, dtype=np.float64)
+        count += np.sum(~np.isnan(counts), axis=0)
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return pd.Series(total / count, index=pixels)
+
+
 def read_smart_cor(path: str, filename: str) -> pd.DataFrame:
     """
         Read dark current corrected SMART data files
@@ -177,6 +443,382 @@ def read_pixel_to_wavelength(path: str, spectrometer: str) -> pd.DataFrame:
     return df
 
 
+# filename endings of the different SMART processing levels
+_smart_file_suffixes = dict(raw="", cor="_cor", calibrated="_cor_calibrated_norm")
+
+
+def _find_smart_files(path: str, direction: str, channel: str, kind: str) -> list:
+    """
+    Find all SMART files of one inlet and channel with the given processing level in a directory.
+
+    Args:
+        path: directory to search
+        direction: measured property and direction (e.g. Fdw)
+        channel: VNIR or SWIR
+        kind: processing level, raw, cor (dark current corrected) or calibrated
+
+    Returns: sorted list of filenames
+
+    """
+    ending = f"{direction}_{channel}{_smart_file_suffixes[kind]}.dat"
+    files = list()
+    for filename in sorted(os.listdir(path)):
+        if not filename.endswith(ending):
+            continue
+        try:
+            _, file_channel, file_direction = smart.get_info_from_filename(filename)
+        except AttributeError:
+            continue
+        if file_channel == channel and file_direction == direction:
+            files.append(filename)
+    if len(files) == 0:
+        raise FileNotFoundError(f"No {kind} SMART files found for {direction}_{channel} in {path}!")
+
+    return files
+
+
+def _get_smart_wavelength(campaign: str, direction: str, channel: str, pixel: np.ndarray) -> np.ndarray:
+    """
+    Return the wavelength of each pixel of a SMART spectrometer.
+
+    Args:
+        campaign: campaign name (cirrus-hl or halo-ac3)
+        direction: measured property and direction (e.g. Fdw)
+        channel: VNIR or SWIR
+        pixel: pixel numbers
+
+    Returns: wavelength in nm for each pixel
+
+    """
+    pixel_wl = read_pixel_to_wavelength(h.get_path("pixel_wl", campaign=campaign),
+                                        smart.meta[campaign][f"{direction}_{channel}"])
+
+    return pixel_wl.set_index("pixel")["wavelength"].reindex(pixel).to_numpy()
+
+
+def _get_smart_calibrated_attrs(direction: str) -> Tuple[str, str]:
+    """Return long name and units of calibrated SMART data for the given direction (F: irradiance, I: radiance)"""
+    if direction.startswith("F"):
+        return "Spectral irradiance", "W m-2 nm-1"
+    else:
+        return "Spectral radiance", "W m-2 sr-1 nm-1"
+
+
+def _read_smart_file_arrays(path: str, filename: str, kind: str) -> dict:
+    """
+    Read one SMART file and return its content as numpy arrays, used as worker in :py:func:`read_smart_flight`.
+
+    Args:
+        path: Path where to find file
+        filename: Name of file
+        kind: processing level of the file (raw, cor or calibrated)
+
+    Returns: dictionary with time (datetime64[ns]), values (float32, time x pixel), pixel and for raw files t_int and
+        shutter
+
+    """
+    if kind == "raw":
+        df = read_smart_raw(path, filename)
+        arrays = dict(t_int=df["t_int"].to_numpy(), shutter=df["shutter"].to_numpy())
+        df = df.iloc[:, 2:]  # remove columns t_int and shutter
+    else:
+        df = read_smart_cor(path, filename)
+        arrays = dict()
+    arrays["time"] = df.index.to_numpy(dtype="datetime64[ns]")
+    arrays["values"] = df.to_numpy(dtype=np.float32)
+    arrays["pixel"] = df.columns.to_numpy()
+
+    return arrays
+
+
+def read_smart_flight(flight: str, direction: str, channel: str, kind: str = "raw", campaign: str = "cirrus-hl",
+                      path: str = None, n_jobs: int = None) -> xr.Dataset:
+    """
+    Read all SMART files of one flight for one inlet and channel into one Dataset.
+    The files are found using :py:func:`pylim.smart.get_info_from_filename` and read in parallel processes.
+
+    Args:
+        flight: flight name as used in the config.toml (e.g. Flight_20210625a)
+        direction: measured property and direction (e.g. Fdw)
+        channel: VNIR or SWIR
+        kind: processing level, raw, cor (dark current corrected) or calibrated
+        campaign: campaign name (cirrus-hl or halo-ac3)
+        path: path to the files if not the default from config.toml
+        n_jobs: number of processes to use (default: number of cores), 1 reads all files in this process
+
+    Returns: Dataset with dimensions time and pixel and wavelength as coordinate on pixel
+
+    """
+    if kind not in _smart_file_suffixes:
+        raise ValueError(f"kind has to be one of {list(_smart_file_suffixes)}!")
+    if path is None:
+        path_keys = dict(raw="raw", cor="data", calibrated="calibrated")
+        path = h.get_path(path_keys[kind], flight, campaign)
+
+    files = _find_smart_files(path, direction, channel, kind)
+    log.debug(f"Reading {len(files)} files from {path}")
+
+    if n_jobs == 1 or len(files) == 1:
+        results = [_read_smart_file_arrays(path, filename, kind) for filename in files]
+    else:
+        with ProcessPoolExecutor(max_workers=n_jobs) as executor:
+            results = list(executor.map(_read_smart_file_arrays, [path] * len(files), files, [kind] * len(files)))
+
+    # concatenate all files at once
+    time = np.concatenate([r["time"] for r in results])
+    values = np.concatenate([r["values"] for r in results])
+    pixel = results[0]["pixel"].astype(int)
+
+    if kind == "calibrated":
+        var_name = direction
+        long_name, units = _get_smart_calibrated_attrs(direction)
+    else:
+        var_name = "counts"
+        units = "1"
+        long_name = "Raw counts" if kind == "raw" else "Dark current corrected counts"
+    ds = xr.Dataset({var_name: (["time", "pixel"], values, dict(long_name=long_name, units=units))},
+                    coords=dict(time=time, pixel=pixel))
+    if kind == "raw":
+        ds["t_int"] = ("time", np.concatenate([r["t_int"] for r in results]),
+                       dict(long_name="Integration time", units="ms"))
+        ds["shutter"] = ("time", np.concatenate([r["shutter"] for r in results]),
+                         dict(long_name="Shutter flag"))
+
+    # add the wavelength of each pixel
+    wavelength = _get_smart_wavelength(campaign, direction, channel, pixel)
+    ds = ds.assign_coords(wavelength=("pixel", wavelength, dict(long_name="Wavelength", units="nm")))
+
+    return ds
+
+
+def get_smart_store_path(path: str, direction: str, channel: str) -> str:
+    """
+    Return the default location of the spectral store for calibrated SMART files of one inlet and channel.
+
+    Args:
+        path: directory with the calibrated SMART files of one flight
+        direction: measured property and direction (e.g. Fdw)
+        channel: VNIR or SWIR
+
+    Returns: path to the spectral store directory
+
+    """
+    return os.path.join(path, f"{direction}_{channel}_store")
+
+
+def write_smart_store(path: str, direction: str, channel: str, campaign: str = "cirrus-hl",
+                      store_path: str = None) -> str:
+    """
+    Write all calibrated SMART files of one flight, inlet and channel into a binary spectral store.
+
+    The store is a directory containing the spectra as a raw float32 (time, pixel) array, which is opened as a memory
+    map, the sorted time index, pixel numbers, wavelengths and a json file with the shape, the row offset and the size
+    and modification time of each source file.
+    The files are converted one after another, so memory use is bounded by the largest file.
+    The store is written to a temporary directory first and then moved into place, so an existing store is only
+    replaced by a complete one.
+
+    Args:
+        path: directory with the calibrated SMART files of one flight
+        direction: measured property and direction (e.g. Fdw)
+        channel: VNIR or SWIR
+        campaign: campaign name (cirrus-hl or halo-ac3)
+        store_path: where to write the store (default: see :py:func:`get_smart_store_path`)
+
+    Returns: path to the spectral store directory
+
+    """
+    store_path = get_smart_store_path(path, direction, channel) if store_path is None else store_path
+    store_path = os.path.abspath(store_path)
+    files = _find_smart_files(path, direction, channel, "calibrated")
+    sources = [_get_smart_store_source(path, filename) for filename in files]
+    final_path, store_path = store_path, f"{store_path}.{os.getpid()}.{uuid.uuid4().hex}.tmp"
+    try:
+        _write_smart_store_files(path, files, store_path, direction, channel, campaign, sources)
+        if os.path.exists(final_path):
+            # move the old store out of the way, a directory can only be replaced by os.replace if it is empty
+            old_path = f"{store_path}.old"
+            os.replace(final_path, old_path)
+            os.replace(store_path, final_path)
+            shutil.rmtree(old_path)
+        else:
+            os.replace(store_path, final_path)
+    finally:
+        if os.path.exists(store_path):
+            shutil.rmtree(store_path)
+    log.info(f"Saved spectral store {final_path}")
+
+    return final_path
+
+
+def _get_smart_store_source(path: str, filename: str) -> dict:
+    """Return the name, size and modification time of a source file of a spectral store"""
+    stat = os.stat(os.path.join(path, filename))
+    return dict(file=filename, size=stat.st_size, mtime=stat.st_mtime_ns)
+
+
+def _write_smart_store_files(path: str, files: list, store_path: str, direction: str, channel: str, campaign: str,
+                             sources: list) -> None:
+    """
+    Write the content of a spectral store to ``store_path``, used by :py:func:`write_smart_store`.
+
+    Args:
+        path: directory with the calibrated SMART files of one flight
+        files: calibrated SMART files to convert
+        store_path: directory to write the store files to
+        direction: measured property and direction (e.g. Fdw)
+        channel: VNIR or SWIR
+        campaign: campaign name (cirrus-hl or halo-ac3)
+        sources: name, size and modification time of the source files as returned by _get_smart_store_source
+
+    """
+    h.make_dir(store_path)
+    times, offsets, n_rows, pixel = list(), list(), 0, None
+    with open(os.path.join(store_path, "spectra.f32"), "wb") as f:
+        for filename in files:
+            df = read_smart_cor(path, filename)
+            pixel = df.columns.to_numpy(dtype=int) if pixel is None else pixel
+            f.write(df.to_numpy(dtype=np.float32).tobytes())
+            times.append(df.index.to_numpy(dtype="datetime64[ns]"))
+            offsets.append(n_rows)
+            n_rows += len(df)
+
+    time = np.concatenate(times)
+    if np.any(np.diff(time) < np.timedelta64(0)):
+        # files overlap, sort the rows of the store by time
+        log.info("Sorting spectral store by time")
+        order = np.argsort(time, kind="stable")
+        spectra_file = os.path.join(store_path, "spectra.f32")
+        tmp_file = f"{spectra_file}.tmp"
+        spectra = np.memmap(spectra_file, dtype=np.float32, mode="r", shape=(n_rows, len(pixel)))
+        spectra_sorted = np.memmap(tmp_file, dtype=np.float32, mode="w+", shape=(n_rows, len(pixel)))
+        # copy in blocks of the largest file to keep the memory use bounded
+        block = max(len(t) for t in times)
+        for start in range(0, n_rows, block):
+            spectra_sorted[start:start + block] = spectra[order[start:start + block]]
+        spectra_sorted.flush()
+        del spectra, spectra_sorted
+        os.replace(tmp_file, spectra_file)
+        time = time[order]
+        row_of = np.empty_like(order)
+        row_of[order] = np.arange(n_rows)
+    else:
+        row_of = np.arange(n_rows)
+
+    np.save(os.path.join(store_path, "time.npy"), time)
+    np.save(os.path.join(store_path, "row.npy"), row_of)
+    np.save(os.path.join(store_path, "pixel.npy"), pixel)
+    np.save(os.path.join(store_path, "wavelength.npy"), _get_smart_wavelength(campaign, direction, channel, pixel))
+    metadata = dict(direction=direction, channel=channel, campaign=campaign, shape=[n_rows, len(pixel)],
+                    files=files, offsets=offsets, rows=[len(t) for t in times], path=os.path.abspath(path),
+                    sources=sources)
+    with open(os.path.join(store_path, "metadata.json"), "w") as f:
+        json.dump(metadata, f, indent=2)
+
+
+def _read_smart_store_metadata(store_path: str) -> dict:
+    """Read the metadata of a spectral store"""
+    with open(os.path.join(store_path, "metadata.json")) as f:
+        return json.load(f)
+
+
+def _check_smart_store(store_path: str, metadata: dict, files: list = None) -> None:
+    """
+    Check that the source files of a spectral store did not change since it was written.
+
+    Args:
+        store_path: path to the spectral store directory
+        metadata: metadata of the store
+        files: only check these source files, default: check all source files and look for new files
+
+    Raises: ValueError if the store is outdated
+
+    """
+    if "sources" not in metadata:
+        raise ValueError(f"{store_path} was written without source file information, rewrite it with "
+                         f"write_smart_store!")
+    path = metadata["path"]
+    for source in metadata["sources"]:
+        if files is not None and source["file"] not in files:
+            continue
+        try:
+            current = _get_smart_store_source(path, source["file"])
+        except FileNotFoundError:
+            current = None
+        if current != source:
+            raise ValueError(f"{source['file']} changed since {store_path} was written, rewrite it with "
+                             f"write_smart_store!")
+    if files is None:
+        try:
+            found = _find_smart_files(path, metadata["direction"], metadata["channel"], "calibrated")
+        except FileNotFoundError:
+            found = list()
+        if found != metadata["files"]:
+            raise ValueError(f"The calibrated files in {path} changed since {store_path} was written, rewrite it "
+                             f"with write_smart_store!")
+
+
+def open_smart_store(store_path: str) -> xr.Dataset:
+    """
+    Open a spectral store written by :py:func:`write_smart_store`.
+    The spectra are backed by a read-only memory map, so selecting one spectrum or one wavelength only reads the
+    needed pages from disk.
+    Stores whose source files were changed, removed or added since they were written are rejected.
+
+    Args:
+        store_path: path to the spectral store directory
+
+    Returns: Dataset with dimensions time and pixel and wavelength as coordinate on pixel
+
+    """
+    metadata = _read_smart_store_metadata(store_path)
+    _check_smart_store(store_path, metadata)
+    spectra = np.memmap(os.path.join(store_path, "spectra.f32"), dtype=np.float32, mode="r",
+                        shape=tuple(metadata["shape"]))
+    direction = metadata["direction"]
+    long_name, units = _get_smart_calibrated_attrs(direction)
+    ds = xr.Dataset({direction: (["time", "pixel"], spectra, dict(long_name=long_name, units=units))},
+                    coords=dict(time=np.load(os.path.join(store_path, "time.npy")),
+                                pixel=np.load(os.path.join(store_path, "pixel.npy"))))
+    ds = ds.assign_coords(wavelength=("pixel", np.load(os.path.join(store_path, "wavelength.npy")),
+                                      dict(long_name="Wavelength", units="nm")))
+    ds.attrs = dict(channel=metadata["channel"], campaign=metadata["campaign"])
+
+    return ds
+
+
+def read_smart_store_row(store_path: str, filename: str, index: int) -> pd.Series:
+    """
+    Read one spectrum of a calibrated SMART file from its spectral store.
+    Equivalent to ``read_smart_cor(path, filename).iloc[index, :]`` without parsing the file.
+    The store is rejected if the file changed since the store was written.
+
+    Args:
+        store_path: path to the spectral store directory
+        filename: name of the calibrated SMART file
+        index: row in the file (negative values count from the end)
+
+    Returns: pandas Series with the spectrum, the pixel number as index and the time stamp as name
+
+    """
+    metadata = _read_smart_store_metadata(store_path)
+    try:
+        file_id = metadata["files"].index(filename)
+    except ValueError as e:
+        raise FileNotFoundError(f"{filename} is not part of the spectral store {store_path}!") from e
+    _check_smart_store(store_path, metadata, files=[filename])
+    n_rows = metadata["rows"][file_id]
+    if not -n_rows <= index < n_rows:
+        raise IndexError("single positional indexer is out-of-bounds")
+    row = np.load(os.path.join(store_path, "row.npy"), mmap_mode="r")[metadata["offsets"][file_id] + index % n_rows]
+    spectra = np.memmap(os.path.join(store_path, "spectra.f32"), dtype=np.float32, mode="r",
+                        shape=tuple(metadata["shape"]))
+    time = np.load(os.path.join(store_path, "time.npy"), mmap_mode="r")[row]
+
+    return pd.Series(np.array(spectra[row], dtype=float), index=np.load(os.path.join(store_path, "pixel.npy")),
+                     name=pd.Timestamp(time))
+
+
 def read_stabbi_data(stabbi_path: str) -> pd.DataFrame:
     """
     Read in stabilization platform data from SMART.
@@ -188,7 +830,8 @@ def read_stabbi_data(stabbi_path: str) -> pd.DataFrame:
 
     """
     df = pd.read_csv(stabbi_path, skipinitialspace=True, sep="\t")
-    df["PCTIME"] = pd.to_datetime(df["DATE"] + " " + df["PCTIME"], format='%Y/%m/%d %H:%M:%S.%f')
+    hms = _split_numeric_fields(df["PCTIME"], 3)
+    df["PCTIME"] = _decode_time(_split_numeric_fields(df["DATE"], 3), hms[:, 0], hms[:, 1], hms[:, 2])
     df.set_index("PCTIME", inplace=True)
     df.index.name = "time"
 
@@ -213,7 +856,7 @@ def read_nav_data(nav_path: str) -> pd.DataFrame:
     start_date = pd.Timestamp(year=start_time.year, month=start_time.month, day=start_time.day)
     header = ["marker", "seconds", "roll", "pitch", "yaw", "AccS_X", "AccS_Y", "AccS_Z", "OmgS_X", "OmgS_Y", "OmgS_Z"]
     nav = pd.read_csv(nav_path, sep="\s+", skiprows=13, header=None, names=header, encoding="cp1252")
-    nav["time"] = pd.to_datetime(nav["seconds"], origin=start_date, unit="s")
+    nav["time"] = _decode_time(start_date, seconds=nav["seconds"].to_numpy())
     nav = nav.set_index("time")
 
     return nav
@@ -236,7 +879,7 @@ def read_ins_gps_pos(filepath: str) -> pd.DataFrame:
     start_date = pd.Timestamp(year=start_time.year, month=start_time.month, day=start_time.day)
     header = ["marker", "seconds", "lon", "lat", "alt", "lon_std", "lat_std", "alt_std"]
     df = pd.read_csv(filepath, sep="\s+", skiprows=10, header=None, names=header, encoding="cp1252")
-    df["time"] = pd.to_datetime(df["seconds"], origin=start_date, unit="s")
+    df["time"] = _decode_time(start_date, seconds=df["seconds"].to_numpy())
     df = df.set_index("time")
 
     return df
@@ -259,7 +902,7 @@ def read_ins_gps_vel(filepath: str) -> pd.DataFrame:
     start_date = pd.Timestamp(year=start_time.year, month=start_time.month, day=start_time.day)
     header = ["marker", "seconds", "v_east", "v_north", "v_up", "v_east_std", "v_north_std", "v_up_std"]
     df = pd.read_csv(filepath, sep="\s+", skiprows=10, header=None, names=header, encoding="cp1252")
-    df["time"] = pd.to_datetime(df["seconds"], origin=start_date, unit="s")
+    df["time"] = _decode_time(start_date, seconds=df["seconds"].to_numpy())
     df = df.set_index("time")
 
     return df
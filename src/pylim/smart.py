@@ -19,9 +19,11 @@ The reader functions were moved to :py:mod:`pylim.reader`.
 *author*: Johannes Röttenbacher
 """
 
+import json
 import logging
 import os
 import re
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from typing import Tuple, Union
 
 import holoviews as hv
@@ -30,6 +32,7 @@ import numpy as np
 import pandas as pd
 import xarray as xr
 from holoviews import opts
+from scipy import sparse
 
 from pylim import helpers as h
 from pylim import reader
@@ -90,6 +93,8 @@ def find_pixel(df: pd.DataFrame, wavelength: float()) -> Tuple[int, float]:
 def merge_vnir_swir_nc(vnir: xr.Dataset, swir: xr.Dataset) -> xr.Dataset:
     """
     Merge the SMART nc files generated by smart_write_ncfile.py
+    See :py:func:`stitch_vnir_swir` to combine both channels into one spectrum without overlap.
+
     Args:
         vnir: VNIR data set
         swir: SWIR data set
@@ -107,6 +112,131 @@ def merge_vnir_swir_nc(vnir: xr.Dataset, swir: xr.Dataset) -> xr.Dataset:
     return all
 
 
+def get_stitching_plan(vnir_wavelength: np.ndarray, swir_wavelength: np.ndarray, cutoff: float = None) -> dict:
+    """
+    Plan how to stitch VNIR and SWIR spectra to one spectrum sorted by wavelength.
+    In the overlap region VNIR is used up to the cutoff wavelength and SWIR above it.
+
+    Args:
+        vnir_wavelength: wavelength of each VNIR pixel (e.g. read_pixel_to_wavelength(...)["wavelength"])
+        swir_wavelength: wavelength of each SWIR pixel
+        cutoff: wavelength in nm where to switch from VNIR to SWIR (default: middle of the overlap region)
+
+    Returns: dictionary with the positions of the VNIR and SWIR pixels to use (vnir_index, swir_index) sorted by
+        wavelength, the resulting wavelength and the cutoff
+
+    """
+    vnir_wavelength = np.asarray(vnir_wavelength, dtype=float)
+    swir_wavelength = np.asarray(swir_wavelength, dtype=float)
+    if cutoff is None:
+        overlap = np.nanmin(swir_wavelength), np.nanmax(vnir_wavelength)
+        cutoff = (overlap[0] + overlap[1]) / 2 if overlap[0] < overlap[1] else overlap[1]
+    vnir_index = np.flatnonzero(vnir_wavelength <= cutoff)
+    vnir_index = vnir_index[np.argsort(vnir_wavelength[vnir_index], kind="stable")]
+    swir_index = np.flatnonzero(swir_wavelength > cutoff)
+    swir_index = swir_index[np.argsort(swir_wavelength[swir_index], kind="stable")]
+    wavelength = np.concatenate([vnir_wavelength[vnir_index], swir_wavelength[swir_index]])
+
+    return dict(vnir_index=vnir_index, swir_index=swir_index, wavelength=wavelength, cutoff=cutoff)
+
+
+# interpolation matrices already built in this process, keyed by input and output wavelength
+_resampling_matrices = dict()
+
+
+def get_resampling_matrix(wavelength: np.ndarray, wavelength_grid: np.ndarray) -> sparse.csr_matrix:
+    """
+    Return a sparse matrix which linearly interpolates spectra from wavelength onto wavelength_grid.
+    Matrices are cached, so the same grids are only set up once per process.
+    Grid points outside of the input wavelength range or NaN get no weights and are set to NaN by
+    :py:func:`stitch_vnir_swir`.
+    Input pixels without a wavelength (NaN) are not used.
+    Neighbours with zero weight are left out of the matrix, so a NaN in them does not spread to the grid point.
+
+    Args:
+        wavelength: sorted input wavelength
+        wavelength_grid: output wavelength
+
+    Returns: sparse matrix with shape (len(wavelength_grid), len(wavelength))
+
+    """
+    wavelength = np.asarray(wavelength, dtype=float)
+    wavelength_grid = np.asarray(wavelength_grid, dtype=float)
+    key = (wavelength.tobytes(), wavelength_grid.tobytes())
+    if key not in _resampling_matrices:
+        columns = np.flatnonzero(np.isfinite(wavelength))
+        wl = wavelength[columns]
+        # only grid points inside the input range are interpolated, this also drops NaN grid points
+        if len(wl) > 0:
+            inside = (wavelength_grid >= wl[0]) & (wavelength_grid <= wl[-1])
+        else:
+            inside = np.zeros(wavelength_grid.shape, dtype=bool)
+        rows = np.flatnonzero(inside)
+        grid = wavelength_grid[rows]
+        right = np.clip(np.searchsorted(wl, grid), 1, max(len(wl) - 1, 1))
+        left = np.minimum(right - 1, len(wl) - 1)
+        right = np.minimum(right, len(wl) - 1)
+        step = wl[right] - wl[left]
+        weight = np.divide(grid - wl[left], step, out=np.zeros(grid.shape), where=step > 0)
+        data = np.concatenate([1 - weight, weight])
+        rows = np.concatenate([rows, rows])
+        cols = np.concatenate([columns[left], columns[right]])
+        nonzero = data > 0
+        matrix = sparse.csr_matrix((data[nonzero], (rows[nonzero], cols[nonzero])),
+                                   shape=(len(wavelength_grid), len(wavelength)))
+        _resampling_matrices[key] = matrix
+
+    return _resampling_matrices[key]
+
+
+def stitch_vnir_swir(vnir: xr.DataArray, swir: xr.DataArray, plan: dict = None, wavelength_grid: np.ndarray = None,
+                     dtype=np.float32) -> xr.DataArray:
+    """
+    Stitch VNIR and SWIR spectra with dimensions (time, wavelength or pixel) to one spectrum per time step.
+
+    The pixels given by the plan are copied directly into one preallocated (time, wavelength) array, without aligning
+    and copying both inputs like :py:func:`merge_vnir_swir_nc`.
+    Optionally the result is resampled onto a (uniform) wavelength grid with a cached sparse interpolation matrix.
+
+    Args:
+        vnir: VNIR data (time, wavelength/pixel)
+        swir: SWIR data (time, wavelength/pixel) with the same time steps
+        plan: stitching plan from :py:func:`get_stitching_plan` (default: from the wavelength coordinates)
+        wavelength_grid: wavelength to resample the stitched spectra on (e.g. np.arange(320, 2100, 1))
+        dtype: data type of the output
+
+    Returns: DataArray with dimensions (time, wavelength)
+
+    """
+    if not np.array_equal(vnir.time, swir.time):
+        log.info("Time steps of VNIR and SWIR differ, using common time steps only")
+        vnir, swir = xr.align(vnir, swir, join="inner", exclude=[d for d in vnir.dims if d != "time"])
+    if plan is None:
+        plan = get_stitching_plan(vnir.wavelength, swir.wavelength)
+    vnir_values, swir_values = vnir.transpose("time", ...).values, swir.transpose("time", ...).values
+    for channel, values in (("vnir", vnir_values), ("swir", swir_values)):
+        index = plan[f"{channel}_index"]
+        if len(index) > 0 and (index.min() < 0 or index.max() >= values.shape[1]):
+            raise ValueError(f"Stitching plan does not fit the {channel.upper()} data! Pixel index "
+                             f"{index.min()}..{index.max()} outside of 0..{values.shape[1] - 1}")
+    n_vnir = len(plan["vnir_index"])
+    stitched = np.empty((vnir_values.shape[0], len(plan["wavelength"])), dtype=dtype)
+    # the indices were checked above, "wrap" avoids a second bounds check with buffering
+    np.take(vnir_values, plan["vnir_index"], axis=1, out=stitched[:, :n_vnir], mode="wrap")
+    np.take(swir_values, plan["swir_index"], axis=1, out=stitched[:, n_vnir:], mode="wrap")
+    wavelength = plan["wavelength"]
+
+    if wavelength_grid is not None:
+        matrix = get_resampling_matrix(wavelength, wavelength_grid)
+        outside = np.diff(matrix.indptr) == 0  # grid points without input data
+        stitched = np.asarray(matrix.dot(stitched.T).T, dtype=dtype)
+        stitched[:, outside] = np.nan
+        wavelength = np.asarray(wavelength_grid, dtype=float)
+
+    return xr.DataArray(stitched, coords=dict(time=vnir.time.values, wavelength=wavelength),
+                        dims=["time", "wavelength"], name=vnir.name, attrs=vnir.attrs)
+
+
 def _plot_dark_current(wavelengths: Union[pd.Series, list], dark_current: Union[pd.Series, list], filename: str,
                        **kwargs):
     """
@@ -136,6 +266,293 @@ def _plot_dark_current(wavelengths: Union[pd.Series, list], dark_current: Union[
     plt.close()
 
 
+# calibration catalogs already built in this process, keyed by calibration path
+_calibration_catalogs = dict()
+
+
+def _scan_calibration_dir(dirs: dict, dirpath: str) -> None:
+    """
+    Scan a directory of the calibration tree and all its new sub directories and add them to the catalog.
+
+    Args:
+        dirs: directory entries of the catalog (dirpath: dict(mtime, subdirs, files))
+        dirpath: directory to scan
+
+    """
+    try:
+        mtime = os.stat(dirpath).st_mtime_ns
+        with os.scandir(dirpath) as entries:
+            entries = list(entries)
+    except FileNotFoundError:
+        _remove_calibration_dir(dirs, dirpath)
+        return
+    subdirs = [e.path for e in entries if e.is_dir()]
+    files = [e.name for e in entries if e.is_file()]
+    old_subdirs = dirs[dirpath]["subdirs"] if dirpath in dirs else []
+    dirs[dirpath] = dict(mtime=mtime, subdirs=subdirs, files=files)
+    for subdir in old_subdirs:
+        if subdir not in subdirs:
+            _remove_calibration_dir(dirs, subdir)
+    for subdir in subdirs:
+        if subdir not in dirs:
+            _scan_calibration_dir(dirs, subdir)
+
+
+def _remove_calibration_dir(dirs: dict, dirpath: str) -> None:
+    """Remove a directory and all its sub directories from the catalog"""
+    entry = dirs.pop(dirpath, None)
+    if entry is not None:
+        for subdir in entry["subdirs"]:
+            _remove_calibration_dir(dirs, subdir)
+
+
+def _walk_calibration_dirs(dirs: dict, dirpath: str):
+    """Yield directory path and file names of the catalog top down like os.walk"""
+    if dirpath not in dirs:
+        return
+    yield dirpath, dirs[dirpath]["files"]
+    for subdir in dirs[dirpath]["subdirs"]:
+        yield from _walk_calibration_dirs(dirs, subdir)
+
+
+def _index_calibration_dirs(catalog: dict) -> None:
+    """
+    Build the lookup tables of a calibration catalog from its directory entries.
+
+    * dark: dark current files from any folder below an instrument folder with "dark" in its path (option 2),
+      key (instrument, date, integration time, direction, channel)
+    * transfer_dark: dark current files of a transfer calibration folder (option 3),
+      key (transfer calibration folder, integration time, direction, channel)
+
+    Dates are all 8-digit numbers in the path above the dark current folder and integration times are all numbers
+    followed by "ms" in the name of the dark current folder (e.g. ASP06_J3_dark_300ms), so instrument and inlet numbers
+    are not mistaken for integration times.
+
+    Args:
+        catalog: calibration catalog with the directory entries
+
+    """
+    root, dirs = catalog["path"], catalog["dirs"]
+    dark, transfer_dark = dict(), dict()
+    for dirpath, files in _walk_calibration_dirs(dirs, root):
+        smart_files = dict()
+        for file in files:
+            match = re.search(r"\.(?P<direction>[FI][a-z]{2})_(?P<channel>[A-Z]{4})\.dat$", file)
+            if match is not None:
+                smart_files.setdefault((match.group("direction"), match.group("channel")), []).append(file)
+        if len(smart_files) == 0:
+            continue
+        d_path, d = os.path.split(dirpath)
+        t_ints = {int(t) for t in re.findall(r"(\d+)ms", d)}
+        # option 2: the last matching folder wins like in the former os.walk search
+        instruments = {m.group(1) for m in re.finditer(r"(ASP\d{2})(?=.*dark)", dirpath)}
+        dates = set(re.findall(r"\d{8}", d_path))
+        for instrument in instruments:
+            for date in dates:
+                for t_int in t_ints:
+                    for (direction, channel), dark_files in smart_files.items():
+                        dark[(instrument, date, t_int, direction, channel)] = (dirpath, dark_files)
+        # option 3: dark current folders directly in a transfer calibration folder, the first folder wins
+        if os.path.dirname(d_path) == root and "_transfer_calib_" in os.path.basename(d_path) and "dark" in d:
+            for t_int in t_ints:
+                for (direction, channel), dark_files in smart_files.items():
+                    transfer_dark.setdefault((os.path.basename(d_path), t_int, direction, channel),
+                                             (dirpath, dark_files))
+    catalog["dark"], catalog["transfer_dark"] = dark, transfer_dark
+
+
+def get_calibration_catalog(calib_path: str, refresh: bool = False) -> dict:
+    """
+    Return the catalog of the calibration directory of a campaign.
+    The directory tree is walked only once per process.
+    A refresh checks the modification time of all known directories and only rescans those which changed.
+
+    Args:
+        calib_path: path to the calibration directory (see config.toml)
+        refresh: check the directory tree for changes
+
+    Returns: dictionary with the directory entries (dirs) and the lookup tables for dark current files (dark,
+        transfer_dark), see :py:func:`find_dark_current_file`
+
+    """
+    calib_path = os.path.normpath(calib_path)
+    catalog = _calibration_catalogs.get(calib_path)
+    if catalog is None:
+        log.debug(f"Building calibration catalog for {calib_path}")
+        catalog = dict(path=calib_path, dirs=dict())
+        _scan_calibration_dir(catalog["dirs"], calib_path)
+        _index_calibration_dirs(catalog)
+        _calibration_catalogs[calib_path] = catalog
+    elif refresh:
+        dirs = catalog["dirs"]
+        changed = False
+        for dirpath in list(dirs):
+            if dirpath not in dirs:
+                continue  # removed together with its parent
+            try:
+                mtime = os.stat(dirpath).st_mtime_ns
+            except FileNotFoundError:
+                mtime = None
+            if mtime != dirs[dirpath]["mtime"]:
+                _scan_calibration_dir(dirs, dirpath)
+                changed = True
+        if changed:
+            _index_calibration_dirs(catalog)
+
+    return catalog
+
+
+def find_dark_current_file(calib_path: str, option: int, spectrometer: str, direction: str, channel: str,
+                           t_int: int, date: str) -> Tuple[str, str]:
+    """
+    Look up the dark current file for a measurement in the calibration catalog.
+    The catalog is refreshed once if no unique, existing file is found, so new, merged or deleted calibration files are
+    picked up automatically.
+
+    Args:
+        calib_path: path to the calibration directory (see config.toml)
+        option: 2 (CIRRUS-HL folder structure) or 3 (HALO-AC3 transfer calibration folder structure)
+        spectrometer: spectrometer and inlet (e.g. ASP06_J4)
+        direction: measured property and direction (e.g. Fdw)
+        channel: VNIR or SWIR
+        t_int: integration time of the measurement in ms
+        date: date of the calibration (yyyymmdd)
+
+    Returns: directory and name of the dark current file
+
+    """
+    if option == 2:
+        table, key = "dark", (re.search(r"ASP\d{2}", spectrometer)[0], date, t_int, direction, channel)
+    elif option == 3:
+        table, key = "transfer_dark", (f"{spectrometer[:-3]}_transfer_calib_{date}", t_int, direction, channel)
+    else:
+        raise ValueError("Option should be either 2 or 3!")
+
+    entry = get_calibration_catalog(calib_path)[table].get(key)
+    if entry is None or len(entry[1]) != 1 or not os.path.isfile(os.path.join(entry[0], entry[1][0])):
+        # missing or possibly outdated entry, e.g. single files were merged or a file was replaced
+        entry = get_calibration_catalog(calib_path, refresh=True)[table].get(key)
+    if entry is None:
+        raise RuntimeError(f"No dark current file found for measurement! ({key})")
+    dark_dir, dark_files = entry
+    if len(dark_files) > 1:
+        if option == 2:
+            raise AssertionError(f"More than one possible file was found!\n Check {dark_dir}!")
+        raise ValueError(f"Too many dark current files found for VNIR in {dark_dir}! "
+                         f"\nMerge VNIR files first and delete single files!")
+    log.info(f"Calibration file used:\n{os.path.join(dark_dir, dark_files[0])}")
+
+    return dark_dir, dark_files[0]
+
+
+# mean dark current of transfer calibration files already read in this process, keyed by file and its size and mtime
+_mean_dark_currents = dict()
+
+
+def _get_mean_dark_current(dark_dir: str, dark_file: str) -> pd.Series:
+    """
+    Return the mean over time of a dark current measurement and read it only once per process.
+
+    Args:
+        dark_dir: directory of the dark current file
+        dark_file: name of the dark current file
+
+    Returns: pandas Series with the mean dark current of each pixel
+
+    """
+    file = os.path.join(dark_dir, dark_file)
+    stat = os.stat(file)
+    key = (file, stat.st_size, stat.st_mtime_ns)
+    if key not in _mean_dark_currents:
+        _mean_dark_currents[key] = reader.mean_smart_raw(dark_dir, dark_file)
+
+    return _mean_dark_currents[key].copy()
+
+
+def _rolling_mean(values: np.ndarray, window: int) -> np.ndarray:
+    """
+    Trailing rolling mean along the last axis with a growing window at the start, same as
+    ``pd.Series.rolling(window, min_periods=1).mean()`` for data without NaNs.
+
+    Args:
+        values: input array
+        window: size of the window
+
+    Returns: float64 array with the rolling mean
+
+    """
+    cumsum = np.zeros(values.shape[:-1] + (values.shape[-1] + 1,))
+    np.cumsum(values, axis=-1, dtype=np.float64, out=cumsum[..., 1:])
+    end = np.arange(1, values.shape[-1] + 1)
+    start = np.maximum(end - window, 0)
+    return (cumsum[..., end] - cumsum[..., start]) / (end - start)
+
+
+def scale_dark_current(dark_current: np.ndarray, counts: np.ndarray, window: int = 20,
+                       out: np.ndarray = None) -> np.ndarray:
+    """
+    Scale a dark current measurement from a transfer calibration to a measurement (VNIR option 3 of
+    :py:func:`get_dark_current`).
+
+    The dark current is scaled to the mean of the first dark pixels of the measurement. The fluctuations of the scaled
+    dark current around its rolling mean are added to the smoothed dark current, which is shifted by the offset between
+    measurement and dark current in the first dark pixels.
+
+    Args:
+        dark_current: mean dark current of each pixel
+        counts: raw counts of the measurement (time, pixel) without t_int and shutter
+        window: size of the rolling mean window in pixels
+        out: preallocated array for the result with the shape of dark_current (e.g. float32 to save memory)
+
+    Returns: float64 array (or out) with the scaled dark current of each pixel
+
+    """
+    dark_current = np.asarray(dark_current, dtype=np.float64)
+    # pixels 18 to 97 of the measurement and 20 to 99 of the dark current, as used in the original pandas version
+    # which took the columns 19:99 of the measurement including t_int and shutter
+    measurement_offset = np.mean(np.nanmean(counts[:, 17:97], axis=0, dtype=np.float64))
+    dark_offset = np.mean(dark_current[19:99])
+    dark_scale = dark_current * (measurement_offset / dark_offset)
+    # fluctuations of the scaled dark current around its rolling mean
+    dark_scale -= _rolling_mean(dark_scale, window)
+    # smoothed dark current plus the offset found in the first dark pixels
+    dark_scale += _rolling_mean(dark_current, window) + (measurement_offset - dark_offset)
+    if out is None:
+        return dark_scale
+    out[...] = dark_scale
+    return out
+
+
+def subtract_dark_current(counts: np.ndarray, shutter: np.ndarray, dark_current, out: np.ndarray = None) -> \
+        Tuple[np.ndarray, np.ndarray]:
+    """
+    Subtract the dark current from all time steps with open shutter.
+    Only the rows with open shutter are copied (into out if given) and the dark current is subtracted in place.
+
+    Args:
+        counts: raw counts (time, pixel) without t_int and shutter
+        shutter: shutter flag for each time step (1 = open)
+        dark_current: dark current for each pixel or one value for all pixels
+        out: preallocated array with at least as many rows as time steps with open shutter, its data type has to hold
+            the counts without loss (e.g. float32 for float32 counts)
+
+    Returns: float64 array (or out) with the corrected counts for each time step with open shutter and the boolean
+        mask of these time steps
+
+    """
+    is_open = np.asarray(shutter) == 1
+    n_open = np.count_nonzero(is_open)
+    out = np.empty((n_open, counts.shape[1]), dtype=np.float64) if out is None else out[:n_open]
+    if counts.dtype == out.dtype:
+        np.compress(is_open, counts, axis=0, out=out)
+    else:
+        # compress does not cast into out, e.g. integer counts as read from the raw file
+        out[...] = np.compress(is_open, counts, axis=0)
+    np.subtract(out, np.asarray(dark_current, dtype=out.dtype), out=out)
+
+    return out, is_open
+
+
 def get_dark_current(flight: str, filename: str, option: int, **kwargs) -> Union[pd.Series, plt.figure]:
     """
     Get the corresponding dark current for the specified measurement file to correct the raw SMART measurement.
@@ -153,6 +570,8 @@ def get_dark_current(flight: str, filename: str, option: int, **kwargs) -> Union
             date (str): yyyymmdd, date of transfer calibration with dark current measurement to use
             dark_filepath (str): complete path to dark current file to use
             campaign (str): campaign to which smart file belongs to
+            measurement (pd.DataFrame): raw measurement as returned by :py:func:`pylim.reader.read_smart_raw` to avoid
+            reading the file again
 
     Returns: pandas Series with the mean dark current measurements over time for each pixel and optionally a plot of it
 
@@ -161,15 +580,17 @@ def get_dark_current(flight: str, filename: str, option: int, **kwargs) -> Union
     date = kwargs["date"] if "date" in kwargs else None
     dark_filepath = kwargs["dark_filepath"] if "dark_filepath" in kwargs else None
     campaign = kwargs["campaign"] if "campaign" in kwargs else "halo-ac3"
-    path = h.get_path("raw", flight, campaign=campaign)
-    path = kwargs["path"] if "path" in kwargs else path
-    pixel_wl_path = h.get_path("pixel_wl")
+    measurement = kwargs["measurement"] if "measurement" in kwargs else None
+    path = kwargs["path"] if "path" in kwargs else h.get_path("raw", flight, campaign=campaign)
     calib_path = h.get_path("calib", campaign=campaign)
-    measurement = reader.read_smart_raw(path, filename)
-    t_int = int(measurement["t_int"][0])  # get integration time
+    if measurement is None:
+        measurement = reader.read_smart_raw(path, filename)
+    t_int = int(measurement["t_int"].iloc[0])  # get integration time
     date_str, channel, direction = get_info_from_filename(filename)
     spectrometer = meta[campaign][f"{direction}_{channel}"]
-    pixel_wl = reader.read_pixel_to_wavelength(pixel_wl_path, spectrometer)
+    # the pixel to wavelength file is only needed to find the dark pixels or for plotting
+    pixel_wl = reader.read_pixel_to_wavelength(h.get_path("pixel_wl"), spectrometer) if option == 1 or plot \
+        else None
     # calculate dark current depending on channel:
     # SWIR: use measurements during shutter phases
     # VNIR: Option 1: use measurements below 290 nm
@@ -185,46 +606,15 @@ def get_dark_current(flight: str, filename: str, option: int, **kwargs) -> Union
             dark_current = measurement.loc[:, dark_pixels].mean()
             wls = pixel_wl[pixel_wl["pixel"].isin(dark_pixels)]["wavelength"]
         elif option == 2:
-            wls = pixel_wl["wavelength"]
-            # read in cali file
-            # get path depending on spectrometer and inlet
-            instrument = re.search(r'ASP\d{2}', spectrometer)[0]
-            inlet = re.search(r'J\d{1}', spectrometer)[0]
-            # find right folder and right cali
-            for dirpath, dirs, files in os.walk(calib_path):
-                if re.search(f".*{instrument}.*dark.*", dirpath) is not None:
-                    d_path, d = os.path.split(dirpath)
-                    # check if the date of the calibration matches the date of the file
-                    date_check = True if date_str.replace("_", "") in d_path else False
-                    # overwrite date check if date is given
-                    if date is not None:
-                        date_check = True if date in d_path else False
-                    # check for the right integration time in folder name
-                    t_int_check = str(t_int) in d
-                    # ASP06 has 2 SWIR and 2 VNIR inlets thus search for the folder for the given inlet
-                    if instrument == "ASP06" and inlet[1] in d:
-                        run = True
-                    # ASP07 has only one SWIR and VNIR inlet -> no need to search
-                    else:
-                        run = True
-                    if run and date_check and t_int_check:
-                        i = 0
-                        for file in files:
-                            if re.search(f'.*.{direction}_{channel}.dat', file) is not None:
-                                dark_dir, dark_file = dirpath, file
-                                log.info(f"Calibration file used:\n{os.path.join(dark_dir, dark_file)}")
-                                assert i == 0, f"More than one possible file was found!\n Check {dirpath}!"
-                                i += 1
-
-            try:
-                dark_current = reader.read_smart_raw(dark_dir, dark_file)
-                dark_current = dark_current.iloc[:, 2:].mean()
-            except UnboundLocalError as e:
-                raise RuntimeError("No dark current file found for measurement!") from e
+            wls = None if pixel_wl is None else pixel_wl["wavelength"]
+            # find the dark current file of the transfer calibration in the calibration catalog
+            date = date_str.replace("_", "") if date is None else date
+            dark_dir, dark_file = find_dark_current_file(calib_path, 2, spectrometer, direction, channel, t_int, date)
+            dark_current = _get_mean_dark_current(dark_dir, dark_file)
 
         else:
             assert option == 3, "Option should be either 1, 2 or 3!"
-            wls = pixel_wl["wavelength"]
+            wls = None if pixel_wl is None else pixel_wl["wavelength"]
             # check if an explicit dark current file is provided,
             # if not assume that a transfer calibration is provided -> this is the campaign mode
             if dark_filepath is None:
@@ -232,43 +622,27 @@ def get_dark_current(flight: str, filename: str, option: int, **kwargs) -> Union
                 if date is None:
                     raise NameError(f"If no 'dark_filepath' is provided 'date' for transfer calibration needs to be "
                                     f"given!")
-                else:
-                    transfer_calib_dir = os.path.join(calib_path, f"{spectrometer[:-3]}_transfer_calib_{date}")
-
-                # in the transfer calib directory find the dark current measurement folder with the correct
-                # integration time
-                dark_dir = [d for d in os.listdir(transfer_calib_dir) if "dark" in d and str(t_int) in d][0]
-                dark_dir = os.path.join(transfer_calib_dir, dark_dir)
-                dark_files = [f for f in os.listdir(dark_dir) if f"{direction}_{channel}.dat" in f]
-                # the normal workflow is to merge all VNIR dark current files and delete all single files, thus only
-                # one dark current VNIR file should be left in each dark current folder
-                if len(dark_files) > 1:
-                    raise ValueError(f"Too many dark current files found for VNIR in {dark_dir}! "
-                                     f"\nMerge VNIR files first and delete single files!")
-                else:
-                    dark_file = dark_files[0]
+                # find the dark current measurement of the transfer calibration with the correct integration time
+                # in the calibration catalog
+                dark_dir, dark_file = find_dark_current_file(calib_path, 3, spectrometer, direction, channel, t_int,
+                                                             date)
 
             else:
                 # get dark_dir and dark_file from given dark_filepath
                 dark_dir, dark_file = os.path.dirname(dark_filepath), os.path.basename(dark_filepath)
 
-            # read in dark current measurement, drop t_int and shutter column and take mean over time
-            dark_current = reader.read_smart_raw(dark_dir, dark_file).iloc[:, 2:].mean()
+            # stream the (merged) dark current measurement and take the mean over time of each pixel
+            dark_current = _get_mean_dark_current(dark_dir, dark_file)
             # scale dark current to the measured dark pixels
-            dark_scale = dark_current * np.mean(measurement.mean().iloc[19:99]) / np.mean(dark_current.iloc[19:99])
-            # get fluctuations over the rolling mean of the scaled dark current
-            dark_scale = dark_scale - dark_scale.rolling(20, min_periods=1).mean()
-            # smooth dark current and add offset found in the first dark pixels
-            dark_scale2 = dark_current.rolling(20, min_periods=1).mean() + (
-                    np.mean(measurement.mean().iloc[19:99]) - np.mean((dark_current.iloc[19:99])))
-            dark_current = dark_scale2 + dark_scale  # add both terms together
+            dark_current = pd.Series(scale_dark_current(dark_current.to_numpy(), measurement.iloc[:, 2:].to_numpy()),
+                                     index=dark_current.index)
 
     elif channel == "SWIR":
         # check if the shutter flag was working: If all values are 1 -> shutter flag is probably not working
         # even if the flag is working, does not mean the shutter is working
         if np.sum(measurement.shutter == 1) != measurement.shutter.shape[0]:
             dark_current = measurement.where(measurement.shutter == 0).iloc[:, 2:].mean()
-            wls = pixel_wl["wavelength"]
+            wls = None if pixel_wl is None else pixel_wl["wavelength"]
         else:
             raise ValueError(f"Shutter flag is probably wrong in {path}/{filename}!")
     else:
@@ -338,6 +712,8 @@ def correct_smart_dark_current(flight: str, smart_file: str, option: int, **kwar
             date (str): (yyyymmdd) date from which the dark current measurement should be used for VNIR (necessary if \
             no transfer calibration was made on a measurement day)
             campaign (str): campaign to which smart file belongs to
+            measurement (pd.DataFrame): raw measurement as returned by :py:func:`pylim.reader.read_smart_raw` to avoid
+            reading the file again
 
     Returns: Series with corrected smart measurement
 
@@ -346,19 +722,400 @@ def correct_smart_dark_current(flight: str, smart_file: str, option: int, **kwar
     path = h.get_path("raw", flight, campaign=campaign)
     path = kwargs.pop("path") if "path" in kwargs else path
     date_str, channel, direction = get_info_from_filename(smart_file)
-    smart = reader.read_smart_raw(path, smart_file)
-    dark_current = get_dark_current(flight, smart_file, option, path=path, **kwargs)
+    smart = kwargs.pop("measurement") if "measurement" in kwargs else reader.read_smart_raw(path, smart_file)
+    # hand over the parsed measurement so it is not read twice
+    dark_current = get_dark_current(flight, smart_file, option, path=path, measurement=smart, **kwargs)
 
     if channel == "VNIR" and option == 1:
         dark_current = dark_current.mean()  # If get_dark_current returns a column mean, this can to be removed
-    measurement = smart.where(smart.shutter == 1).iloc[:, 2:]  # only use data when shutter is open
-    measurement_cor = measurement - dark_current
-    # drop nan values -> dark current measurements at beginning of file
-    measurement_cor.dropna(inplace=True)
+    else:
+        dark_current = dark_current.reindex(smart.columns[2:])  # align dark current with the pixel columns
+    # only use data when shutter is open
+    counts_cor, is_open = subtract_dark_current(smart.iloc[:, 2:].to_numpy(), smart["shutter"].to_numpy(),
+                                                dark_current)
+    measurement_cor = pd.DataFrame(counts_cor, index=smart.index[is_open], columns=smart.columns[2:], copy=False)
+    # drop nan values
+    is_valid = ~np.isnan(counts_cor).any(axis=1)
+    if not is_valid.all():
+        measurement_cor = measurement_cor[is_valid]
 
     return measurement_cor
 
 
+def _write_smart_file(df: pd.DataFrame, outfile: str) -> None:
+    """
+    Write SMART data as a tab separated file readable by :py:func:`pylim.reader.read_smart_cor`.
+    The data is first written to a temporary file which then replaces the output file, so no partial files are left.
+
+    Args:
+        df: SMART data with datetime index and pixel columns
+        outfile: complete path of the output file
+
+    """
+    tmp_file = f"{outfile}.{os.getpid()}.tmp"
+    try:
+        df.to_csv(tmp_file, sep="\t", index_label="time")
+        os.replace(tmp_file, outfile)
+    finally:
+        if os.path.exists(tmp_file):
+            os.remove(tmp_file)
+    log.info(f"Saved {outfile}")
+
+
+def _list_smart_raw_files(path: str) -> list:
+    """
+    Return all raw SMART files in a directory.
+    Raw files end with the direction and channel (e.g. 2021_03_29_11_07.Fup_SWIR.dat), dark current corrected
+    (``_cor.dat``), calibrated (``_cor_calibrated_norm.dat``) or any other processed files are skipped.
+
+    Args:
+        path: directory to search
+
+    Returns: sorted list of filenames
+
+    """
+    files = list()
+    for file in sorted(os.listdir(path)):
+        if re.search(r"\.[FI][a-z]{2}_[A-Z]{4}\.dat$", file) is None:
+            continue
+        try:
+            get_info_from_filename(file)
+        except AttributeError:
+            continue
+        files.append(file)
+    return files
+
+
+def _correct_smart_dark_current_worker(flight: str, smart_file: str, option: int, outpath: str, kwargs: dict):
+    """
+    Correct one file in a worker process of :py:func:`correct_smart_dark_current_batch`.
+
+    Returns: corrected measurement or the path to the saved file if outpath is given
+
+    """
+    measurement_cor = correct_smart_dark_current(flight, smart_file, option, **kwargs)
+    if outpath is None:
+        return measurement_cor
+    outfile = os.path.join(outpath, smart_file.replace(".dat", "_cor.dat"))
+    _write_smart_file(measurement_cor, outfile)
+
+    return outfile
+
+
+def correct_smart_dark_current_batch(flight: str, files: list = None, option: int = 2, n_jobs: int = None,
+                                     **kwargs) -> dict:
+    """
+    Correct a list of raw SMART files or all raw files of a flight for the dark current in parallel processes.
+    Each worker keeps the mean dark current of the transfer calibration files it used, so files sharing the same dark
+    current measurement (same calibration and integration time) only read it once per worker.
+
+    Args:
+        flight: to which flight do the files belong to? (e.g. Flight_20210707a)
+        files: filenames of the raw files to correct (default: all raw files in path, processed files are skipped)
+        option: which option should be used to get the dark current? Only relevant for channel "VNIR".
+        n_jobs: number of processes to use (default: number of cores), 1 corrects all files in this process
+        kwargs: path (str): path to files if not raw file path as given in config.toml,
+            outpath (str): save the corrected files as ``<filename>_cor.dat`` to this directory and return the file
+            paths instead of the data,
+            all other keyword arguments of :py:func:`correct_smart_dark_current`
+
+    Returns: dictionary with the filename as key and the corrected measurement (or path to the saved file) as value
+
+    """
+    campaign = kwargs["campaign"] if "campaign" in kwargs else "halo-ac3"
+    outpath = kwargs.pop("outpath") if "outpath" in kwargs else None
+    if "path" not in kwargs:
+        kwargs["path"] = h.get_path("raw", flight, campaign=campaign)
+    if files is None:
+        files = _list_smart_raw_files(kwargs["path"])
+    # sort files by inlet and channel so each worker gets files using the same dark current measurement
+    files = sorted(files, key=lambda f: (get_info_from_filename(f)[2], get_info_from_filename(f)[1], f))
+    if outpath is not None:
+        h.make_dir(outpath)
+
+    if n_jobs == 1 or len(files) <= 1:
+        results = [_correct_smart_dark_current_worker(flight, file, option, outpath, kwargs) for file in files]
+    else:
+        n_workers = os.cpu_count() if n_jobs is None else n_jobs
+        chunksize = max(1, len(files) // (4 * n_workers))
+        with ProcessPoolExecutor(max_workers=n_workers) as executor:
+            results = list(executor.map(_correct_smart_dark_current_worker, [flight] * len(files), files,
+                                        [option] * len(files), [outpath] * len(files), [kwargs] * len(files),
+                                        chunksize=chunksize))
+
+    return dict(zip(files, results))
+
+
+def _file_signature(file: str) -> list:
+    """Return size and modification time of a file or None if it does not exist"""
+    try:
+        stat = os.stat(file)
+    except FileNotFoundError:
+        return None
+    return [stat.st_size, stat.st_mtime_ns]
+
+
+def _get_dark_current_reference(filename: str, option: int, t_int: int, campaign: str, **kwargs) -> dict:
+    """
+    Return the dark current measurement a raw file is corrected with and its file signature.
+
+    Args:
+        filename: name of the raw SMART file
+        option: dark current option (see :py:func:`get_dark_current`)
+        t_int: integration time of the measurement
+        campaign: campaign to which smart file belongs to
+        kwargs: date (str), dark_filepath (str) as for :py:func:`get_dark_current`
+
+    Returns: dictionary with the dark current file and its signature or None if the file is corrected with its own
+        dark measurements (SWIR and VNIR option 1)
+
+    """
+    date_str, channel, direction = get_info_from_filename(filename)
+    if channel != "VNIR" or option == 1:
+        return None
+    if option == 3 and kwargs.get("dark_filepath") is not None:
+        dark_file = kwargs["dark_filepath"]
+    else:
+        date = kwargs.get("date")
+        date = date_str.replace("_", "") if date is None and option == 2 else date
+        calib_path = h.get_path("calib", campaign=campaign)
+        dark_file = os.path.join(*find_dark_current_file(calib_path, option, meta[campaign][f"{direction}_{channel}"],
+                                                         direction, channel, t_int, date))
+
+    return dict(file=dark_file, signature=_file_signature(dark_file))
+
+
+def _pipeline_cor_worker(filename: str, flight: str, option: int, raw_path: str, data_path: str,
+                         kwargs: dict) -> dict:
+    """
+    Dark current correct one raw file for :py:class:`SmartPipeline` and return its manifest entry.
+
+    """
+    raw_signature = _file_signature(os.path.join(raw_path, filename))
+    measurement = reader.read_smart_raw(raw_path, filename)
+    t_int = int(measurement["t_int"].iloc[0])
+    measurement_cor = correct_smart_dark_current(flight, filename, option, path=raw_path, measurement=measurement,
+                                                 **kwargs)
+    outfile = filename.replace(".dat", "_cor.dat")
+    _write_smart_file(measurement_cor, os.path.join(data_path, outfile))
+
+    return dict(input=raw_signature, t_int=t_int, output=outfile,
+                dark=_get_dark_current_reference(filename, option, t_int, **kwargs))
+
+
+def _pipeline_calibrated_worker(filename: str, data_path: str, calibrated_path: str, calibrate,
+                                calibration_id: str) -> dict:
+    """
+    Calibrate one dark current corrected file for :py:class:`SmartPipeline` and return its manifest entry.
+
+    """
+    cor_signature = _file_signature(os.path.join(data_path, filename))
+    measurement_cor = reader.read_smart_cor(data_path, filename)
+    outfile = filename.replace("_cor.dat", "_cor_calibrated_norm.dat")
+    _write_smart_file(calibrate(measurement_cor, filename), os.path.join(calibrated_path, outfile))
+
+    return dict(input=cor_signature, calibration=calibration_id, output=outfile)
+
+
+class SmartPipeline:
+    """
+    Incremental processing chain for the SMART files of one flight:
+    raw -> dark current corrected (``_cor``) -> calibrated (``_cor_calibrated_norm``).
+
+    The state of each file is kept in a json manifest, which records size and modification time of the input, the
+    dark current measurement and the calibration used.
+    :py:meth:`run` only processes files whose input, dark current measurement or calibration changed or whose output
+    is missing, so adding a few files or a new transfer calibration only reprocesses the affected files.
+    Files are processed in parallel processes and written atomically.
+    Merging the calibrated VNIR and SWIR files into netCDF (:py:func:`merge_vnir_swir_nc`) is done afterwards as before.
+
+    Examples:
+        >>> pipeline = SmartPipeline("HALO-AC3_20220311_HALO_RF01", campaign="halo-ac3", option=3, date="20220311",
+        ...                          calibrate=calibrate_smart, calibration_id="ASP06_transfer_calib_20220311")
+        >>> pipeline.stale_files()
+        >>> pipeline.run()
+
+    """
+
+    steps = ("cor", "calibrated")
+
+    def __init__(self, flight: str, campaign: str = "cirrus-hl", option: int = 2, calibrate=None,
+                 calibration_id: str = None, n_jobs: int = None, **kwargs):
+        """
+        Set up the pipeline and read the manifest if it exists.
+
+        Args:
+            flight: to which flight do the files belong to? (e.g. Flight_20210707a)
+            campaign: campaign name (cirrus-hl or halo-ac3)
+            option: which option should be used to get the dark current? Only relevant for channel "VNIR".
+            calibrate: function calibrate(measurement_cor: pd.DataFrame, filename: str) -> pd.DataFrame which
+                returns the calibrated data, needs to be defined on module level to be used in parallel processes
+            calibration_id: name of the calibration (e.g. transfer calibration folder), files are calibrated again
+                when it changes
+            n_jobs: number of processes to use (default: number of cores), 1 processes all files in this process
+            **kwargs: raw_path, data_path, calibrated_path (str): paths if not given in config.toml,
+                manifest_file (str): path of the manifest (default: data_path/smart_pipeline_manifest.json),
+                date (str), dark_filepath (str): see :py:func:`get_dark_current`
+
+        """
+        self.flight, self.campaign, self.option = flight, campaign, option
+        self.calibrate, self.calibration_id, self.n_jobs = calibrate, calibration_id, n_jobs
+        self.raw_path = kwargs.pop("raw_path") if "raw_path" in kwargs else h.get_path("raw", flight, campaign)
+        self.data_path = kwargs.pop("data_path") if "data_path" in kwargs else h.get_path("data", flight, campaign)
+        self.calibrated_path = kwargs.pop("calibrated_path") if "calibrated_path" in kwargs \
+            else h.get_path("calibrated", flight, campaign)
+        self.manifest_file = kwargs.pop("manifest_file") if "manifest_file" in kwargs \
+            else os.path.join(self.data_path, "smart_pipeline_manifest.json")
+        self.kwargs = dict(kwargs, campaign=campaign)
+        self.manifest = self._read_manifest()
+
+    def _read_manifest(self) -> dict:
+        """Read the manifest or return an empty one"""
+        try:
+            with open(self.manifest_file) as f:
+                manifest = json.load(f)
+        except FileNotFoundError:
+            manifest = dict()
+        for step in self.steps:
+            manifest.setdefault(step, dict())
+        return manifest
+
+    def _write_manifest(self) -> None:
+        """Write the manifest atomically"""
+        tmp_file = f"{self.manifest_file}.{os.getpid()}.tmp"
+        with open(tmp_file, "w") as f:
+            json.dump(self.manifest, f, indent=2)
+        os.replace(tmp_file, self.manifest_file)
+
+    def raw_files(self) -> list:
+        """Return all raw SMART files of the flight"""
+        return _list_smart_raw_files(self.raw_path)
+
+    def _is_cor_stale(self, filename: str) -> bool:
+        """Check if a raw file needs to be (re)corrected"""
+        entry = self.manifest["cor"].get(filename)
+        if entry is None or entry["input"] != _file_signature(os.path.join(self.raw_path, filename)):
+            return True
+        if not os.path.exists(os.path.join(self.data_path, entry["output"])):
+            return True
+        try:
+            dark = _get_dark_current_reference(filename, self.option, entry["t_int"], **self.kwargs)
+        except RuntimeError:
+            return True  # dark current measurement is gone, let the correction raise the error
+        return dark != entry["dark"]
+
+    def _is_calibrated_stale(self, filename: str) -> bool:
+        """Check if a dark current corrected file needs to be (re)calibrated"""
+        entry = self.manifest["calibrated"].get(filename)
+        if entry is None or entry["input"] != _file_signature(os.path.join(self.data_path, filename)):
+            return True
+        if entry["calibration"] != self.calibration_id:
+            return True
+        return not os.path.exists(os.path.join(self.calibrated_path, entry["output"]))
+
+    def stale_files(self) -> dict:
+        """
+        Find the files which need to be processed in each step.
+        Files which are corrected again are also calibrated again.
+
+        Returns: dictionary with the list of input files for each step
+
+        """
+        if self.option in (2, 3):
+            # pick up new calibrations
+            get_calibration_catalog(h.get_path("calib", campaign=self.campaign), refresh=True)
+        cor = [f for f in self.raw_files() if self._is_cor_stale(f)]
+        stale = dict(cor=cor, calibrated=list())
+        if self.calibrate is not None:
+            new_cor = {f.replace(".dat", "_cor.dat") for f in cor}
+            cor_files = sorted({entry["output"] for entry in self.manifest["cor"].values()} | new_cor)
+            stale["calibrated"] = [f for f in cor_files if f in new_cor or self._is_calibrated_stale(f)]
+        return stale
+
+    def _map(self, worker, files: list, *iterables) -> Tuple[dict, dict]:
+        """
+        Apply worker to all files in parallel processes.
+        A failing file does not stop the processing of the other files.
+
+        Returns: manifest entries of the successful files and exceptions of the failed files (keyed by file name)
+
+        """
+        entries, failures = dict(), dict()
+        if self.n_jobs == 1 or len(files) <= 1:
+            for args in zip(files, *iterables):
+                try:
+                    entries[args[0]] = worker(*args)
+                except Exception as e:
+                    failures[args[0]] = e
+            return entries, failures
+        n_workers = os.cpu_count() if self.n_jobs is None else self.n_jobs
+        with ProcessPoolExecutor(max_workers=n_workers) as executor:
+            futures = {executor.submit(worker, *args): args[0] for args in zip(files, *iterables)}
+            for future in as_completed(futures):
+                try:
+                    entries[futures[future]] = future.result()
+                except Exception as e:
+                    failures[futures[future]] = e
+        return entries, failures
+
+    def _update_manifest(self, step: str, entries: dict, failures: dict) -> None:
+        """Record the successful files of a step, write the manifest and log the failed files"""
+        self.manifest[step].update(entries)
+        self._write_manifest()
+        for filename, e in failures.items():
+            log.error(f"{step}: processing {filename} failed: {e!r}")
+
+    def run(self, force: bool = False) -> dict:
+        """
+        Run all steps for the stale files and update the manifest after each step.
+        Files which fail are logged and left out of the manifest, all other files are processed and recorded.
+
+        Args:
+            force: process all files regardless of their state
+
+        Returns: dictionary with the list of processed input files for each step
+
+        Raises:
+            RuntimeError: if any file failed, after the manifest was written
+
+        """
+        if force:
+            self.manifest = {step: dict() for step in self.steps}
+        stale = self.stale_files()
+        failed = dict()
+
+        files = stale["cor"]
+        if len(files) > 0:
+            h.make_dir(self.data_path)
+            n = len(files)
+            entries, failures = self._map(_pipeline_cor_worker, files, [self.flight] * n, [self.option] * n,
+                                          [self.raw_path] * n, [self.data_path] * n, [self.kwargs] * n)
+            self._update_manifest("cor", entries, failures)
+            failed.update(failures)
+            stale["cor"] = [f for f in files if f in entries]
+            log.info(f"Corrected {len(entries)} files for the dark current")
+
+        # files whose correction failed cannot be calibrated
+        failed_cor = {f.replace(".dat", "_cor.dat") for f in failed}
+        files = [f for f in stale["calibrated"] if f not in failed_cor]
+        if len(files) > 0:
+            h.make_dir(self.calibrated_path)
+            n = len(files)
+            entries, failures = self._map(_pipeline_calibrated_worker, files, [self.data_path] * n,
+                                          [self.calibrated_path] * n, [self.calibrate] * n,
+                                          [self.calibration_id] * n)
+            self._update_manifest("calibrated", entries, failures)
+            failed.update(failures)
+            log.info(f"Calibrated {len(entries)} files")
+        stale["calibrated"] = [f for f in files if f not in failed]
+
+        if len(failed) > 0:
+            raise RuntimeError(f"Processing failed for {len(failed)} files: {sorted(failed)}") \
+                from next(iter(failed.values()))
+
+        return stale
+
+
 def plot_smart_data(campaign: str, flight: str, filename: str, wavelength: Union[list, str], **kwargs) -> plt.axes:
     """
     Plot SMART data in the given file. Either a time average over a range of wavelengths or all wavelengths,
@@ -456,6 +1213,38 @@ def plot_smart_data(campaign: str, flight: str, filename: str, wavelength: Union
         return ax
 
 
+def _select_smart_spectrum(path: str, filename: str, index: int, store: bool = False) -> pd.Series:
+    """
+    Select one spectrum (row) of a calibrated SMART file either by parsing the file or from its spectral store.
+    Falls back to the last row if index is out of bounds.
+
+    Args:
+        path: where the file or the spectral store can be found
+        filename: name of the file (standard SMART filename convention)
+        index: which row to select
+        store: read from the spectral store created with :py:func:`pylim.reader.write_smart_store`
+
+    Returns: pandas Series with the spectrum and the time stamp as name
+
+    """
+    if store:
+        _, channel, direction = get_info_from_filename(filename)
+        store_path = reader.get_smart_store_path(path, direction, channel)
+        try:
+            return reader.read_smart_store_row(store_path, filename, index)
+        except IndexError as e:
+            log.info(f"{e}\nGiven index '{index}' out-of-bounds! Using maximum index!")
+            return reader.read_smart_store_row(store_path, filename, -1)
+
+    df = reader.read_smart_cor(path, filename)
+    max_id = len(df) - 1
+    try:
+        return df.iloc[index, :]
+    except IndexError as e:
+        log.info(f"{e}\nGiven index '{index}' out-of-bounds! Using maximum index '{max_id}'!")
+        return df.iloc[max_id, :]
+
+
 def plot_smart_spectra(path: str, campaign: str, filename: str, index: int, **kwargs) -> None:
     """
     Plot a spectra from a SMART calibrated measurement file for a given index (time step)
@@ -466,24 +1255,21 @@ def plot_smart_spectra(path: str, campaign: str, filename: str, index: int, **kw
         filename: name of the file (standard SMART filename convention)
         index: which row to plot
         **kwargs: save_fig (bool): Save figure to plot path given in config.toml (default: False),
-            plot_path (str): Where to save plot if not standard plot path
+            plot_path (str): Where to save plot if not standard plot path,
+            store (bool): read the spectrum from the spectral store in path (see
+            :py:func:`pylim.reader.write_smart_store`) instead of parsing the file (default: False)
 
     Returns: Shows and or saves a plot
 
     """
     save_fig = kwargs["save_fig"] if "save_fig" in kwargs else False
     plot_path = kwargs["plot_path"] if "plot_path" in kwargs else h.get_path("plot", campaign=campaign)
+    store = kwargs["store"] if "store" in kwargs else False
     pixel_path = h.get_path("pixel_wl", campaign)
-    df = reader.read_smart_cor(path, filename)
     date_str, channel, direction = get_info_from_filename(filename)
     spectrometer = meta[campaign][f"{direction}_{channel}"]
     pixel_wl = reader.read_pixel_to_wavelength(pixel_path, spectrometer)
-    max_id = len(df) - 1
-    try:
-        df_sel = df.iloc[index, :]
-    except IndexError as e:
-        log.info(f"{e}\nGiven index '{index}' out-of-bounds! Using maximum index '{max_id}'!")
-        df_sel = df.iloc[max_id, :]
+    df_sel = _select_smart_spectrum(path, filename, index, store)
 
     time_stamp = df_sel.name  # get time stamp which is selected
     pixel_wl[f"{direction}"] = df_sel.reset_index(drop=True)
@@ -515,15 +1301,17 @@ def plot_complete_smart_spectra(path: str, campaign: str, filename: str, index:
         filename: name of the file (standard SMART filename convention)
         index: which row to plot
         **kwargs: save_fig (bool): Save figure to plot path given in config.toml (default: False)
-            plot_path (str): Where to save plot if not standard plot path
+            plot_path (str): Where to save plot if not standard plot path,
+            store (bool): read the spectra from the spectral stores in path (see
+            :py:func:`pylim.reader.write_smart_store`) instead of parsing the files (default: False)
 
     Returns: Shows and or saves a plot
 
     """
     save_fig = kwargs["save_fig"] if "save_fig" in kwargs else False
     plot_path = kwargs["plot_path"] if "plot_path" in kwargs else h.get_path("plot", campaign=campaign)
+    store = kwargs["store"] if "store" in kwargs else False
     pixel_path = h.get_path("pixel_wl", campaign)
-    df1 = reader.read_smart_cor(path, filename)
     date_str, channel, direction = get_info_from_filename(filename)
     if channel == "SWIR":
         channel2 = "VNIR"
@@ -531,22 +1319,14 @@ def plot_complete_smart_spectra(path: str, campaign: str, filename: str, index:
         channel2 = "SWIR"
 
     filename2 = filename.replace(channel, channel2)
-    df2 = reader.read_smart_cor(path, filename2)
     spectrometer1 = meta[campaign][f"{direction}_{channel}"]
     spectrometer2 = meta[campaign][f"{direction}_{channel2}"]
     pixel_wl1 = reader.read_pixel_to_wavelength(pixel_path, spectrometer1)
     pixel_wl2 = reader.read_pixel_to_wavelength(pixel_path, spectrometer2)
     # merge pixel dfs and sort by wavelength
     # pixel_wl = pixel_wl1.append(pixel_wl2, ignore_index=True).sort_values(by="wavelength", ignore_index=True)
-    max_id1 = len(df1) - 1
-    max_id2 = len(df2) - 1
-    try:
-        df_sel1 = df1.iloc[index, :]
-        df_sel2 = df2.iloc[index, :]
-    except IndexError as e:
-        log.info(f"{e}\nGiven index '{index}' out-of-bounds! Using maximum index '{max_id1}'!")
-        df_sel1 = df1.iloc[max_id1, :]
-        df_sel2 = df2.iloc[max_id2, :]
+    df_sel1 = _select_smart_spectrum(path, filename, index, store)
+    df_sel2 = _select_smart_spectrum(path, filename2, index, store)
 
     time_stamp = df_sel1.name  # get time stamp which is selected
     assert time_stamp == df_sel2.name, "Time stamps from VNIR and SWIR are not identical!"
@@ -1,9 +1,15 @@
 #!/usr/bin/env python
 """Functions calculating the solar position
 
+All functions accept scalars or NumPy arrays (which are broadcast against each other) and return scalars for scalar
+input.
+Use :py:func:`get_sza_saa` to calculate both angles directly from datetime64 time series.
+Importing this module registers the ``pylim`` accessor on xarray Datasets (see :py:class:`PylimDatasetAccessor`).
+
 **author:** Hanno Müller, Johannes Röttenbacher
 """
 import numpy as np
+import xarray as xr
 
 
 def dec(julian, year):
@@ -12,8 +18,8 @@ def dec(julian, year):
     **Reference**: Michalsky, J.  1988. The Astronomical Almanac's algorithm for approximate solar position (1950-2050). Solar Energy 40 (3), pp. 227-235.
 
     Args:
-        julian: julian day (day of year) as calculated with julian2.pro
-        year: The year (e.g., 2020)
+        julian: julian day (day of year) as calculated with julian2.pro (scalar or array)
+        year: The year (e.g., 2020) (scalar or array)
 
     Returns:
         declination in (deg)
@@ -26,13 +32,13 @@ def dec(julian, year):
     rad = np.pi / 180.0
 
     # get the current julian date (actually add 2,400,000 for jd)
+    year = np.asarray(year)
     delta = year - 1949.0
-    leap = int(delta / 4.0)
+    leap = np.trunc(delta / 4.0)
     julian_zero = 32916.5 + delta * 365.0 + leap + julian
     # 1st no. is mid. 0 jan 1949 minus 2.4e6 leap=leap days since 1949
     # the last yr of century is not leap yr unless divisible by 400
-    if ((year % 100.0) == 0.0) and ((year % 400.0) != 0.0):
-        julian_zero = julian_zero - 1.0
+    julian_zero = np.where(((year % 100.0) == 0.0) & ((year % 400.0) != 0.0), julian_zero - 1.0, julian_zero)
 
     # calculate ecliptic coordinates
     time = julian_zero - 51545.0
@@ -40,34 +46,32 @@ def dec(julian, year):
     # force mean longitude between 0 and 360 degs
     mnlong = 280.460 + 0.9856474 * time
     mnlong = mnlong % 360.0
-    if mnlong <= 0.0:
-        mnlong = mnlong + 360.0
+    mnlong = np.where(mnlong <= 0.0, mnlong + 360.0, mnlong)
 
     # mean anomaly in radians between 0 and 2*pi
     mnanom = 357.528 + 0.9856003 * time
     mnanom = mnanom % 360.0
-    if mnanom <= 0.0:
-        mnanom = mnanom + 360.0
+    mnanom = np.where(mnanom <= 0.0, mnanom + 360.0, mnanom)
     mnanom = mnanom * rad
 
     # compute the ecliptic longitude and obliquity of ecliptic in radians
     eclong = mnlong + 1.915 * np.sin(mnanom) + 0.020 * np.sin(2.0 * mnanom)
     eclong = eclong % 360.0
-    if eclong <= 0.0:
-        eclong = eclong + 360.0
+    eclong = np.where(eclong <= 0.0, eclong + 360.0, eclong)
     oblqec = 23.439 - 0.0000004 * time
     eclong = eclong * rad
     oblqec = oblqec * rad
 
     dec = np.arcsin(np.sin(oblqec) * np.sin(eclong)) / rad
 
-    return dec
+    return dec[()]
 
 
-def get_saa(t0, lat, lon, year, month, day):
+def _solar_height(t0, lat, lon, year, month, day, ephemeris_resolution: float = None):
     """
-    Calculates the solar azimuth angles.
+    Calculate the solar elevation without refraction correction and the local solar time.
     Requires function julian_day,local_time,dec
+
     Args:
         t0: Time in UTC (in decimal hours, i.e. 10.5 for 10h30min)
         lat: Latitude (North positive)
@@ -75,40 +79,85 @@ def get_saa(t0, lat, lon, year, month, day):
         year: The year  (e.g. 2020)
         month: The month (1-12)
         day: The day (1-31)
+        ephemeris_resolution: use cached ephemeris tables with this resolution in minutes (see :py:func:`ephemeris`)
 
     Returns:
-        The solar azimuth angle (deg)
+        solar elevation (rad), local solar time (decimal hours) and declination (deg)
 
-    Examples:
-        >>> azimuth = get_saa(11, 51.34, 12.376, 2022, 2, 2)
-        >>> azimuth
-        173.75177751099122
     """
     julian = julian_day(year, month, day, t0)
-    t_loc = local_time(julian, t0, lon)
+    if ephemeris_resolution is None:
+        t_loc = local_time(julian, t0, lon)
+        declination = dec(julian, year)
+    else:
+        declination, eot = ephemeris(julian, year, ephemeris_resolution)
+        t_loc = (t0 * 60.0 + 4.0 * lon + eot) / 60.0
     tau = (12.0 - t_loc) * 15.0
     height = np.arcsin(
         np.cos(np.pi / 180.0 * lat)
-        * np.cos(np.pi / 180.0 * dec(julian, year))
+        * np.cos(np.pi / 180.0 * declination)
         * np.cos(np.pi / 180.0 * tau)
-        + np.sin(np.pi / 180.0 * lat) * np.sin(np.pi / 180.0 * dec(julian, year))
+        + np.sin(np.pi / 180.0 * lat) * np.sin(np.pi / 180.0 * declination)
     )
+
+    return height, t_loc, declination
+
+
+def _azimuth(height, t_loc, lat, declination):
+    """
+    Calculate the solar azimuth angle (deg) from the solar elevation (rad), local solar time and declination (deg)
+    """
     azimuth = (
         np.sin(height) * np.sin(np.pi / 180.0 * lat)
-        - np.sin(np.pi / 180.0 * dec(julian, year))
+        - np.sin(np.pi / 180.0 * declination)
     ) / (np.cos(height) * np.cos(np.pi / 180.0 * lat))
     # check that the azimuth is below else set it to 1
-    azimuth = azimuth if azimuth < 1 else 1
+    azimuth = np.where(azimuth < 1, azimuth, 1)
     azimuth = np.arccos(azimuth)
     # check if it is before local noon, if yes switch sign of azimuth
-    azimuth = azimuth if t_loc > 12 else -azimuth
-    # tl12 = np.where(t_loc < 12.)
-    # if len(tl12[0]) > 0: azimuth[tl12[0]] = -azimuth[tl12[0]]
+    azimuth = np.where(t_loc > 12, azimuth, -azimuth)
     azimuth += np.pi
 
     azimuth = azimuth * 180.0 / np.pi
 
-    return azimuth
+    return azimuth[()]
+
+
+def _zenith(height, pres, temp):
+    """
+    Calculate the solar zenith angle (deg) from the solar elevation (rad) including the refraction correction
+    """
+    # correction for refraction, only for angles > -5deg
+    with np.errstate(divide="ignore", invalid="ignore"):
+        refcor = np.where(height >= -0.087, refract(height, pres, temp), 0)
+    sza = 90.0 - (height + refcor) * 180.0 / np.pi
+
+    return sza[()]
+
+
+def get_saa(t0, lat, lon, year, month, day):
+    """
+    Calculates the solar azimuth angles.
+    Requires function julian_day,local_time,dec
+    Args:
+        t0: Time in UTC (in decimal hours, i.e. 10.5 for 10h30min)
+        lat: Latitude (North positive)
+        lon: Longitude (East positive)
+        year: The year  (e.g. 2020)
+        month: The month (1-12)
+        day: The day (1-31)
+
+    Returns:
+        The solar azimuth angle (deg)
+
+    Examples:
+        >>> azimuth = get_saa(11, 51.34, 12.376, 2022, 2, 2)
+        >>> azimuth
+        173.75177751099122
+    """
+    height, t_loc, declination = _solar_height(t0, lat, lon, year, month, day)
+
+    return _azimuth(height, t_loc, lat, declination)
 
 
 def get_sza(t0, lat, lon, year, month, day, pres, temp):
@@ -137,29 +186,63 @@ def get_sza(t0, lat, lon, year, month, day, pres, temp):
         The solar zenith angle (deg)
 
     """
-    julian = julian_day(year, month, day, t0)
-    t_loc = local_time(julian, t0, lon)
-    tau = (12.0 - t_loc) * 15.0
-    height = np.arcsin(
-        np.cos(np.pi / 180.0 * lat)
-        * np.cos(np.pi / 180.0 * dec(julian, year))
-        * np.cos(np.pi / 180.0 * tau)
-        + np.sin(np.pi / 180.0 * lat) * np.sin(np.pi / 180.0 * dec(julian, year))
-    )
-    # correction for refraction
-    # refcor = fltarr(n_elements(height))
-    refcor = np.zeros(height.size)
-
-    h1 = np.where(height >= -0.087)  # corrects only for angles > -5deg
-    # if len(h1[0]) > 0: refcor[h1[0]]=refract(height[h1[0]],pres,temp)
-    if len(h1[0]) > 0:
-        refcor = refract(height, pres, temp)
-    else:
-        refcor = 0
+    height, _, _ = _solar_height(t0, lat, lon, year, month, day)
 
-    sza = 90.0 - (height + refcor) * 180.0 / np.pi
+    return _zenith(height, pres, temp)
+
+
+def _split_time(time):
+    """
+    Split datetime64 values into decimal UTC hours, year, month and day.
+
+    Args:
+        time: datetime64 values (scalar, array, pd.DatetimeIndex or xr.DataArray)
+
+    Returns:
+        t0 (decimal hours), year, month, day
+
+    """
+    time = np.asarray(time, dtype="datetime64[ns]")
+    date = time.astype("datetime64[D]")
+    month_start = time.astype("datetime64[M]")
+    year = time.astype("datetime64[Y]").astype(int) + 1970
+    month = month_start.astype(int) % 12 + 1
+    day = (date - month_start.astype("datetime64[D]")).astype(int) + 1
+    t0 = (time - date) / np.timedelta64(1, "h")
+
+    return t0, year, month, day
 
-    return sza
+
+def get_sza_saa(time, lat, lon, pres=1013.25, temp=15.0, ephemeris_resolution: float = None):
+    """
+    Calculates the solar zenith and azimuth angle for datetime64 time series, e.g. along a flight track.
+    The results are the same as from :py:func:`get_sza` and :py:func:`get_saa`, but the declination and local time
+    are only calculated once.
+
+    Args:
+        time: Time in UTC as datetime64 (scalar, array, pd.DatetimeIndex or xr.DataArray)
+        lat: Latitude (North positive)
+        lon: Longitude (East positive)
+        pres: Surface Pressure in hPa (for refraction correction)
+        temp: Surface Temperature in deg C (for refraction correction)
+        ephemeris_resolution: interpolate declination and equation of time from cached daily tables with this
+            resolution in minutes (e.g. 1) instead of evaluating them for every time step, see :py:func:`ephemeris`
+            for the accuracy
+
+    Returns:
+        The solar zenith angle (deg) and the solar azimuth angle (deg), both NaN for missing times or positions
+
+    Examples:
+        >>> sza, saa = get_sza_saa(bahamas.time, bahamas.IRS_LAT, bahamas.IRS_LON, bahamas.PS, bahamas.TS - 273.15)
+
+    """
+    t0, year, month, day = _split_time(time)
+    lat, lon = np.asarray(lat), np.asarray(lon)
+    height, t_loc, declination = _solar_height(t0, lat, lon, year, month, day, ephemeris_resolution)
+    # get_saa returns 180 deg for a missing position, along a track it has to stay missing
+    saa = np.where(np.isnan(height), np.nan, _azimuth(height, t_loc, lat, declination))
+
+    return _zenith(height, np.asarray(pres), np.asarray(temp)), saa[()]
 
 
 def julian_day(year, month, day, t0):
@@ -183,45 +266,21 @@ def julian_day(year, month, day, t0):
 
 
     """
-    year = int(year)
-    month = int(month)
-    day = int(day)
+    year = np.asarray(year).astype(int)
+    month = np.asarray(month).astype(int)
+    day = np.asarray(day).astype(int)
+    if np.any((month < 1) | (month > 12)):
+        raise ValueError("month has to be between 1 and 12!")
     # leap year -> s=1:
-    s = 0
-    if year % 4 == 0:
-        s = 1
-    if s == 1 and year % 100 == 0 and year % 400 != 0:
-        s = 0
-    if month == 1:
-        jd = day
-    if month == 2:
-        jd = day + 31
-    if month == 3:
-        jd = day + 31 + 28 + s
-    if month == 4:
-        jd = day + 31 + 28 + s + 31
-    if month == 5:
-        jd = day + 31 + 28 + s + 31 + 30
-    if month == 6:
-        jd = day + 31 + 28 + s + 31 + 30 + 31
-    if month == 7:
-        jd = day + 31 + 28 + s + 31 + 30 + 31 + 30
-    if month == 8:
-        jd = day + 31 + 28 + s + 31 + 30 + 31 + 30 + 31
-    if month == 9:
-        jd = day + 31 + 28 + s + 31 + 30 + 31 + 30 + 31 + 31
-    if month == 10:
-        jd = day + 31 + 28 + s + 31 + 30 + 31 + 30 + 31 + 31 + 30
-    if month == 11:
-        jd = day + 31 + 28 + s + 31 + 30 + 31 + 30 + 31 + 31 + 30 + 31
-    if month == 12:
-        jd = day + 31 + 28 + s + 31 + 30 + 31 + 30 + 31 + 31 + 30 + 31 + 30
-    #                      J  (F+s)M  A  M  J  J  A  S  O  N
+    s = (year % 4 == 0) & ~((year % 100 == 0) & (year % 400 != 0))
+    # days before the first of each month in a non leap year
+    days_before_month = np.array([0, 31, 59, 90, 120, 151, 181, 212, 243, 273, 304, 334])
+    jd = day + days_before_month[month - 1] + np.where(month > 2, s, 0)
     jd = (
         jd + t0 / 24.0
     )  # consider time of day (important for the hourly change of declination which can be large in spring/autumn)
 
-    return jd
+    return jd[()]
 
 
 def local_time(julian, t0, lon):
@@ -245,15 +304,96 @@ def local_time(julian, t0, lon):
 
     """
     mean_local_time_min = t0 * 60.0 + 4.0 * lon
+    fac = equation_of_time(julian)
+    corrected_local_time = (mean_local_time_min + fac) / 60.0
+
+    return corrected_local_time
+
+
+def equation_of_time(julian):
+    """
+    Equation of time as used in :py:func:`local_time`.
+
+    Args:
+        julian: julian day (day of year) as calculated with julian2.pro
+
+    Returns:
+        Difference between apparent and mean solar time (in minutes)
+
+    """
     fac = (
         0.0132 * 0.5
         + 7.3525 * np.cos(2.0 * np.pi * julian / 365.0 + 1.4989)
         + 9.9359 * np.cos(2.0 * 2.0 * np.pi * julian / 365.0 + 1.9006)
         + 0.3387 * np.cos(3.0 * 2.0 * np.pi * julian / 365.0 + 1.8360)
     )
-    corrected_local_time = (mean_local_time_min + fac) / 60.0
 
-    return corrected_local_time
+    return fac
+
+
+# ephemeris tables already calculated in this process, keyed by year, day of year and resolution
+_ephemeris_tables = dict()
+
+
+def get_ephemeris_table(year: int, day_of_year: int, resolution: float = 1.0) -> dict:
+    """
+    Return a table of declination and equation of time for one day calculated with :py:func:`dec` and
+    :py:func:`equation_of_time`. Tables are only calculated once per process.
+
+    Args:
+        year: The year (e.g. 2020)
+        day_of_year: julian day (day of year) without time of day
+        resolution: time step of the table in minutes
+
+    Returns:
+        dictionary with julian day (julian), declination in deg (dec) and equation of time in minutes (eot) from
+        day_of_year to day_of_year + 1
+
+    """
+    key = (int(year), int(day_of_year), float(resolution))
+    if key not in _ephemeris_tables:
+        julian = np.linspace(day_of_year, day_of_year + 1, int(round(1440 / resolution)) + 1)
+        _ephemeris_tables[key] = dict(julian=julian, dec=dec(julian, year), eot=equation_of_time(julian))
+
+    return _ephemeris_tables[key]
+
+
+def ephemeris(julian, year, resolution: float = 1.0):
+    """
+    Declination and equation of time interpolated linearly from cached daily tables (see
+    :py:func:`get_ephemeris_table`) instead of evaluating the formulas for every sample.
+
+    Both quantities change slowly and smoothly, so the linear interpolation error is bounded by
+    resolution² / 8 times the maximum second derivative.
+    For the default resolution of 1 minute the maximum deviation from :py:func:`dec` and :py:func:`equation_of_time`
+    over the years 2000 to 2030 is below 1e-9 deg for the declination and below 1e-9 minutes for the equation of time,
+    which results in solar zenith and azimuth angle deviations below 1e-7 deg.
+    The error grows with the square of the resolution (below 2e-6 deg and 4e-6 minutes at 1 hour).
+
+    Args:
+        julian: julian day (day of year) including the time of day as calculated with :py:func:`julian_day`
+        year: The year (e.g. 2020)
+        resolution: time step of the tables in minutes
+
+    Returns:
+        declination (deg) and equation of time (minutes)
+
+    """
+    julian, year = np.broadcast_arrays(np.asarray(julian, dtype=float), np.asarray(year))
+    declination, eot = np.full(julian.shape, np.nan), np.full(julian.shape, np.nan)
+    finite = np.isfinite(julian)  # NaT or NaN times stay NaN
+    # usually only one year and one or two dates per flight
+    for y in np.unique(year[finite]):
+        in_year = finite & (year == y)
+        jd = julian[in_year]
+        days = range(int(np.floor(jd.min())), int(np.floor(jd.max())) + 1)
+        tables = [get_ephemeris_table(y, d, resolution) for d in days]
+        # neighbouring tables share their boundary value
+        table = {k: np.concatenate([t[k][:-1] for t in tables[:-1]] + [tables[-1][k]]) for k in tables[0]}
+        declination[in_year] = np.interp(jd, table["julian"], table["dec"])
+        eot[in_year] = np.interp(jd, table["julian"], table["eot"])
+
+    return declination[()], eot[()]
 
 
 def refract(elv, pres, temp):
@@ -286,3 +426,88 @@ def refract(elv, pres, temp):
     refcor = refcor / 60.0 * np.pi / 180.0
 
     return refcor
+
+
+def _solar_geometry(time, lat, lon, pres, temp, ephemeris_resolution):
+    """
+    Calculate solar zenith angle, solar azimuth angle and refraction corrected solar elevation (deg) for one chunk.
+    """
+    sza, saa = get_sza_saa(time, lat, lon, pres, temp, ephemeris_resolution)
+
+    return sza, saa, 90.0 - sza
+
+
+@xr.register_dataset_accessor("pylim")
+class PylimDatasetAccessor:
+    """
+    pylim functions available on every xarray Dataset via ``ds.pylim`` once :py:mod:`pylim.solar_position` is
+    imported.
+
+    Examples:
+        >>> import pylim.solar_position
+        >>> bahamas = reader.read_bahamas(bahamas_path).chunk(time=100000)
+        >>> bahamas = bahamas.pylim.solar_geometry(pressure="PS", temperature=bahamas.TS - 273.15)
+
+    """
+    latitude_names = ["IRS_LAT", "lat", "latitude", "LAT"]
+    longitude_names = ["IRS_LON", "lon", "longitude", "LON"]
+
+    def __init__(self, ds: xr.Dataset):
+        self._ds = ds
+
+    def _get_variable(self, var, names: list = None):
+        """Return var as DataArray if it is a variable name, the first of names found in the Dataset if var is None
+        or var itself otherwise"""
+        if var is None:
+            try:
+                var = next(name for name in names if name in self._ds.variables)
+            except StopIteration:
+                raise KeyError(f"None of {names} found in Dataset! Give the variable name explicitly.")
+        return self._ds[var] if isinstance(var, str) else var
+
+    def solar_geometry(self, pressure=1013.25, temperature=15.0, **kwargs) -> xr.Dataset:
+        """
+        Calculate the solar zenith angle, the solar azimuth angle and the refraction corrected solar elevation for
+        every time step with :py:func:`get_sza_saa`.
+        The calculation is done chunk wise with :py:func:`xarray.apply_ufunc`, thus dask backed Datasets (e.g.
+        opened with ``chunks`` or ``open_mfdataset`` for several flights) stay lazy and can be computed out-of-core.
+
+        Args:
+            pressure: Surface Pressure in hPa (for refraction correction), number, variable name or DataArray
+            temperature: Surface Temperature in deg C (for refraction correction), number, variable name or DataArray
+            **kwargs:
+                time (str): name of the time variable (default: time)
+                lat (str): name of the latitude variable (default: first of IRS_LAT, lat, latitude, LAT)
+                lon (str): name of the longitude variable (default: first of IRS_LON, lon, longitude, LON)
+                ephemeris_resolution (float): resolution of the ephemeris tables in minutes (default: 1),
+                    None calculates declination and equation of time for each time step, see :py:func:`ephemeris`
+
+        Returns:
+            A new Dataset with the additional variables sza, saa and solar_elevation
+
+        """
+        time = self._get_variable(kwargs["time"] if "time" in kwargs else "time")
+        lat = self._get_variable(kwargs["lat"] if "lat" in kwargs else None, self.latitude_names)
+        lon = self._get_variable(kwargs["lon"] if "lon" in kwargs else None, self.longitude_names)
+        ephemeris_resolution = kwargs["ephemeris_resolution"] if "ephemeris_resolution" in kwargs else 1.0
+        pressure, temperature = self._get_variable(pressure), self._get_variable(temperature)
+
+        sza, saa, elevation = xr.apply_ufunc(
+            _solar_geometry,
+            time,
+            lat,
+            lon,
+            pressure,
+            temperature,
+            kwargs=dict(ephemeris_resolution=ephemeris_resolution),
+            output_core_dims=[[], [], []],  # one entry per output
+            dask="parallelized",  # the function works on whole chunks, no need to vectorize
+            output_dtypes=[float, float, float],
+        )
+        sza.attrs = dict(units="degree", long_name="solar zenith angle", standard_name="solar_zenith_angle")
+        saa.attrs = dict(units="degree", long_name="solar azimuth angle", standard_name="solar_azimuth_angle",
+                         comment="clockwise from north")
+        elevation.attrs = dict(units="degree", long_name="solar elevation angle corrected for refraction",
+                               standard_name="solar_elevation_angle")
+
+        return self._ds.assign(sza=sza, saa=saa, solar_elevation=elevation)
@@ -0,0 +1,41 @@
+#!/usr/bin/env python
+"""Shared fixtures for the pylim tests
+
+*author*: Johannes Röttenbacher
+"""
+
+import os
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+from pylim import cirrus_hl
+from pylim import smart
+
+
+@pytest.fixture
+def smart_flight(tmp_path, monkeypatch):
+    """
+    Directory tree of one CIRRUS-HL flight with a config.toml in the working directory, pixel to wavelength files for
+    the Fdw spectrometers and an empty calibration folder.
+    """
+    flight = "Flight_20210625a"
+    base_dir, pixel_wl, calib = tmp_path / "base", tmp_path / "pixel_wl", tmp_path / "calib"
+    for folder in ["raw", "data", "calibrated"]:
+        os.makedirs(base_dir / flight / folder)
+    os.makedirs(pixel_wl)
+    os.makedirs(calib)
+    (tmp_path / "config.toml").write_text(
+        f'["cirrus-hl".lim_server]\nbase_dir = "{base_dir}"\nraw = "raw"\ndata = "data"\ncalibrated = "calibrated"\n'
+        f'plot = "plot"\npixel_wl = "{pixel_wl}"\ncalib = "{calib}"\n')
+    for channel, n_pixels in [("SWIR", 256), ("VNIR", 1024)]:
+        spectrometer = cirrus_hl.smart_lookup[smart.meta["cirrus-hl"][f"Fdw_{channel}"]]
+        lines = ["h"] * 7 + [f"{p} {w:.3f}" for p, w in zip(range(1, n_pixels + 1),
+                                                             np.linspace(200, 2200, n_pixels))]
+        (pixel_wl / f"pixel_wl_{spectrometer}.dat").write_text("\n".join(lines) + "\n")
+    monkeypatch.chdir(tmp_path)
+
+    return SimpleNamespace(flight=flight, raw=str(base_dir / flight / "raw"), data=str(base_dir / flight / "data"),
+                           calibrated=str(base_dir / flight / "calibrated"), calib=str(calib),
+                           pixel_wl=str(pixel_wl))
@@ -0,0 +1,89 @@
+#!/usr/bin/env python
+"""Regression tests for pylim.bacardi against the original implementations
+
+*author*: Johannes Röttenbacher
+"""
+
+import dask.array as da
+import numpy as np
+import pytest
+import xarray as xr
+
+from pylim import bacardi
+
+
+def fdw_attitude_correction_original(fdw, roll, pitch, yaw, sza, saa, fdir, r_off: float = 0, p_off: float = 0):
+    """Original version of bacardi.fdw_attitude_correction which retries with factor[:, None] for 2D input"""
+    r = np.deg2rad(roll + r_off)
+    p = np.deg2rad(pitch + p_off)
+    h0 = np.deg2rad(90 - sza)
+
+    factor = np.sin(h0) / (
+        np.cos(h0) * np.sin(r) * np.sin(np.deg2rad(saa - yaw))
+        + np.cos(h0) * np.sin(p) * np.cos(r) * np.cos(np.deg2rad(saa - yaw))
+        + np.sin(h0) * np.cos(p) * np.cos(r)
+    )
+    try:
+        fdw_cor = fdir * fdw * factor + (1 - fdir) * fdw
+    except ValueError:
+        fdw_cor = fdir * fdw * factor[:, None] + (1 - fdir) * fdw
+
+    return fdw_cor, factor
+
+
+@pytest.fixture
+def attitude():
+    """Attitude angles, solar position and spectral irradiance with direct fraction of 300 time steps"""
+    rng = np.random.default_rng(13)
+    n, n_wl = 300, 50
+    angles = dict(roll=rng.normal(0, 2, n), pitch=rng.normal(2, 1, n), yaw=rng.uniform(0, 360, n),
+                  sza=rng.uniform(30, 80, n), saa=rng.uniform(0, 360, n))
+    fdw = rng.uniform(0, 2, (n, n_wl))
+    fdir = rng.uniform(0.3, 1, (n, n_wl))
+    return angles, fdw, fdir
+
+
+def test_attitude_correction_factor_matches_original(attitude):
+    angles, fdw, fdir = attitude
+    _, expected = fdw_attitude_correction_original(fdw[:, 0], **angles, fdir=0.8, r_off=0.3, p_off=-0.5)
+    factor = bacardi.attitude_correction_factor(**angles, r_off=0.3, p_off=-0.5)
+    np.testing.assert_allclose(factor, expected, rtol=1e-14, atol=0)
+
+
+@pytest.mark.parametrize("fdir_2d", [False, True])
+def test_fdw_attitude_correction_matches_original(attitude, fdir_2d):
+    angles, fdw, fdir = attitude
+    fdir = fdir if fdir_2d else 0.8
+    # 1D broadband irradiance
+    expected, expected_factor = fdw_attitude_correction_original(fdw[:, 0], **angles, fdir=0.8, p_off=1)
+    fdw_cor, factor = bacardi.fdw_attitude_correction(fdw[:, 0], **angles, fdir=0.8, p_off=1)
+    np.testing.assert_allclose(fdw_cor, expected, rtol=1e-14, atol=0)
+    np.testing.assert_allclose(factor, expected_factor, rtol=1e-14, atol=0)
+
+    # spectral irradiance (time, wavelength), the original only works with a 2D fdir
+    expected, _ = fdw_attitude_correction_original(fdw, **angles, fdir=fdir if fdir_2d else np.full(fdw.shape, fdir))
+    fdw_cor, _ = bacardi.fdw_attitude_correction(fdw, **angles, fdir=fdir)
+    np.testing.assert_allclose(fdw_cor, expected, rtol=1e-14, atol=0)
+
+    # time as second axis
+    fdw_cor_t, _ = bacardi.fdw_attitude_correction(fdw.T, **angles, fdir=fdir.T if fdir_2d else fdir, time_axis=1)
+    np.testing.assert_allclose(fdw_cor_t, expected.T, rtol=1e-14, atol=0)
+
+
+def test_fdw_attitude_correction_xarray_and_dask(attitude):
+    angles, fdw, fdir = attitude
+    expected, expected_factor = fdw_attitude_correction_original(fdw, **angles, fdir=fdir)
+    # any dimension order, numpy attitude angles are named along time
+    fdw_da = xr.DataArray(fdw.T, dims=["wavelength", "time"])
+    fdir_da = xr.DataArray(fdir, dims=["time", "wavelength"])
+    fdw_cor, factor = bacardi.fdw_attitude_correction(fdw_da, **angles, fdir=fdir_da)
+    assert fdw_cor.dims == ("wavelength", "time")
+    np.testing.assert_allclose(fdw_cor.transpose("time", "wavelength").values, expected, rtol=1e-14, atol=0)
+    np.testing.assert_allclose(factor, expected_factor, rtol=1e-14, atol=0)
+
+    # dask input stays lazy
+    angles_dask = {k: da.from_array(v, chunks=100) for k, v in angles.items()}
+    fdw_cor, factor = bacardi.fdw_attitude_correction(da.from_array(fdw, chunks=(100, 50)), **angles_dask,
+                                                      fdir=da.from_array(fdir, chunks=(100, 50)))
+    assert isinstance(fdw_cor, da.Array) and isinstance(factor, da.Array)
+    np.testing.assert_allclose(fdw_cor.compute(), expected, rtol=1e-14, atol=0)
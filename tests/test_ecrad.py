@@ -0,0 +1,444 @@
+#!/usr/bin/env python
+"""Regression tests for pylim.ecrad against the original scalar implementations
+
+*author*: Johannes Röttenbacher
+"""
+
+import numpy as np
+import pandas as pd
+import pytest
+import xarray as xr
+
+from pylim import ecrad
+from pylim import helpers as h
+
+from test_meteorological_formulas import barometric_height_loop as met_barometric_height_loop
+
+
+def ice_effective_radius_scalar(PPRESSURE, PTEMPERATURE, PCLOUD_FRAC, PQ_ICE, PQ_SNOW, PLAT):
+    """Original scalar version of ecrad.ice_effective_radius"""
+    RRE2DE = 0.64952
+    RMIN_ICE = 60
+    RTT = 273.15
+    RD = 287
+
+    ZDEFAULT_RE_UM = 80 * RRE2DE
+    ZMIN_DIAMETER_UM = 20 + (RMIN_ICE - 20) * np.cos((PLAT * np.pi / 180))
+
+    if (PCLOUD_FRAC > 0.001) and (PQ_ICE + PQ_SNOW > 0):
+        ZAIR_DENSITY_GM3 = 1000 * PPRESSURE / (RD * PTEMPERATURE)
+        ZIWC_INCLOUD_GM3 = ZAIR_DENSITY_GM3 * (PQ_ICE + PQ_SNOW) / PCLOUD_FRAC
+        PTEMPERATURE_C = PTEMPERATURE - RTT
+        ZAIWC = 45.8966 * ZIWC_INCLOUD_GM3 ** (0.2214)
+        ZBIWC = 0.7957 * ZIWC_INCLOUD_GM3 ** (0.2535)
+        ZDIAMETER_UM = (1.2351 + 0.0105 * PTEMPERATURE_C) * (ZAIWC + ZBIWC * (PTEMPERATURE - 83.15))
+        ZDIAMETER_UM = np.min([np.max([ZDIAMETER_UM, ZMIN_DIAMETER_UM]), 155])
+        PRE_UM = ZDIAMETER_UM * RRE2DE
+    else:
+        PRE_UM = ZDEFAULT_RE_UM
+
+    return PRE_UM * 1e-6
+
+
+def liquid_effective_radius_scalar(PPRESSURE, PTEMPERATURE, PCLOUD_FRAC, PQ_LIQ, PQ_RAIN):
+    """Original scalar version of ecrad.liquid_effective_radius"""
+    PP_MIN_RE_UM = 4
+    PP_MAX_RE_UM = 30
+    ZCCN = 50
+    ZSPECTRAL_DISPERSION = 0.77
+    R_DRY = 287
+    REPSCW = 1.0e-12
+    REPLOG = 1.0e-12
+
+    ZNTOT_CM3 = -1.15 * 10e-3 * ZCCN * ZCCN + 0.963 * ZCCN + 5.3
+    ZRATIO = (0.222 / ZSPECTRAL_DISPERSION) ** (0.333)
+
+    if (PCLOUD_FRAC > 0.001) and (PQ_LIQ + PQ_RAIN > 0):
+        ZAIR_DENSITY_GM3 = 1000 * PPRESSURE / (R_DRY * PTEMPERATURE)
+        ZLWC_GM3 = ZAIR_DENSITY_GM3 * PQ_LIQ / PCLOUD_FRAC
+        ZRWC_GM3 = ZAIR_DENSITY_GM3 * PQ_RAIN / PCLOUD_FRAC
+        if ZLWC_GM3 > REPSCW:
+            ZRAIN_RATIO = ZRWC_GM3 / ZLWC_GM3
+            ZWOOD_FACTOR = ((1 + ZRAIN_RATIO) ** 0.666) / (1 + 0.2 * ZRATIO * ZRAIN_RATIO)
+        else:
+            ZWOOD_FACTOR = 1
+
+        ZRE_CUBED = (3 * (ZLWC_GM3 + ZRWC_GM3)) / (4 * np.pi * ZNTOT_CM3 * ZSPECTRAL_DISPERSION)
+        if ZRE_CUBED > REPLOG:
+            PRE_UM = ZWOOD_FACTOR * 100 * np.exp(0.333 * np.log(ZRE_CUBED))
+            if PRE_UM < PP_MIN_RE_UM:
+                PRE_UM = PP_MIN_RE_UM
+            if PRE_UM > PP_MAX_RE_UM:
+                PRE_UM = PP_MAX_RE_UM
+        else:
+            PRE_UM = PP_MIN_RE_UM
+    else:
+        PRE_UM = PP_MIN_RE_UM
+
+    return PRE_UM * 1e-6
+
+
+@pytest.fixture
+def ifs_points():
+    """Random IFS like grid points with clear sky, thin and cloudy cases"""
+    rng = np.random.default_rng(42)
+    n = 20000
+    cloud_fraction = rng.choice([0, 0.0005, 0.3, 1.0], n) * rng.uniform(0, 1, n)
+    return dict(
+        pressure=rng.uniform(1e4, 1e5, n),
+        temperature=rng.uniform(190, 290, n),
+        cloud_fraction=cloud_fraction,
+        q_1=rng.choice([0, 1], n) * 10 ** rng.uniform(-9, -3, n),
+        q_2=rng.choice([0, 1], n) * 10 ** rng.uniform(-9, -3, n),
+        lat=rng.uniform(-90, 90, n),
+    )
+
+
+def test_ice_effective_radius_bit_identical(ifs_points):
+    p = ifs_points
+    args = (p["pressure"], p["temperature"], p["cloud_fraction"], p["q_1"], p["q_2"], p["lat"])
+    expected = np.vectorize(ice_effective_radius_scalar)(*args)
+    np.testing.assert_array_equal(ecrad.ice_effective_radius(*args), expected)
+
+
+def test_ice_effective_radius_scalar_input():
+    args = (50000.0, 230.0, 0.5, 1e-5, 0.0, 60.0)
+    result = ecrad.ice_effective_radius(*args)
+    assert np.ndim(result) == 0
+    assert result == ice_effective_radius_scalar(*args)
+
+
+def test_liquid_effective_radius_bit_identical(ifs_points):
+    p = ifs_points
+    args = (p["pressure"], p["temperature"], p["cloud_fraction"], p["q_1"], p["q_2"])
+    expected = np.vectorize(liquid_effective_radius_scalar)(*args)
+    np.testing.assert_array_equal(ecrad.liquid_effective_radius(*args), expected)
+
+
+def test_apply_liquid_effective_radius_rgrid(ifs_points):
+    """Data sets on a reduced Gaussian grid (rgrid) are chunked by their own dimensions"""
+    p = {k: v.reshape(4, 5, 1000) for k, v in ifs_points.items()}
+    dims = ["time", "level", "rgrid"]
+    ds = xr.Dataset(dict(pressure_full=(dims, p["pressure"]), t=(dims, p["temperature"]),
+                         cloud_fraction=(dims, p["cloud_fraction"]), clwc=(dims, p["q_1"]), crwc=(dims, p["q_2"])))
+    expected = np.vectorize(liquid_effective_radius_scalar)(p["pressure"], p["temperature"], p["cloud_fraction"],
+                                                            p["q_1"], p["q_2"])
+    result = ecrad.apply_liquid_effective_radius(ds)
+    assert result.re_liquid.dims == tuple(dims)
+    np.testing.assert_array_equal(result.re_liquid.values, expected)
+
+
+def test_ice_optics_coefficients_cache_is_protected():
+    ds = ecrad.get_ice_optics_coefficients("fu")
+    var = next(iter(ds.data_vars))
+    ds[var] = ds[var] * 2
+    ds.attrs["changed"] = True
+    with pytest.raises(ValueError):
+        ecrad.get_ice_optics_coefficients("fu")[var].values[...] = 0  # shared arrays are read-only
+    cached = ecrad.get_ice_optics_coefficients("fu")
+    assert "changed" not in cached.attrs
+    ecrad.clear_ice_optics_coefficients()
+    xr.testing.assert_identical(cached, ecrad.get_ice_optics_coefficients("fu"))
+
+
+def calc_ice_optics_yi_loop(bands, ice_wp, r_eff):
+    """Original band and look up table loop version of ecrad.calc_ice_optics_yi"""
+    NSingleCoeffs = 23
+    ds = ecrad.get_ice_optics_coefficients("yi")
+    nb = len(ds[f"band_{bands}"])  # number of bands
+    lu_scale = 0.2
+    lu_offset = 1.0
+    coeff = ds[f"coeff_{bands}1"]  # Band-specific coefficients
+    de_um = r_eff * 2.0e6
+
+    replace_values = np.isnan(de_um) | (~np.isnan(de_um) & (de_um < 119.99))
+    de_um = de_um.where(replace_values, 119.99)
+    replace_values = np.isnan(de_um) | (~np.isnan(de_um) & (de_um > 10))
+    de_um = de_um.where(replace_values, 10.0)
+
+    iwp_gm_2 = ice_wp * 1000.0
+    lu_idx = np.floor(de_um * lu_scale - lu_offset)
+    wts_2 = (de_um * lu_scale - lu_offset) - lu_idx
+    wts_1 = 1.0 - wts_2
+
+    od_list, scat_od, g = list(), list(), list()
+    for i in range(nb):
+        c = coeff[i, :].values
+        c1, c2, c3, c4, c5, c6 = (np.copy(lu_idx) for _ in range(6))
+        for key, value in enumerate(c):
+            k = key + 1
+            c1[lu_idx == k] = value
+            try:
+                c2[lu_idx == k] = c[k]
+                c3[lu_idx == k] = c[key + NSingleCoeffs]
+                c4[lu_idx == k] = c[key + NSingleCoeffs + 1]
+                c5[lu_idx == k] = c[key + 2 * NSingleCoeffs]
+                c6[lu_idx == k] = c[key + 2 * NSingleCoeffs + 1]
+            except IndexError:
+                pass
+
+        od = 0.001 * iwp_gm_2 * (wts_1 * c1 + wts_2 * c2)
+        od_list.append(od)
+        scat_od.append(od * (wts_1 * c3 + wts_2 * c4))
+        g.append(wts_1 * c5 + wts_2 * c6)
+
+    return tuple(xr.concat(x, dim=f"band_{bands}") for x in (od_list, scat_od, g))
+
+
+@pytest.fixture
+def ice_cloud():
+    """Ice water path and effective radius on a (time, level) grid including nan values and the edges of the LUTs"""
+    rng = np.random.default_rng(7)
+    shape = (30, 40)
+    r_eff = rng.uniform(1e-6, 130e-6, shape)
+    r_eff.flat[:6] = [np.nan, 5e-6, 50e-6, 59.995e-6, 60e-6, 100e-6]
+    ice_wp = 10 ** rng.uniform(-6, -1, shape)
+    ice_wp.flat[6] = np.nan
+    qi = 10 ** rng.uniform(-8, -2, shape)
+    temperature = rng.uniform(190, 273, shape)
+    dims = ["time", "level"]
+    return dict(ice_wp=xr.DataArray(ice_wp, dims=dims), r_eff=xr.DataArray(r_eff, dims=dims),
+                qi=xr.DataArray(qi, dims=dims), temperature=xr.DataArray(temperature, dims=dims))
+
+
+@pytest.mark.parametrize("bands", ["sw", "lw"])
+def test_calc_ice_optics_yi_matches_loop(ice_cloud, bands):
+    expected = calc_ice_optics_yi_loop(bands, ice_cloud["ice_wp"], ice_cloud["r_eff"])
+    result = ecrad.calc_ice_optics_yi(bands, ice_cloud["ice_wp"], ice_cloud["r_eff"])
+    for res, exp in zip(result, expected):
+        assert res.dims == exp.dims
+        np.testing.assert_allclose(res.values, exp.values, rtol=1e-14, atol=0)
+
+
+def test_calc_ice_optics_yi_dask(ice_cloud):
+    chunked = {k: v.chunk(time=10) for k, v in ice_cloud.items()}
+    result = ecrad.calc_ice_optics_yi("sw", chunked["ice_wp"], chunked["r_eff"])
+    expected = ecrad.calc_ice_optics_yi("sw", ice_cloud["ice_wp"], ice_cloud["r_eff"])
+    for res, exp in zip(result, expected):
+        assert res.chunks is not None
+        xr.testing.assert_identical(res.compute(), exp)
+
+
+def calc_ice_optics_fu_loop(bands, ice_wp, r_eff):
+    """Original band loop version of ecrad.calc_ice_optics_fu_sw and ecrad.calc_ice_optics_fu_lw"""
+    eps_type = "float32" if bands == "sw" else 1.0
+    MaxAsymmetryFactor = 1.0 - 10.0 * np.finfo(eps_type).eps
+    MaxEffectiveRadius = 100.0e-6
+    coeff = ecrad.get_ice_optics_coefficients("fu")[f"coeff_{bands}1"]
+    nb = 14 if bands == "sw" else 16
+    od, scat_od, g = [0.0] * nb, [0.0] * nb, [0.0] * nb
+
+    replace_values = np.isnan(r_eff) | (~np.isnan(r_eff) & (r_eff < MaxEffectiveRadius))
+    r_eff = r_eff.where(replace_values, MaxEffectiveRadius)
+    de_um = r_eff * (1.0e6 / 0.64952)
+    inv_de_um = 1.0 / de_um
+    iwp_gm_2 = ice_wp * 1000.0
+
+    for jb in range(nb):
+        if bands == "sw":
+            od[jb] = iwp_gm_2 * (coeff[jb, 0] + coeff[jb, 1] * inv_de_um)
+            scat_od[jb] = od[jb] * (
+                1.0 - (coeff[jb, 2] + de_um * (coeff[jb, 3] + de_um * (coeff[jb, 4] + de_um * coeff[jb, 5]))))
+            g_tmp = coeff[jb, 6] + de_um * (coeff[jb, 7] + de_um * (coeff[jb, 8] + de_um * coeff[jb, 9]))
+        else:
+            od[jb] = iwp_gm_2 * (coeff[jb, 0] + inv_de_um * (coeff[jb, 1] + inv_de_um * coeff[jb, 2]))
+            scat_od[jb] = od[jb] - iwp_gm_2 * inv_de_um * (
+                coeff[jb, 3] + de_um * (coeff[jb, 4] + de_um * (coeff[jb, 5] + de_um * coeff[jb, 6])))
+            g_tmp = coeff[jb, 7] + de_um * (coeff[jb, 8] + de_um * (coeff[jb, 9] + de_um * coeff[jb, 10]))
+        replace_values = np.isnan(g_tmp) | (~np.isnan(g_tmp) & (g_tmp < MaxAsymmetryFactor))
+        g[jb] = g_tmp.where(replace_values, MaxAsymmetryFactor)
+
+    return tuple(xr.concat(x, f"band_{bands}") for x in (od, scat_od, g))
+
+
+@pytest.mark.parametrize("bands", ["sw", "lw"])
+def test_calc_ice_optics_fu_matches_loop(ice_cloud, bands):
+    function = ecrad.calc_ice_optics_fu_sw if bands == "sw" else ecrad.calc_ice_optics_fu_lw
+    expected = calc_ice_optics_fu_loop(bands, ice_cloud["ice_wp"], ice_cloud["r_eff"])
+    result = function(ice_cloud["ice_wp"], ice_cloud["r_eff"])
+    for res, exp in zip(result, expected):
+        assert res.dims == exp.dims
+        np.testing.assert_array_equal(res.values, exp.values)
+
+
+def test_calc_ice_optics_fu_float32(ice_cloud):
+    """The asymmetry factor cap stays below one in single precision"""
+    od, scat_od, g = ecrad.calc_ice_optics_fu_lw(ice_cloud["ice_wp"], ice_cloud["r_eff"], dtype="float32")
+    assert od.dtype == scat_od.dtype == g.dtype == np.float32
+    assert float(g.max()) < 1
+    expected = calc_ice_optics_fu_loop("lw", ice_cloud["ice_wp"], ice_cloud["r_eff"])
+    np.testing.assert_allclose(od.values, expected[0].values, rtol=1e-5)
+
+
+def calc_ice_optics_baran2016_original(bands, ice_wp, qi, temperature):
+    """Original version of ecrad.calc_ice_optics_baran2016"""
+    max_qi = 1.0e-3
+    ds = ecrad.get_ice_optics_coefficients("baran2016")
+    nb = len(ds[f"band_{bands}"])
+    coeff = ds[f"coeff_{bands}"]
+    T2 = temperature * temperature
+    qi_over_T4 = 1.0 / (T2 * T2)
+
+    replace_values = np.isnan(qi) | (~np.isnan(qi) & (qi < max_qi))
+    qi_T = qi * temperature
+    qi_T = qi_T.where(replace_values, max_qi * temperature)
+
+    od = ice_wp * coeff[0:nb, 0] * qi_over_T4
+    scat_od = od * (coeff[0:nb, 1] + coeff[0:nb, 2] * qi_T)
+    g = coeff[0:nb, 3] + coeff[0:nb, 4] * qi_T
+
+    return od, scat_od, g
+
+
+def calc_ice_optics_baran2017_original(bands, ice_wp, qi, temperature):
+    """Original version of ecrad.calc_ice_optics_baran2017"""
+    ds = ecrad.get_ice_optics_coefficients("baran2017")
+    nb = len(ds[f"band_{bands}"])
+    coeff_gen = ds["coeff_gen"].values
+    coeff = ds[f"coeff_{bands}"]
+    qi_mod = qi * np.exp(coeff_gen[0] * (temperature - coeff_gen[1]))
+    qi_mod_od = qi_mod ** coeff_gen[2]
+    qi_mod_ssa = qi_mod ** coeff_gen[3]
+    qi_mod_g = qi_mod ** coeff_gen[4]
+
+    od = ice_wp * (coeff[0:nb, 0] + coeff[0:nb, 1] / (1.0 + qi_mod_od * coeff[0:nb, 2]))
+    scat_od = od * (coeff[0:nb, 3] + coeff[0:nb, 4] / (1.0 + qi_mod_ssa * coeff[0:nb, 5]))
+    g = coeff[0:nb, 6] + coeff[0:nb, 7] / (1.0 + qi_mod_g * coeff[0:nb, 8])
+
+    return od, scat_od, g
+
+
+@pytest.mark.parametrize("bands", ["sw", "lw"])
+def test_calc_ice_optics_matches_single_parameterizations(ice_cloud, bands):
+    c = ice_cloud
+    ds = ecrad.calc_ice_optics(bands, c["ice_wp"], c["qi"], c["temperature"], c["r_eff"])
+    assert list(ds.parameterization.values) == ["fu", "yi", "baran2016", "baran2017"]
+    expected = dict(
+        fu=calc_ice_optics_fu_loop(bands, c["ice_wp"], c["r_eff"]),
+        yi=calc_ice_optics_yi_loop(bands, c["ice_wp"], c["r_eff"]),
+        baran2016=calc_ice_optics_baran2016_original(bands, c["ice_wp"], c["qi"], c["temperature"]),
+        baran2017=calc_ice_optics_baran2017_original(bands, c["ice_wp"], c["qi"], c["temperature"]),
+    )
+    for parameterization, optics in expected.items():
+        for var, exp in zip(["od", "scat_od", "g"], optics):
+            res = ds[var].sel(parameterization=parameterization, drop=True)
+            np.testing.assert_allclose(res.values, exp.transpose(f"band_{bands}", ...).values, rtol=1e-14, atol=0)
+
+
+def test_calc_ice_optics_dask(ice_cloud):
+    chunked = {k: v.chunk(time=10) for k, v in ice_cloud.items()}
+    args = ("sw", "ice_wp", "qi", "temperature", "r_eff")
+    result = ecrad.calc_ice_optics(*args[:1], *(chunked[k] for k in args[1:]), parameterizations=["yi", "baran2017"])
+    expected = ecrad.calc_ice_optics(*args[:1], *(ice_cloud[k] for k in args[1:]),
+                                     parameterizations=["yi", "baran2017"])
+    assert result.od.chunks is not None
+    xr.testing.assert_allclose(result.compute(), expected)
+    with pytest.raises(ValueError):
+        ecrad.calc_ice_optics("sw", *(ice_cloud[k] for k in args[1:]), parameterizations=["mie"])
+
+
+def calc_pressure_loop(ds):
+    """Original level loop version of ecrad.calc_pressure"""
+    ph = ds["hyai"] + np.exp(ds["lnsp"].sel(lev_2=1, drop=True)) * ds["hybi"]
+    pf = list()
+    for hybrid in range(len(ph) - 1):
+        pf.append((ph.isel(nhyi=hybrid + 1) + ph.isel(nhyi=hybrid)) / 2.0)
+    pf = xr.concat(pf, "lev")
+    ds["pressure_hl"] = ph
+    ds["pressure_full"] = pf
+
+    return ds
+
+
+@pytest.fixture
+def ifs_hybrid_levels():
+    """IFS like data set with hybrid coefficients and the logarithm of the surface pressure"""
+    rng = np.random.default_rng(3)
+    n_half = 11
+    hyai = np.linspace(0, 2e4, n_half) * np.sin(np.linspace(0, np.pi, n_half))
+    hybi = np.linspace(0, 1, n_half) ** 2
+    lnsp = np.log(rng.uniform(9.5e4, 1.03e5, (4, 1, 3, 5)))
+    return xr.Dataset(
+        dict(hyai=("nhyi", hyai), hybi=("nhyi", hybi), lnsp=(["time", "lev_2", "lat", "lon"], lnsp)),
+        coords=dict(lev_2=[1], lat=np.arange(3.0), lon=np.arange(5.0)),
+    )
+
+
+def test_calc_pressure_matches_loop(ifs_hybrid_levels):
+    expected = calc_pressure_loop(ifs_hybrid_levels.copy())
+    result = ecrad.calc_pressure(ifs_hybrid_levels.copy())
+    xr.testing.assert_identical(result.pressure_hl, expected.pressure_hl)
+    xr.testing.assert_identical(result.pressure_full, expected.pressure_full)
+
+
+def test_calculate_pressure_height_matches_vectorize():
+    """The batched barometric height gives the same result as the original per profile apply_ufunc(vectorize=True)"""
+    rng = np.random.default_rng(5)
+    half_levels = np.linspace(0, 1, 16)
+    # the IFS output starts at the top of the atmosphere
+    pressure_hl = rng.uniform(9.5e4, 1.03e5, (4, 6, 1)) * half_levels ** 1.5
+    temperature_hl = rng.uniform(270, 300, (4, 6, 1)) - 80 * (1 - half_levels)
+    pressure_full = (pressure_hl[..., 1:] + pressure_hl[..., :-1]) / 2
+    temperature_full = (temperature_hl[..., 1:] + temperature_hl[..., :-1]) / 2
+    ds = xr.Dataset(dict(pressure_hl=(["time", "column", "half_level"], pressure_hl),
+                         temperature_hl=(["time", "column", "half_level"], temperature_hl),
+                         pressure_full=(["time", "column", "level"], pressure_full),
+                         t=(["time", "column", "level"], temperature_full)),
+                    coords=dict(half_level=np.arange(1, 17), level=np.arange(1, 16)))
+
+    result = ecrad.calculate_pressure_height(ds.copy())
+    for var, p, t, dim in [("press_height_hl", "pressure_hl", "temperature_hl", "half_level"),
+                           ("press_height_full", "pressure_full", "t", "level")]:
+        with np.errstate(divide="ignore"):
+            expected = xr.apply_ufunc(met_barometric_height_loop, ds[p], ds[t], input_core_dims=[[dim], [dim]],
+                                      output_core_dims=[[dim]], vectorize=True)
+        # assigning to the data set aligns the flipped coordinate with the one of the data set
+        expected = ds.assign({var: expected.assign_coords({dim: np.flip(expected[dim].to_numpy())})})[var]
+        expected = expected.where(~np.isnan(expected), 80000)
+        xr.testing.assert_identical(result[var], expected)
+
+
+def get_model_level_of_altitude_loop(altitude, model_ds, coord):
+    """Original time step loop version of ecrad.get_model_level_of_altitude"""
+    alt = altitude.sel(time=model_ds.time, method="nearest")
+    ts = len(model_ds.time)
+    height_level = np.zeros(ts)
+    var = "press_height_hl" if coord == "half_level" else "press_height_full"
+    for i in range(ts):
+        height_level[i] = h.arg_nearest(model_ds[var][i, :].to_numpy(), alt[i].to_numpy())
+
+    return xr.DataArray(height_level.astype(int), dims=["time"], coords={"time": model_ds.time})
+
+
+@pytest.fixture
+def flight_and_model():
+    """Flight altitude at 1 Hz and model heights every minute, with nan above the model top in some profiles"""
+    rng = np.random.default_rng(9)
+    time = pd.date_range("2022-04-11 08:00", periods=3 * 3600, freq="1s")
+    altitude = xr.DataArray(np.clip(12000 * np.sin(np.linspace(0, np.pi, time.size)) + rng.normal(0, 50, time.size),
+                                    0, None), dims=["time"], coords=dict(time=time))
+    model_time = time[::60]
+    heights = np.sort(rng.uniform(0, 20000, (model_time.size, 30)), axis=1)[:, ::-1]
+    heights[::7, :3] = np.nan
+    model_ds = xr.Dataset(dict(press_height_full=(["time", "level"], heights)),
+                          coords=dict(time=model_time, level=np.arange(1, 31)))
+    return altitude, model_ds
+
+
+def test_get_model_level_of_altitude_matches_loop(flight_and_model):
+    altitude, model_ds = flight_and_model
+    expected = get_model_level_of_altitude_loop(altitude, model_ds, "level")
+    result = ecrad.get_model_level_of_altitude(altitude, model_ds, "level")
+    xr.testing.assert_identical(result, expected)
+
+
+def test_get_model_level_of_altitude_extra_dimension(flight_and_model):
+    altitude, model_ds = flight_and_model
+    stacked = xr.concat([model_ds, model_ds + 100], dim="column").transpose("time", "column", "level")
+    result = ecrad.get_model_level_of_altitude(altitude, stacked, "level")
+    assert result.dims == ("time", "column")
+    for column in range(2):
+        expected = get_model_level_of_altitude_loop(altitude, stacked.isel(column=column), "level")
+        np.testing.assert_array_equal(result.isel(column=column).values, expected.values)
+    with pytest.raises(ValueError):
+        ecrad.get_model_level_of_altitude(altitude, model_ds, "height")
@@ -0,0 +1,197 @@
+#!/usr/bin/env python
+"""Regression tests for pylim.helpers against the original implementations
+
+*author*: Johannes Röttenbacher
+"""
+
+import numpy as np
+import pandas as pd
+import pytest
+import xarray as xr
+
+from pylim import helpers as h
+
+
+def longitude_values_for_gaussian_grid_loop(latitudes, n_points, longitude_boundaries=None):
+    """Original concatenating loop version of helpers.longitude_values_for_gaussian_grid"""
+    lon_values = [np.linspace(0, 360, num=points, endpoint=False) for points in n_points]
+    lon_values_out = np.array([])
+    lon_values_list = list()
+    for i, lons in enumerate(lon_values):
+        all_lons = np.where(lons > 180, (lons + 180) % 360 - 180, lons)
+        if longitude_boundaries is not None:
+            all_lons = all_lons[(all_lons >= longitude_boundaries[0]) & (all_lons <= longitude_boundaries[1])]
+            all_lons.sort()
+        lon_values_out = np.concatenate([lon_values_out, all_lons])
+        lon_values_list.append(all_lons)
+
+    lat_values_out = np.array([])
+    for i, lon_array in enumerate(lon_values_list):
+        lat = np.repeat(latitudes[i], lon_array.size)
+        lat_values_out = np.concatenate([lat_values_out, lat])
+
+    return lat_values_out, lon_values_out
+
+
+@pytest.fixture
+def gaussian_grid():
+    """Northern part of an octahedral reduced Gaussian grid (O80 like) with a longitude subset"""
+    latitudes = np.linspace(89, 50, 40)
+    n_points = 20 + 4 * np.arange(40)
+    return latitudes, n_points, (-60, 30)
+
+
+@pytest.fixture(autouse=True)
+def clear_grid_index_cache():
+    h.GaussianGridIndex._cache.clear()
+    yield
+    h.GaussianGridIndex._cache.clear()
+
+
+@pytest.mark.parametrize("boundaries", [None, (-60, 30)])
+def test_longitude_values_for_gaussian_grid_matches_loop(gaussian_grid, boundaries):
+    latitudes, n_points, _ = gaussian_grid
+    expected = longitude_values_for_gaussian_grid_loop(latitudes, n_points, boundaries)
+    result = h.longitude_values_for_gaussian_grid(latitudes, n_points, boundaries)
+    for res, exp in zip(result, expected):
+        np.testing.assert_array_equal(res, exp)
+
+
+def test_grid_index_query_matches_brute_force(gaussian_grid):
+    grid_index = h.GaussianGridIndex(*gaussian_grid)
+    rng = np.random.default_rng(1)
+    lat, lon = rng.uniform(55, 85, 500), rng.uniform(-50, 20, 500)
+    lat[:3] = np.nan
+    distance, idx = grid_index.query(lat, lon)
+
+    # haversine distance to all cells
+    lat1, lon1 = np.deg2rad(lat)[:, None], np.deg2rad(lon)[:, None]
+    lat2, lon2 = np.deg2rad(grid_index.lat)[None], np.deg2rad(grid_index.lon)[None]
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    all_distances = 2 * grid_index.earth_radius * np.arcsin(np.sqrt(a))
+    np.testing.assert_array_equal(idx[3:], np.argmin(all_distances[3:], axis=1))
+    np.testing.assert_allclose(distance[3:], np.min(all_distances[3:], axis=1), rtol=1e-6)
+    assert (idx[:3] == -1).all() and np.isinf(distance[:3]).all()
+
+
+def test_grid_index_k_larger_than_number_of_cells():
+    grid_index = h.GaussianGridIndex(np.array([60.0, 59.0]), np.array([4, 4]), (-100, 100))
+    n = grid_index.lat.size
+    distance, idx = grid_index.query(np.array([60.0, np.nan]), np.array([0.0, 0.0]), k=n + 2)
+    assert idx.shape == (2, n + 2)
+    assert (idx[0, n:] == -1).all() and np.isinf(distance[0, n:]).all()
+    assert (idx[0, :n] >= 0).all() and np.isfinite(distance[0, :n]).all()
+    assert (idx[1] == -1).all()
+    np.testing.assert_array_equal(grid_index.cells_along_track([60.0], [0.0], k=n + 2), np.arange(n))
+
+
+def test_grid_index_cache_round_trip(gaussian_grid, tmp_path):
+    cache_file = str(tmp_path / "grid_index.npz")
+    grid_index = h.GaussianGridIndex.from_grid(*gaussian_grid, cache_file=cache_file)
+    assert h.GaussianGridIndex.from_grid(*gaussian_grid) is grid_index
+    with np.load(cache_file, allow_pickle=False) as data:
+        assert sorted(data.files) == ["key", "lat", "lon"]
+
+    h.GaussianGridIndex._cache.clear()
+    loaded = h.GaussianGridIndex.from_grid(*gaussian_grid, cache_file=cache_file)
+    assert loaded is not grid_index and loaded.key == grid_index.key
+    np.testing.assert_array_equal(loaded.lat, grid_index.lat)
+    lat, lon = np.array([70.1, 61.3]), np.array([-10.2, 5.5])
+    np.testing.assert_array_equal(loaded.query(lat, lon, k=3)[1], grid_index.query(lat, lon, k=3)[1])
+
+    # a different grid definition in the same file is rebuilt and overwrites the cache
+    latitudes, n_points, _ = gaussian_grid
+    other = h.GaussianGridIndex.from_grid(latitudes, n_points, (-20, 20), cache_file=cache_file)
+    assert other.key != grid_index.key
+    assert h.GaussianGridIndex.load(cache_file).key == other.key
+
+
+def test_grid_index_rejects_invalid_cache(gaussian_grid, tmp_path):
+    cache_file = tmp_path / "grid_index.npz"
+    with open(cache_file, "wb") as f:
+        np.savez(f, key=np.array("abc"), lat=np.array([91.0]), lon=np.array([0.0]))
+    with pytest.raises(ValueError):
+        h.GaussianGridIndex.load(str(cache_file))
+    with open(cache_file, "wb") as f:
+        np.save(f, np.array([dict(key="abc")]), allow_pickle=True)
+    with pytest.raises(ValueError):
+        h.GaussianGridIndex.load(str(cache_file))
+
+    grid_index = h.GaussianGridIndex.from_grid(*gaussian_grid, cache_file=str(cache_file))
+    assert h.GaussianGridIndex.load(str(cache_file)).key == grid_index.key
+
+
+@pytest.fixture
+def multi_rate():
+    """10 Hz source data with a 3 s gap and NaNs and a 1 Hz target time base reaching beyond the source data"""
+    rng = np.random.default_rng(14)
+    time = pd.date_range("2021-06-25 11:00:00.05", periods=600, freq="100ms")
+    keep = (time < pd.Timestamp("2021-06-25 11:00:20")) | (time >= pd.Timestamp("2021-06-25 11:00:23"))
+    time = time[keep]
+    n = len(time)
+    # add some jitter to the source time, this also creates exact ties with the target time steps
+    time = time + pd.to_timedelta(rng.choice([0, 0, 50], n), unit="ms")
+    flux = rng.uniform(0, 1, (n, 3))
+    flux[[10, 11, 200]] = np.nan
+    ds = xr.Dataset(dict(flux=(("time", "wavelength"), flux), alt=("time", rng.integers(0, 1000, n)),
+                         wavelength_info=("wavelength", [400.0, 500.0, 600.0])),
+                    coords=dict(time=time, wavelength=[400, 500, 600]), attrs=dict(source="test"))
+    target = pd.date_range("2021-06-25 10:59:58", "2021-06-25 11:01:02", freq="1s")
+    h.TimeAlignment.clear_cache()
+    yield ds, target
+    h.TimeAlignment.clear_cache()
+
+
+@pytest.mark.parametrize("tolerance", [None, "50ms"])
+def test_time_alignment_nearest_matches_reindex(multi_rate, tolerance):
+    ds, target = multi_rate
+    result = h.align_time(ds, target, method="nearest", tolerance=tolerance)
+    expected = ds.reindex(time=target, method="nearest", tolerance=tolerance)
+    if tolerance is None:
+        # the alignment does not extrapolate beyond the source time range
+        outside = (target < ds.time.values[0]) | (target > ds.time.values[-1])
+        expected = expected.where(xr.DataArray(~outside, coords=dict(time=target)))
+        expected["wavelength_info"] = ds.wavelength_info
+    xr.testing.assert_identical(result, expected)
+    assert np.isnan(result.alt.values).any()
+
+
+def test_time_alignment_linear_matches_interp(multi_rate):
+    ds, target = multi_rate
+    ds = ds.fillna(0.5)
+    result = h.align_time(ds, target, method="linear")
+    expected = ds.interp(time=target)
+    xr.testing.assert_allclose(result, expected, rtol=1e-14, atol=0)
+    # with a tolerance the 3 s gap is not interpolated
+    result = h.align_time(ds, target, method="linear", tolerance="1s")
+    time = ds.time.values
+    gap = np.argmax(np.diff(time))
+    in_gap = (target > time[gap]) & (target < time[gap + 1])
+    assert in_gap.sum() >= 2 and np.isnan(result.flux.values[in_gap]).all()
+    xr.testing.assert_allclose(result.isel(time=~in_gap), expected.isel(time=~in_gap), rtol=1e-14, atol=0)
+
+
+def test_time_alignment_mean_matches_resample(multi_rate):
+    ds, target = multi_rate
+    result = h.align_time(ds, target, method="mean")
+    expected = ds.resample(time="1s", closed="left", label="left").mean().reindex(time=target)
+    expected["wavelength_info"] = ds.wavelength_info
+    xr.testing.assert_allclose(result, expected, rtol=1e-14, atol=0)
+    assert np.isnan(result.flux.values[:2]).all()
+
+
+@pytest.mark.parametrize("method", h.TimeAlignment.methods)
+def test_time_alignment_chunked(multi_rate, method):
+    ds, target = multi_rate
+    expected = h.align_time(ds, target, method=method, tolerance="1s")
+    # dask stays lazy and numpy is aligned in blocks with the same result
+    result = h.align_time(ds.chunk(time=70), target, method=method, tolerance="1s")
+    assert result.flux.chunks is not None
+    xr.testing.assert_identical(result.compute(), expected)
+    xr.testing.assert_identical(h.align_time(ds, target, method=method, tolerance="1s", chunk_size=7), expected)
+    # the mapping is shared between all variables and calls
+    assert len(h.TimeAlignment._cache) == 1
+
+    df = ds.flux.to_pandas()
+    np.testing.assert_array_equal(h.align_time(df, target, method=method, tolerance="1s").to_numpy(),
+                                  expected.flux.values)
@@ -0,0 +1,65 @@
+#!/usr/bin/env python
+"""Regression tests for pylim.meteorological_formulas against the original profile loop implementations
+
+*author*: Johannes Röttenbacher
+"""
+
+import numpy as np
+import pytest
+
+from pylim import meteorological_formulas as met
+
+
+def barometric_height_loop(pressure_profile, temperature_profile):
+    """Original single profile loop version of meteorological_formulas.barometric_height"""
+    g_geo = 9.81
+    R = 8.314
+    molar_mass_air = 0.02896
+    if not pressure_profile[0] > pressure_profile[-1]:
+        pressure_profile = np.flip(pressure_profile)
+    if not temperature_profile[0] > temperature_profile[-1]:
+        temperature_profile = np.flip(temperature_profile)
+
+    levels = len(pressure_profile)
+    barometric_height = np.zeros(levels)
+    p_low = pressure_profile[0]
+    for j in range(1, levels):
+        p_high = pressure_profile[j]
+        t_high = temperature_profile[j]
+        delta_h = -np.log(p_high / p_low) * R * t_high / (molar_mass_air * g_geo)
+        barometric_height[j] = barometric_height[j - 1] + delta_h
+        p_low = pressure_profile[j]
+
+    barometric_height = np.where(barometric_height == np.inf, np.nan, barometric_height)
+    return barometric_height
+
+
+@pytest.fixture
+def profiles():
+    """Pressure and temperature profiles (time, column, level), some from the top of atmosphere (p=0) downward"""
+    rng = np.random.default_rng(11)
+    levels = np.linspace(0, 1, 25)
+    pressure = rng.uniform(9.5e4, 1.03e5, (6, 8, 1)) * (1 - levels) ** 1.5
+    temperature = rng.uniform(270, 300, (6, 8, 1)) - 80 * levels
+    # half of the profiles start at the top of the atmosphere like the IFS output
+    pressure[::2] = np.flip(pressure[::2], axis=-1)
+    temperature[::2] = np.flip(temperature[::2], axis=-1)
+    return pressure, temperature
+
+
+def test_barometric_height_matches_loop(profiles):
+    pressure, temperature = profiles
+    expected = np.empty(pressure.shape)
+    for idx in np.ndindex(pressure.shape[:-1]):
+        with np.errstate(divide="ignore"):
+            expected[idx] = barometric_height_loop(pressure[idx], temperature[idx])
+    np.testing.assert_array_equal(met.barometric_height(pressure, temperature), expected)
+    assert np.isnan(expected[..., -1]).all()
+
+
+def test_barometric_height_axis(profiles):
+    pressure, temperature = profiles
+    result = met.barometric_height(np.moveaxis(pressure, -1, 0), np.moveaxis(temperature, -1, 0), axis=0)
+    np.testing.assert_array_equal(np.moveaxis(result, 0, -1), met.barometric_height(pressure, temperature))
+    np.testing.assert_array_equal(met.barometric_height(pressure[0, 0], temperature[0, 0]),
+                                  met.barometric_height(pressure, temperature)[0, 0])
@@ -0,0 +1,239 @@
+#!/usr/bin/env python
+"""Regression tests for pylim.reader against the original implementations
+
+*author*: Johannes Röttenbacher
+"""
+
+import glob
+import os
+import warnings
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from pylim import reader
+from pylim import smart
+
+
+def read_smart_raw_original(path, filename):
+    """Original version of reader.read_smart_raw"""
+    file = os.path.join(path, filename)
+    date_str, channel, _ = smart.get_info_from_filename(filename)
+    pixels = list(range(1, 257)) if channel == "SWIR" else list(range(1, 1025))
+    header = ["time", "t_int", "shutter"]
+    header.extend(pixels)
+
+    df = pd.read_csv(file, sep="\t", header=None, names=header)
+    datetime_str = date_str + " " + df["time"]
+    df = df.set_index(pd.to_datetime(datetime_str, format="%Y_%m_%d %H %M %S.%f")).drop("time", axis=1)
+
+    return df
+
+
+def write_smart_raw(path, filename, n_rows: int = 300, seed: int = 0, start_second: float = 0.0):
+    """Write a raw SMART file with integer counts, alternating shutter and a time stamp every 0.37 seconds"""
+    _, channel, _ = smart.get_info_from_filename(filename)
+    n_pixels = 256 if channel == "SWIR" else 1024
+    rng = np.random.default_rng(seed)
+    seconds = start_second + np.arange(n_rows) * 0.37
+    with open(os.path.join(path, filename), "w") as f:
+        for i, second in enumerate(seconds):
+            hours, rest = divmod(second, 3600)
+            minutes, rest = divmod(rest, 60)
+            counts = "\t".join(str(c) for c in rng.integers(0, 40000, n_pixels))
+            f.write(f"{int(hours) + 11} {int(minutes)} {rest:.2f}\t300\t{int(i % 50 >= 5)}\t{counts}\n")
+    return filename
+
+
+def write_smart_cor(path, minutes=(0, 10, 20), direction: str = "Fdw", channel: str = "SWIR", n_rows: int = 40,
+                    suffix: str = "_cor_calibrated_norm", freq: str = "500ms") -> pd.DataFrame:
+    """Write calibrated SMART files for each minute and return their concatenated content"""
+    rng = np.random.default_rng(3)
+    n_pixels = 256 if channel == "SWIR" else 1024
+    dfs = list()
+    for minute in minutes:
+        time = pd.date_range(f"2021-06-25 11:{minute:02d}", periods=n_rows, freq=freq, name="time")
+        df = pd.DataFrame(rng.uniform(0, 2, (n_rows, n_pixels)), index=time, columns=np.arange(1, n_pixels + 1))
+        df.to_csv(os.path.join(path, f"2021_06_25_11_{minute:02d}.{direction}_{channel}{suffix}.dat"), sep="\t")
+        dfs.append(reader.read_smart_cor(path, f"2021_06_25_11_{minute:02d}.{direction}_{channel}{suffix}.dat"))
+    return pd.concat(dfs)
+
+
+@pytest.fixture
+def raw_file(tmp_path):
+    filename = write_smart_raw(tmp_path, "2021_06_25_11_00.Fdw_SWIR.dat")
+    return str(tmp_path), filename
+
+
+def assert_same_raw(result, expected):
+    """Compare with the original reader, which may use a different time resolution for the index"""
+    pd.testing.assert_frame_equal(result, expected, check_index_type=False, check_names=False)
+    np.testing.assert_array_equal(result.index.to_numpy(dtype="datetime64[ns]"),
+                                  expected.index.to_numpy(dtype="datetime64[ns]"))
+
+
+def test_read_smart_raw_matches_original(raw_file):
+    expected = read_smart_raw_original(*raw_file)
+    result = reader.read_smart_raw(*raw_file)
+    assert_same_raw(result, expected)
+    assert (result.dtypes.iloc[2:] == np.int64).all()
+
+
+def test_read_smart_raw_cache_round_trip(raw_file, tmp_path):
+    path, filename = raw_file
+    cache_dir = str(tmp_path / "cache")
+    reader.read_smart_raw(path, filename)
+    assert not os.path.exists(cache_dir), "the cache has to be opt-in"
+
+    first = reader.read_smart_raw(path, filename, cache=True, cache_dir=cache_dir)
+    cache_files = glob.glob(os.path.join(cache_dir, "*", "*"))
+    assert len(cache_files) == 1 and cache_files[0].endswith(f"{filename}.npz")
+    cached = reader.read_smart_raw(path, filename, cache=True, cache_dir=cache_dir)
+    pd.testing.assert_frame_equal(cached, first)
+    assert_same_raw(cached, read_smart_raw_original(path, filename))
+
+    # a changed raw file invalidates the cache
+    write_smart_raw(path, filename, n_rows=120, seed=1)
+    os.utime(os.path.join(path, filename), ns=(0, 0))
+    updated = reader.read_smart_raw(path, filename, cache=True, cache_dir=cache_dir)
+    assert_same_raw(updated, read_smart_raw_original(path, filename))
+    assert not glob.glob(os.path.join(cache_dir, "*", "*.tmp"))
+
+
+def test_decode_time_matches_pandas():
+    rng = np.random.default_rng(2)
+    seconds = np.round(rng.uniform(0, 2 * 86400, 1000), 3)
+    seconds[[3, 10]] = [np.nan, np.inf]
+    start_date = pd.Timestamp("2021-12-31")
+    expected = pd.to_datetime(pd.Series(seconds).replace(np.inf, np.nan), origin=start_date, unit="s")
+    with np.errstate(all="raise"):
+        result = reader._decode_time(start_date, seconds=seconds)
+    expected = expected.to_numpy(dtype="datetime64[ns]")
+    np.testing.assert_array_equal(np.isnat(result), np.isnat(expected))
+    assert np.isnat(result[[3, 10]]).all()
+    # pandas multiplies the float seconds with 1e9, the whole seconds and the fraction are converted separately
+    finite = ~np.isnat(expected)
+    assert np.abs(result[finite] - expected[finite]).max() < np.timedelta64(1, "us")
+    milliseconds = np.round(seconds[finite] * 1000).astype(np.int64).astype("timedelta64[ms]")
+    np.testing.assert_array_equal(result[finite], np.datetime64("2021-12-31", "ns") + milliseconds)
+
+
+def test_decode_time_numeric_date_with_gaps():
+    date = np.array([[2021, 6, 25], [2021, 6, np.nan], [2022, 1, 1]])
+    hms = np.array([[11, 0, 0.25], [11, 0, 1.0], [np.nan, 0, 0]])
+    result = reader._decode_time(date, hms[:, 0], hms[:, 1], hms[:, 2])
+    assert result[0] == np.datetime64("2021-06-25T11:00:00.250", "ns")
+    assert np.isnat(result[1:]).all()
+
+
+def test_split_numeric_fields():
+    values = pd.Series(["11 00 0.37", "11:00:01.5", "2021/06/25", "nan nan nan"])
+    with warnings.catch_warnings():
+        warnings.simplefilter("error")
+        fields = reader._split_numeric_fields(values, 3)
+    np.testing.assert_array_equal(fields[:3], [[11, 0, 0.37], [11, 0, 1.5], [2021, 6, 25]])
+    assert np.isnan(fields[3]).all()
+    with pytest.raises(ValueError):
+        reader._split_numeric_fields(pd.Series(["11 00 x"]), 3)
+    with pytest.raises(ValueError):
+        reader._split_numeric_fields(pd.Series(["11 00"]), 3)
+
+
+def test_read_stabbi_data_matches_original(tmp_path):
+    file = tmp_path / "stabbi.dat"
+    pctime = [f"11:{m:02d}:{s:06.3f}" for m in range(3) for s in np.arange(0, 60, 7.31)]
+    pd.DataFrame(dict(DATE="2021/06/25", PCTIME=pctime, TARGET3=np.arange(len(pctime)) * 0.1)).to_csv(
+        file, sep="\t", index=False)
+    expected = pd.read_csv(file, skipinitialspace=True, sep="\t")
+    expected["PCTIME"] = pd.to_datetime(expected["DATE"] + " " + expected["PCTIME"], format="%Y/%m/%d %H:%M:%S.%f")
+    result = reader.read_stabbi_data(str(file))
+    np.testing.assert_array_equal(result.index.to_numpy(dtype="datetime64[ns]"),
+                                  expected["PCTIME"].to_numpy(dtype="datetime64[ns]"))
+    np.testing.assert_array_equal(result["TARGET3"], expected["TARGET3"])
+
+
+
+@pytest.mark.parametrize("n_jobs", [1, 2])
+def test_read_smart_flight_raw_matches_original(smart_flight, n_jobs):
+    files = [write_smart_raw(smart_flight.raw, f"2021_06_25_11_{m:02d}.Fdw_SWIR.dat", n_rows=50, seed=m,
+                             start_second=60 * m) for m in (0, 10, 20)]
+    write_smart_raw(smart_flight.raw, "2021_06_25_11_00.Fup_SWIR.dat", n_rows=10)
+    ds = reader.read_smart_flight(smart_flight.flight, "Fdw", "SWIR", n_jobs=n_jobs)
+
+    expected = pd.concat([read_smart_raw_original(smart_flight.raw, f) for f in files])
+    np.testing.assert_array_equal(ds.time.values, expected.index.to_numpy(dtype="datetime64[ns]"))
+    np.testing.assert_array_equal(ds.counts.values, expected.iloc[:, 2:].to_numpy())
+    np.testing.assert_array_equal(ds.shutter.values, expected["shutter"].to_numpy())
+    np.testing.assert_array_equal(ds.pixel.values, np.arange(1, 257))
+    np.testing.assert_allclose(ds.wavelength.values, np.linspace(200, 2200, 256), atol=1e-3)
+
+
+def test_read_smart_flight_calibrated_matches_read_smart_cor(smart_flight):
+    expected = write_smart_cor(smart_flight.calibrated)
+    ds = reader.read_smart_flight(smart_flight.flight, "Fdw", "SWIR", kind="calibrated", n_jobs=1)
+    np.testing.assert_array_equal(ds.time.values, expected.index.to_numpy(dtype="datetime64[ns]"))
+    np.testing.assert_array_equal(ds.Fdw.values, expected.to_numpy(dtype=np.float32))
+    assert ds.Fdw.attrs["units"] == "W m-2 nm-1"
+    with pytest.raises(FileNotFoundError):
+        reader.read_smart_flight(smart_flight.flight, "Fup", "SWIR", kind="calibrated")
+
+
+def test_iter_smart_raw_matches_original(raw_file):
+    expected = read_smart_raw_original(*raw_file)
+    chunks = list(reader.iter_smart_raw(*raw_file, chunksize=64))
+    assert [len(chunk) for chunk in chunks] == [64, 64, 64, 64, 44]
+    assert_same_raw(pd.concat(chunks), expected)
+
+
+@pytest.mark.parametrize("shutter", [None, 0, 1])
+def test_mean_smart_raw_matches_original(raw_file, shutter):
+    df = read_smart_raw_original(*raw_file)
+    df = df if shutter is None else df[df["shutter"] == shutter]
+    expected = df.iloc[:, 2:].mean()
+    result = reader.mean_smart_raw(*raw_file, shutter=shutter, chunksize=70)
+    pd.testing.assert_series_equal(result, expected, check_exact=False, rtol=1e-12, check_index_type=False)
+
+
+def test_smart_store_round_trip(smart_flight):
+    # the files overlap, which makes the store sort its rows by time
+    expected = write_smart_cor(smart_flight.calibrated, freq="20s")
+    store_path = reader.write_smart_store(smart_flight.calibrated, "Fdw", "SWIR")
+    assert store_path == reader.get_smart_store_path(smart_flight.calibrated, "Fdw", "SWIR")
+    ds = reader.open_smart_store(store_path)
+    expected_sorted = expected.sort_index(kind="stable")
+    np.testing.assert_array_equal(ds.time.values, expected_sorted.index.to_numpy(dtype="datetime64[ns]"))
+    np.testing.assert_array_equal(ds.Fdw.values, expected_sorted.to_numpy(dtype=np.float32))
+
+    filename = "2021_06_25_11_00.Fdw_SWIR_cor_calibrated_norm.dat"
+    for index in [0, 17, -1]:
+        row = reader.read_smart_store_row(store_path, filename, index)
+        expected_row = reader.read_smart_cor(smart_flight.calibrated, filename).iloc[index, :]
+        np.testing.assert_array_equal(row.to_numpy(), expected_row.to_numpy(dtype=np.float32))
+        assert row.name == expected_row.name
+
+
+def test_smart_store_rejects_stale_store(smart_flight):
+    write_smart_cor(smart_flight.calibrated, minutes=(0, 10))
+    store_path = reader.write_smart_store(smart_flight.calibrated, "Fdw", "SWIR")
+    reader.open_smart_store(store_path)
+
+    # a modified source file
+    file = os.path.join(smart_flight.calibrated, "2021_06_25_11_10.Fdw_SWIR_cor_calibrated_norm.dat")
+    os.utime(file, ns=(0, 0))
+    with pytest.raises(ValueError):
+        reader.open_smart_store(store_path)
+    with pytest.raises(ValueError):
+        reader.read_smart_store_row(store_path, os.path.basename(file), 0)
+    reader.read_smart_store_row(store_path, "2021_06_25_11_00.Fdw_SWIR_cor_calibrated_norm.dat", 0)
+
+    # rewriting replaces the store and leaves no temporary directories behind
+    assert reader.write_smart_store(smart_flight.calibrated, "Fdw", "SWIR") == store_path
+    assert reader.open_smart_store(store_path).sizes["time"] == 80
+    assert sorted(os.listdir(smart_flight.calibrated))[-1] == "Fdw_SWIR_store"
+    assert not [f for f in os.listdir(smart_flight.calibrated) if f.endswith((".tmp", ".old"))]
+
+    # a new source file
+    write_smart_cor(smart_flight.calibrated, minutes=(20,))
+    with pytest.raises(ValueError):
+        reader.open_smart_store(store_path)
@@ -0,0 +1,247 @@
+#!/usr/bin/env python
+"""Regression tests for pylim.smart against the original implementations
+
+*author*: Johannes Röttenbacher
+"""
+
+import os
+import re
+import warnings
+
+import numpy as np
+import pandas as pd
+import pytest
+import xarray as xr
+
+from pylim import reader
+from pylim import smart
+
+from test_reader import read_smart_raw_original, write_smart_raw
+
+
+def find_dark_current_file_walk(calib_path, spectrometer, direction, channel, t_int, date):
+    """Original os.walk search for the dark current file of option 2 in smart.get_dark_current"""
+    instrument = re.search(r'ASP\d{2}', spectrometer)[0]
+    found = list()
+    for dirpath, dirs, files in sorted(os.walk(calib_path)):
+        if re.search(f".*{instrument}.*dark.*", dirpath) is not None:
+            d_path, d = os.path.split(dirpath)
+            if date in d_path and str(t_int) in d:
+                for file in files:
+                    if re.search(f'.*.{direction}_{channel}.dat', file) is not None:
+                        found.append((dirpath, file))
+    return found
+
+
+@pytest.fixture
+def calib_tree(tmp_path):
+    """Calibration folder with dark current folders of two integration times per inlet and a transfer calibration"""
+    calib = tmp_path / "calib"
+    folders = {
+        "ASP06_Calib_Lab_20210329/ASP06_J3_dark_300ms": "2021_03_29_10_00.Fdw_SWIR.dat",
+        "ASP06_Calib_Lab_20210329/ASP06_J3_dark_500ms": "2021_03_29_10_10.Fdw_SWIR.dat",
+        "ASP06_Calib_Lab_20210329/ASP06_J4_dark_300ms": "2021_03_29_10_20.Fdw_VNIR.dat",
+        "ASP06_transfer_calib_20210625/dark_300ms": "2021_06_25_08_00.Fdw_VNIR.dat",
+        "ASP06_transfer_calib_20210625/dark_6ms": "2021_06_25_08_10.Fdw_VNIR.dat",
+    }
+    for folder, file in folders.items():
+        os.makedirs(calib / folder)
+        (calib / folder / file).write_text("")
+    smart._calibration_catalogs.clear()
+    yield str(calib)
+    smart._calibration_catalogs.clear()
+
+
+@pytest.mark.parametrize("t_int, spectrometer, direction, channel", [
+    (300, "ASP06_J3", "Fdw", "SWIR"),
+    (500, "ASP06_J3", "Fdw", "SWIR"),
+    (300, "ASP06_J4", "Fdw", "VNIR"),
+])
+def test_find_dark_current_file_matches_walk(calib_tree, t_int, spectrometer, direction, channel):
+    expected = find_dark_current_file_walk(calib_tree, spectrometer, direction, channel, t_int, "20210329")
+    assert len(expected) == 1
+    assert smart.find_dark_current_file(calib_tree, 2, spectrometer, direction, channel, t_int,
+                                        "20210329") == expected[0]
+
+
+def test_calibration_catalog_integration_time_token(calib_tree):
+    """Only the number in front of "ms" is an integration time, not the instrument or inlet number"""
+    catalog = smart.get_calibration_catalog(calib_tree)
+    assert {key[2] for key in catalog["dark"]} == {300, 500, 6}
+    assert {key[1] for key in catalog["transfer_dark"]} == {300, 6}
+    with pytest.raises(RuntimeError):
+        smart.find_dark_current_file(calib_tree, 2, "ASP06_J3", "Fdw", "SWIR", 3, "20210329")
+    dark_dir, dark_file = smart.find_dark_current_file(calib_tree, 3, "ASP06_J4", "Fdw", "VNIR", 6, "20210625")
+    assert dark_dir.endswith("dark_6ms") and dark_file == "2021_06_25_08_10.Fdw_VNIR.dat"
+
+
+@pytest.fixture
+def raw_swir_files(smart_flight):
+    """Raw SWIR files of one flight together with processed files in the same directory"""
+    files = [write_smart_raw(smart_flight.raw, f"2021_06_25_11_{m:02d}.Fdw_SWIR.dat", n_rows=120, seed=m,
+                             start_second=60 * m) for m in (0, 10)]
+    for processed in ["2021_06_25_11_00.Fdw_SWIR_cor.dat", "2021_06_25_11_00.Fdw_SWIR_cor_calibrated_norm.dat",
+                      "2021_06_25_11_00.Fdw_SWIR.dat.bak", "notes.dat"]:
+        with open(os.path.join(smart_flight.raw, processed), "w") as f:
+            f.write("time\t1\n")
+    return files
+
+
+def test_raw_file_selection_skips_processed_files(smart_flight, raw_swir_files, monkeypatch):
+    corrected = list()
+    monkeypatch.setattr(smart, "_correct_smart_dark_current_worker",
+                        lambda flight, smart_file, *args: corrected.append(smart_file))
+    results = smart.correct_smart_dark_current_batch(smart_flight.flight, n_jobs=1, campaign="cirrus-hl")
+    assert list(results) == corrected == raw_swir_files
+    assert smart.SmartPipeline(smart_flight.flight, campaign="cirrus-hl").raw_files() == raw_swir_files
+
+
+def correct_smart_dark_current_original(measurement, dark_current):
+    """Original shutter masking and subtraction of smart.correct_smart_dark_current"""
+    measurement_cor = measurement.where(measurement.shutter == 1).iloc[:, 2:] - dark_current
+    return measurement_cor.dropna()
+
+
+def scale_dark_current_original(dark_current, measurement):
+    """Original pandas version of the option 3 dark current scaling in smart.get_dark_current"""
+    dark_scale = dark_current * np.mean(measurement.mean().iloc[19:99]) / np.mean(dark_current.iloc[19:99])
+    dark_scale = dark_scale - dark_scale.rolling(20, min_periods=1).mean()
+    dark_scale2 = dark_current.rolling(20, min_periods=1).mean() + (
+            np.mean(measurement.mean().iloc[19:99]) - np.mean((dark_current.iloc[19:99])))
+    return dark_scale2 + dark_scale
+
+
+def test_correct_smart_dark_current_swir_matches_original(smart_flight, raw_swir_files):
+    for filename in raw_swir_files:
+        measurement = read_smart_raw_original(smart_flight.raw, filename)
+        dark_current = measurement.where(measurement.shutter == 0).iloc[:, 2:].mean()
+        expected = correct_smart_dark_current_original(measurement, dark_current)
+        result = smart.correct_smart_dark_current(smart_flight.flight, filename, 2, campaign="cirrus-hl")
+        assert (result.dtypes == np.float64).all()
+        # the pandas mean of the dark current can differ by one ulp depending on the memory layout of the frame
+        np.testing.assert_allclose(result.to_numpy(), expected.to_numpy(), rtol=1e-15, atol=0)
+        np.testing.assert_array_equal(result.index.to_numpy(dtype="datetime64[ns]"),
+                                      expected.index.to_numpy(dtype="datetime64[ns]"))
+
+
+def test_correct_smart_dark_current_option_3_matches_original(smart_flight, tmp_path):
+    filename = write_smart_raw(smart_flight.raw, "2021_06_25_11_00.Fdw_VNIR.dat", n_rows=100)
+    dark_file = write_smart_raw(str(tmp_path), "2021_06_25_08_00.Fdw_VNIR.dat", n_rows=60, seed=5)
+    measurement = read_smart_raw_original(smart_flight.raw, filename)
+    dark_current = read_smart_raw_original(str(tmp_path), dark_file).iloc[:, 2:].mean()
+    expected = correct_smart_dark_current_original(measurement,
+                                                   scale_dark_current_original(dark_current, measurement))
+    result = smart.correct_smart_dark_current(smart_flight.flight, filename, 3, campaign="cirrus-hl",
+                                              dark_filepath=str(tmp_path / dark_file))
+    assert (result.dtypes == np.float64).all()
+    np.testing.assert_allclose(result.to_numpy(), expected.to_numpy(), rtol=1e-12, atol=1e-8)
+
+    # the corrected file keeps the float64 values, read_csv parses floats only up to one ulp
+    outfile = smart.correct_smart_dark_current_batch(smart_flight.flight, [filename], option=3, n_jobs=1,
+                                                     campaign="cirrus-hl", dark_filepath=str(tmp_path / dark_file),
+                                                     outpath=smart_flight.data)[filename]
+    saved = reader.read_smart_cor(smart_flight.data, os.path.basename(outfile))
+    np.testing.assert_allclose(saved.to_numpy(), result.to_numpy(), rtol=1e-15, atol=0)
+
+
+def test_dark_current_kernels_with_preallocated_float32():
+    rng = np.random.default_rng(8)
+    counts = rng.uniform(0, 3e4, (50, 1024)).astype(np.float32)
+    shutter = rng.integers(0, 2, 50)
+    dark_current = rng.uniform(0, 1e3, 1024)
+    scaled = smart.scale_dark_current(dark_current, counts, out=np.empty(1024, dtype=np.float32))
+    assert scaled.dtype == np.float32
+    np.testing.assert_allclose(scaled, smart.scale_dark_current(dark_current, counts), rtol=1e-6)
+    out = np.empty((50, 1024), dtype=np.float32)
+    counts_cor, is_open = smart.subtract_dark_current(counts, shutter, scaled, out=out)
+    assert np.shares_memory(counts_cor, out) and len(counts_cor) == np.count_nonzero(shutter == 1)
+    np.testing.assert_array_equal(counts_cor, counts[shutter == 1] - scaled)
+
+
+@pytest.mark.parametrize("n_jobs", [1, 2])
+def test_correct_smart_dark_current_batch(smart_flight, raw_swir_files, n_jobs):
+    results = smart.correct_smart_dark_current_batch(smart_flight.flight, option=2, n_jobs=n_jobs,
+                                                     campaign="cirrus-hl")
+    assert list(results) == raw_swir_files
+    for filename, measurement_cor in results.items():
+        expected = smart.correct_smart_dark_current(smart_flight.flight, filename, 2, campaign="cirrus-hl")
+        pd.testing.assert_frame_equal(measurement_cor, expected)
+
+
+def calibrate_per_mille(measurement_cor, filename):
+    """Module level calibration function for the SmartPipeline tests"""
+    return measurement_cor / 1000
+
+
+def test_smart_pipeline_run(smart_flight, raw_swir_files):
+    assert smart.SmartPipeline.run.__doc__.count("Args:") == 1
+    pipeline = smart.SmartPipeline(smart_flight.flight, campaign="cirrus-hl", option=2, calibrate=calibrate_per_mille,
+                                   calibration_id="calib_1", n_jobs=1)
+    cor_files = [f.replace(".dat", "_cor.dat") for f in raw_swir_files]
+    assert pipeline.run() == dict(cor=raw_swir_files, calibrated=cor_files)
+    for filename, cor_file in zip(raw_swir_files, cor_files):
+        expected = smart.correct_smart_dark_current(smart_flight.flight, filename, 2, campaign="cirrus-hl")
+        saved = reader.read_smart_cor(smart_flight.data, cor_file)
+        np.testing.assert_allclose(saved.to_numpy(), expected.to_numpy(), rtol=1e-15, atol=0)
+        calibrated = reader.read_smart_cor(smart_flight.calibrated,
+                                           cor_file.replace("_cor.dat", "_cor_calibrated_norm.dat"))
+        # to_csv writes values close to zero with 15 significant digits only
+        np.testing.assert_allclose(calibrated.to_numpy(), saved.to_numpy() / 1000, rtol=1e-12, atol=0)
+
+    # nothing is stale after a run, also not for a new pipeline reading the manifest
+    assert smart.SmartPipeline(smart_flight.flight, campaign="cirrus-hl", calibrate=calibrate_per_mille,
+                               calibration_id="calib_1", n_jobs=1).run() == dict(cor=[], calibrated=[])
+    # a new calibration only recalibrates, force reprocesses everything
+    pipeline.calibration_id = "calib_2"
+    assert pipeline.run() == dict(cor=[], calibrated=cor_files)
+    assert pipeline.run(force=True) == dict(cor=raw_swir_files, calibrated=cor_files)
+
+
+@pytest.fixture
+def vnir_swir():
+    """VNIR and SWIR spectra with an overlap region, one NaN pixel and one pixel without wavelength"""
+    rng = np.random.default_rng(9)
+    time = pd.date_range("2021-06-25 11:00", periods=20, freq="1s").to_numpy()
+    vnir_wl, swir_wl = np.linspace(300, 1000, 200), np.linspace(950, 2100, 60)
+    vnir = xr.DataArray(rng.uniform(0, 1, (20, 200)), coords=dict(time=time, wavelength=vnir_wl),
+                        dims=["time", "wavelength"], name="Fdw")
+    swir = xr.DataArray(rng.uniform(0, 1, (20, 60)), coords=dict(time=time, wavelength=swir_wl),
+                        dims=["time", "wavelength"], name="Fdw")
+    vnir[:, 10] = np.nan
+    swir = swir.assign_coords(wavelength=np.where(np.arange(60) == 30, np.nan, swir_wl))
+    smart._resampling_matrices.clear()
+    return vnir, swir
+
+
+def test_stitch_vnir_swir_matches_interp(vnir_swir):
+    vnir, swir = vnir_swir
+    plan = smart.get_stitching_plan(vnir.wavelength, swir.wavelength)
+    wavelength = plan["wavelength"]
+    assert np.isfinite(wavelength).all() and (np.diff(wavelength) > 0).all()
+    # grid points outside of the measured range, NaN and exactly on the pixel next to the NaN pixel
+    wavelength_grid = np.concatenate([[250.0, np.nan], np.arange(300, 2100, 7.5), [wavelength[9], wavelength[11],
+                                                                                      2200.0]])
+    with warnings.catch_warnings():
+        warnings.simplefilter("error")
+        result = smart.stitch_vnir_swir(vnir, swir, plan=plan, wavelength_grid=wavelength_grid, dtype=np.float64)
+    stitched = smart.stitch_vnir_swir(vnir, swir, plan=plan, dtype=np.float64)
+    expected = np.array([np.interp(wavelength_grid, wavelength, spectrum, left=np.nan, right=np.nan)
+                         for spectrum in stitched.values])
+    on_nan = np.abs(wavelength_grid[:, None] - wavelength[10]) < 7.5
+    # np.interp spreads NaN to grid points next to the NaN pixel, only the ones between the neighbours are NaN
+    between = (wavelength_grid > wavelength[9]) & (wavelength_grid < wavelength[11])
+    np.testing.assert_allclose(result.values[:, ~on_nan[:, 0]], expected[:, ~on_nan[:, 0]], rtol=1e-12)
+    assert np.isnan(result.values[:, between]).all()
+    assert np.isfinite(result.values[:, -3:-1]).all()
+    np.testing.assert_array_equal(result.values[:, -3:-1], stitched.values[:, [9, 11]])
+    assert np.isnan(result.values[:, [0, 1, -1]]).all()
+
+
+def test_resampling_matrix_skips_pixels_without_wavelength(vnir_swir):
+    wavelength = np.array([400.0, np.nan, 410.0, 420.0, np.nan])
+    wavelength_grid = np.array([np.nan, 395.0, 400.0, 405.0, 420.0, 425.0])
+    with warnings.catch_warnings():
+        warnings.simplefilter("error")
+        matrix = smart.get_resampling_matrix(wavelength, wavelength_grid).toarray()
+    np.testing.assert_array_equal(matrix, [[0, 0, 0, 0, 0], [0, 0, 0, 0, 0], [1, 0, 0, 0, 0], [0.5, 0, 0.5, 0, 0],
+                                           [0, 0, 0, 1, 0], [0, 0, 0, 0, 0]])
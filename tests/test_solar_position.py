@@ -0,0 +1,238 @@
+#!/usr/bin/env python
+"""Regression tests for pylim.solar_position against the original implementations
+
+*author*: Johannes Röttenbacher
+"""
+
+import numpy as np
+import pandas as pd
+import pytest
+import xarray as xr
+
+from pylim import solar_position as sp
+
+
+def dec_original(julian, year):
+    """Original scalar version of solar_position.dec"""
+    rad = np.pi / 180.0
+    delta = year - 1949.0
+    leap = int(delta / 4.0)
+    julian_zero = 32916.5 + delta * 365.0 + leap + julian
+    if ((year % 100.0) == 0.0) and ((year % 400.0) != 0.0):
+        julian_zero = julian_zero - 1.0
+    time = julian_zero - 51545.0
+    mnlong = 280.460 + 0.9856474 * time
+    mnlong = mnlong % 360.0
+    if mnlong <= 0.0:
+        mnlong = mnlong + 360.0
+    mnanom = 357.528 + 0.9856003 * time
+    mnanom = mnanom % 360.0
+    if mnanom <= 0.0:
+        mnanom = mnanom + 360.0
+    mnanom = mnanom * rad
+    eclong = mnlong + 1.915 * np.sin(mnanom) + 0.020 * np.sin(2.0 * mnanom)
+    eclong = eclong % 360.0
+    if eclong <= 0.0:
+        eclong = eclong + 360.0
+    oblqec = 23.439 - 0.0000004 * time
+    eclong = eclong * rad
+    oblqec = oblqec * rad
+    return np.arcsin(np.sin(oblqec) * np.sin(eclong)) / rad
+
+
+def julian_day_original(year, month, day, t0):
+    """Original scalar version of solar_position.julian_day with the if chain over the months"""
+    year, month, day = int(year), int(month), int(day)
+    s = 0
+    if year % 4 == 0:
+        s = 1
+    if s == 1 and year % 100 == 0 and year % 400 != 0:
+        s = 0
+    if month == 1:
+        jd = day
+    if month == 2:
+        jd = day + 31
+    if month == 3:
+        jd = day + 31 + 28 + s
+    if month == 4:
+        jd = day + 31 + 28 + s + 31
+    if month == 5:
+        jd = day + 31 + 28 + s + 31 + 30
+    if month == 6:
+        jd = day + 31 + 28 + s + 31 + 30 + 31
+    if month == 7:
+        jd = day + 31 + 28 + s + 31 + 30 + 31 + 30
+    if month == 8:
+        jd = day + 31 + 28 + s + 31 + 30 + 31 + 30 + 31
+    if month == 9:
+        jd = day + 31 + 28 + s + 31 + 30 + 31 + 30 + 31 + 31
+    if month == 10:
+        jd = day + 31 + 28 + s + 31 + 30 + 31 + 30 + 31 + 31 + 30
+    if month == 11:
+        jd = day + 31 + 28 + s + 31 + 30 + 31 + 30 + 31 + 31 + 30 + 31
+    if month == 12:
+        jd = day + 31 + 28 + s + 31 + 30 + 31 + 30 + 31 + 31 + 30 + 31 + 30
+    return jd + t0 / 24.0
+
+
+def local_time_original(julian, t0, lon):
+    """Original version of solar_position.local_time"""
+    mean_local_time_min = t0 * 60.0 + 4.0 * lon
+    fac = (
+        0.0132 * 0.5
+        + 7.3525 * np.cos(2.0 * np.pi * julian / 365.0 + 1.4989)
+        + 9.9359 * np.cos(2.0 * 2.0 * np.pi * julian / 365.0 + 1.9006)
+        + 0.3387 * np.cos(3.0 * 2.0 * np.pi * julian / 365.0 + 1.8360)
+    )
+    return (mean_local_time_min + fac) / 60.0
+
+
+def _height_original(t0, lat, lon, year, month, day):
+    """Original solar elevation of get_saa and get_sza with dec evaluated twice"""
+    julian = julian_day_original(year, month, day, t0)
+    t_loc = local_time_original(julian, t0, lon)
+    tau = (12.0 - t_loc) * 15.0
+    height = np.arcsin(
+        np.cos(np.pi / 180.0 * lat)
+        * np.cos(np.pi / 180.0 * dec_original(julian, year))
+        * np.cos(np.pi / 180.0 * tau)
+        + np.sin(np.pi / 180.0 * lat) * np.sin(np.pi / 180.0 * dec_original(julian, year))
+    )
+    return julian, t_loc, height
+
+
+def get_saa_original(t0, lat, lon, year, month, day):
+    """Original scalar version of solar_position.get_saa"""
+    julian, t_loc, height = _height_original(t0, lat, lon, year, month, day)
+    azimuth = (
+        np.sin(height) * np.sin(np.pi / 180.0 * lat)
+        - np.sin(np.pi / 180.0 * dec_original(julian, year))
+    ) / (np.cos(height) * np.cos(np.pi / 180.0 * lat))
+    azimuth = azimuth if azimuth < 1 else 1
+    azimuth = np.arccos(azimuth)
+    azimuth = azimuth if t_loc > 12 else -azimuth
+    azimuth += np.pi
+    return azimuth * 180.0 / np.pi
+
+
+def get_sza_original(t0, lat, lon, year, month, day, pres, temp):
+    """Original scalar version of solar_position.get_sza"""
+    _, _, height = _height_original(t0, lat, lon, year, month, day)
+    refcor = sp.refract(height, pres, temp) if height >= -0.087 else 0
+    return 90.0 - (height + refcor) * 180.0 / np.pi
+
+
+@pytest.fixture
+def track():
+    """Random times and positions including leap days, century years and the turn of the year"""
+    rng = np.random.default_rng(11)
+    n = 400
+    time = (np.datetime64("1999-01-01") + rng.integers(0, 4 * 365 * 86400, n).astype("timedelta64[s]")
+            + rng.integers(0, 1000, n).astype("timedelta64[ms]")).astype("datetime64[ns]")
+    time[:4] = np.array(["2000-02-29T12:00", "1900-03-01T06:30", "2100-12-31T23:59:59", "2020-01-01T00:00"],
+                        dtype="datetime64[ns]")
+    return pd.DatetimeIndex(time), rng.uniform(-89, 89, n), rng.uniform(-180, 180, n), rng.uniform(200, 1013, n), \
+        rng.uniform(-60, 30, n)
+
+
+def test_solar_position_matches_original(track):
+    time, lat, lon, pres, temp = track
+    t0 = (time.hour + time.minute / 60 + time.second / 3600).to_numpy(dtype=float)
+    year, month, day = time.year.to_numpy(), time.month.to_numpy(), time.day.to_numpy()
+    args = t0, lat, lon, year, month, day
+    expected_julian = [julian_day_original(y, m, d, t) for t, y, m, d in zip(t0, year, month, day)]
+    np.testing.assert_array_equal(sp.julian_day(year, month, day, t0), expected_julian)
+    np.testing.assert_array_equal(sp.dec(np.asarray(expected_julian), year),
+                                  [dec_original(j, y) for j, y in zip(expected_julian, year)])
+    np.testing.assert_array_equal(sp.get_saa(*args), [get_saa_original(*a) for a in zip(*args)])
+    np.testing.assert_array_equal(sp.get_sza(*args, pres, temp),
+                                  [get_sza_original(*a) for a in zip(*args, pres, temp)])
+    # scalar input still returns scalars
+    assert np.isscalar(sp.get_saa(11, 51.34, 12.376, 2022, 2, 2))
+    assert sp.get_sza(*[a[0] for a in args], 1013.25, 15.0) == get_sza_original(*[a[0] for a in args], 1013.25, 15.0)
+
+
+def test_get_sza_saa_matches_original(track):
+    time, lat, lon, pres, temp = track
+    sza, saa = sp.get_sza_saa(time, lat, lon, pres, temp)
+    # the decimal hours are calculated from the nanoseconds instead of hour, minute and second
+    t0 = ((time - time.normalize()) / pd.Timedelta(1, "h")).to_numpy()
+    args = t0, lat, lon, time.year, time.month, time.day
+    np.testing.assert_allclose(saa, [get_saa_original(*a) for a in zip(*args)], rtol=0, atol=1e-9)
+    np.testing.assert_allclose(sza, [get_sza_original(*a) for a in zip(*args, pres, temp)], rtol=0, atol=1e-9)
+    # the same as the vectorized single functions
+    np.testing.assert_array_equal(saa, sp.get_saa(*args))
+    np.testing.assert_array_equal(sza, sp.get_sza(*args, pres, temp))
+
+
+@pytest.mark.parametrize("resolution, dec_bound, eot_bound", [(1.0, 1e-9, 1e-9), (60.0, 2e-6, 4e-6)])
+def test_ephemeris_accuracy(resolution, dec_bound, eot_bound):
+    """The documented bounds of ephemeris against the direct formulas over the years 2000 to 2030"""
+    rng = np.random.default_rng(12)
+    year = rng.integers(2000, 2031, 5000)
+    julian = rng.uniform(1, 365, 5000)
+    sp._ephemeris_tables.clear()
+    declination, eot = sp.ephemeris(julian, year, resolution)
+    assert np.max(np.abs(declination - sp.dec(julian, year))) < dec_bound
+    assert np.max(np.abs(eot - sp.equation_of_time(julian))) < eot_bound
+    # the tables are calculated only once
+    n_tables = len(sp._ephemeris_tables)
+    np.testing.assert_array_equal(sp.ephemeris(julian, year, resolution)[0], declination)
+    assert len(sp._ephemeris_tables) == n_tables
+
+
+def test_get_sza_saa_with_ephemeris(track):
+    time, lat, lon, pres, temp = track
+    sza, saa = sp.get_sza_saa(time, lat, lon, pres, temp)
+    sza_eph, saa_eph = sp.get_sza_saa(time, lat, lon, pres, temp, ephemeris_resolution=1)
+    np.testing.assert_allclose(sza_eph, sza, rtol=0, atol=1e-7)
+    np.testing.assert_allclose(saa_eph, saa, rtol=0, atol=1e-7)
+
+    # NaT times are NaN like with the direct formulas and do not change the other time steps
+    time_nat = time.to_numpy().copy()
+    time_nat[[5, 50]] = np.datetime64("NaT")
+    for resolution in [None, 1]:
+        sza_nat, saa_nat = sp.get_sza_saa(time_nat, lat, lon, pres, temp, ephemeris_resolution=resolution)
+        assert np.isnan(sza_nat[[5, 50]]).all() and np.isnan(saa_nat[[5, 50]]).all()
+        valid = ~np.isnat(time_nat)
+        expected = (sza, saa) if resolution is None else (sza_eph, saa_eph)
+        np.testing.assert_array_equal(sza_nat[valid], expected[0][valid])
+        np.testing.assert_array_equal(saa_nat[valid], expected[1][valid])
+
+
+def test_missing_positions(track):
+    time, lat, lon, pres, temp = track
+    lat, lon = lat.copy(), lon.copy()
+    lat[3], lon[7] = np.nan, np.nan
+    t0 = ((time - time.normalize()) / pd.Timedelta(1, "h")).to_numpy()
+    args = t0, lat, lon, time.year, time.month, time.day
+    # get_saa keeps the original behaviour for missing positions
+    saa = sp.get_saa(*args)
+    np.testing.assert_array_equal(saa[[3, 7]], [get_saa_original(*a) for a in zip(*[arg[[3, 7]] for arg in args])])
+    assert (saa[[3, 7]] == 180).all()
+    # along a track missing positions stay missing
+    sza, saa_track = sp.get_sza_saa(time, lat, lon, pres, temp)
+    assert np.isnan(saa_track[[3, 7]]).all() and np.isnan(sza[[3, 7]]).all()
+    valid = np.isfinite(lat) & np.isfinite(lon)
+    np.testing.assert_array_equal(saa_track[valid], saa[valid])
+    assert np.isscalar(sp.get_sza_saa(time[0], lat[0], lon[0])[1])
+
+
+@pytest.mark.parametrize("chunks", [None, 100])
+def test_solar_geometry_accessor(track, chunks):
+    time, lat, lon, pres, temp = track
+    lat = lat.copy()
+    lat[3] = np.nan
+    ds = xr.Dataset(dict(IRS_LAT=("time", lat), IRS_LON=("time", lon), PS=("time", pres), TS=("time", temp + 273.15)),
+                    coords=dict(time=time))
+    if chunks is not None:
+        ds = ds.chunk(time=chunks)
+    result = ds.pylim.solar_geometry(pressure="PS", temperature=ds.TS - 273.15)
+    if chunks is not None:
+        assert result.sza.chunks is not None
+    sza, saa = sp.get_sza_saa(time, lat, lon, pres, ds.TS.values - 273.15, ephemeris_resolution=1)
+    np.testing.assert_array_equal(result.sza.values, sza)
+    np.testing.assert_array_equal(result.saa.values, saa)
+    np.testing.assert_array_equal(result.solar_elevation.values, 90 - sza)
+    assert np.isnan(result.saa.values[3])
+    assert result.saa.attrs["standard_name"] == "solar_azimuth_angle"